@@ -1,20 +1,72 @@
-from typing import Union
+from typing import Union, List
+from pydantic import BaseModel
 from config import config
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.datastructures import Headers
 import uvicorn
 import json
 import base64
-import zlib
 from contextlib import asynccontextmanager
-from utils.redis_manager import RedisManager
+from utils.redis_manager import RedisManager, PipelinedWriter
+from utils.wire_format import WireFormat, RAW_CONTENT_TYPE
+from utils.shm_ring import ShmRing
+from utils.ingest import ImageIngest, Upload, UploadTooLarge, UnsupportedImage
+from utils.normalize import ImageNormalizer, CorruptImage
+from utils.result_cache import ResultCache
+from utils.result_store import ResultStore
+from utils.result_events import ResultNotifier
+from utils.admission import AdmissionController
+from utils.tenants import TenantLimiter
+from utils.id_allocator import IdAllocator
+from utils.metrics import REGISTRY
 import logging
 from utils import logging_config
 import asyncio
+import time
+import uuid
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 # logging.basicConfig(level= logging.INFO)
 logger = logging.getLogger(__name__)
+
+# Prometheus metrics of the api server
+REQUEST_SECONDS         = REGISTRY.histogram("app_request_seconds", "Request latency by route", labelnames= ("method", "route", "status"))
+UPLOAD_BYTES            = REGISTRY.histogram("app_upload_bytes", "Size of uploaded images",
+                                             buckets= (1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 5e7))
+NORMALIZE_SECONDS       = REGISTRY.histogram("app_normalize_seconds", "Time to decode, downscale and re-encode one upload")
+ENQUEUED_IMAGE_BYTES    = REGISTRY.histogram("app_enqueued_image_bytes", "Size of the images sent to the backend, after normalization",
+                                             buckets= (1e4, 2.5e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7))
+REDIS_ROUNDTRIP_SECONDS = REGISTRY.histogram("app_redis_roundtrip_seconds", "Redis round-trip time, sampled periodically with PING")
+IMAGES_ENQUEUED         = REGISTRY.counter("app_images_enqueued_total", "Images sent to the backend", labelnames= ("priority",))
+TENANT_REJECTIONS       = REGISTRY.counter("app_tenant_rejections_total", "Images rejected because their tenant was at its in-flight limit")
+QUEUE_DEPTH             = REGISTRY.gauge("app_queue_depth", "Images waiting in the queue, sampled periodically")
+
+
+async def sample_metrics(app: FastAPI):
+    """
+    Sample redis round-trip time and queue depth periodically, so scrapes never touch redis
+    """
+    while True:
+        try:
+            start = time.perf_counter()
+            await app.state.redis_store.ping()
+            REDIS_ROUNDTRIP_SECONDS.observe(time.perf_counter() - start)
+
+            # Admission control already samples the queue depth
+            if app.state.admission:
+                QUEUE_DEPTH.set(app.state.admission.depth)
+            else:
+                QUEUE_DEPTH.set(await RedisManager.queue_depth(app.state.redis_queue))
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as e:
+            logger.error(f"Error while sampling metrics: {str(e)}")
+
+        await asyncio.sleep(config.METRICS['sample_interval_s'])
     
 
 # Context manager to handle startup and shutdown
@@ -26,19 +78,81 @@ async def lifespan(app: FastAPI):
     # Initialize redis connection object
     redis_store= await RedisManager.connect(db=config.REDIS_SERVER['db_store'])
 
+    # Initialize bytes-mode redis connection object for binary image messages
+    redis_queue= await RedisManager.connect(db=config.REDIS_SERVER['db_store'], decode_responses= False)
+
     try:
-        if not redis_store:
+        if not redis_store or not redis_queue:
             raise Exception("Cannot start backend server without a valid redis connection. Please check the connection setting.")
         
-        # Store the redis connection object in the app state to make it accessible globally
+        # Store the redis connection objects in the app state to make them accessible globally
         app.state.redis_store= redis_store
+        app.state.redis_queue= redis_queue
+
+        # Coalesce the enqueues of concurrent requests into MULTI/EXEC pipelines
+        app.state.queue_writer= PipelinedWriter(redis_client= redis_queue, transaction= True) if config.REDIS_PIPELINE['enabled'] else None
+
+        # Image ids are handed out from blocks leased with INCRBY
+        app.state.id_allocator= IdAllocator(redis_client= redis_store)
+
+        # Storage of the prediction results written by the backend
+        app.state.result_store= ResultStore(redis_client= redis_store)
+
+        # Content-hash result cache, shared by all requests of this process
+        app.state.result_cache= ResultCache(redis_client= redis_store) if config.RESULT_CACHE['enabled'] else None
+
+        # Shared-memory ring for images, when the backend runs on the same host
+        app.state.shm_ring= None
+        if config.SHM_TRANSPORT['enabled']:
+            try:
+                app.state.shm_ring= ShmRing(path= config.SHM_TRANSPORT['path'], num_slots= config.SHM_TRANSPORT['num_slots'],
+                                            slot_size= config.SHM_TRANSPORT['slot_size'], lease_s= config.SHM_TRANSPORT['lease_s'], create= True)
+            except Exception as e:
+                logger.error(f"Cannot map the shared-memory ring, sending images inline: {str(e)}")
+
+        # Uploads are downscaled and re-encoded in a thread pool, raw pixels need the metadata of the binary format
+        app.state.normalize_pool= None
+        if config.NORMALIZE['enabled']:
+            if config.NORMALIZE['format'] == "raw" and config.WIRE_FORMAT['format'] != "binary":
+                raise Exception("NORMALIZE_FORMAT=raw needs WIRE_FORMAT=binary")
+            app.state.normalize_pool= ThreadPoolExecutor(max_workers= config.NORMALIZE['workers'], thread_name_prefix= "normalize")
+
+        # Sample the queue depth for admission control
+        app.state.admission= None
+        if config.ADMISSION['enabled']:
+            app.state.admission= AdmissionController(redis_store= redis_store, redis_queue= redis_queue, result_store= app.state.result_store,
+                                                     shm_ring= app.state.shm_ring)
+            app.state.admission.start()
+
+        # In-flight limits of tenant-tagged requests
+        app.state.tenant_limiter= TenantLimiter(redis_client= redis_store)
+
+        # Listen for completion events of requests waiting inline on their prediction
+        app.state.result_notifier= ResultNotifier(redis_client= redis_store)
+        app.state.result_notifier.start()
+
+        # Sample metrics in background
+        metrics_task= asyncio.create_task(sample_metrics(app))
 
         # Yield control back to FastAPI (it will start handling requests now)
         yield
 
         # All cleanup during shutdown
-        # Close the redis connection
+        # Stop the metrics sampler, the result listener and the queue depth sampler
+        metrics_task.cancel()
+        await app.state.result_notifier.stop()
+        if app.state.admission:
+            await app.state.admission.stop()
+
+        # Flush the pipelined writer and close the redis connections
+        if app.state.queue_writer:
+            await app.state.queue_writer.close()
         await RedisManager.close_connection(redis_connection_obj= redis_store)
+        await RedisManager.close_connection(redis_connection_obj= redis_queue)
+        if app.state.shm_ring:
+            app.state.shm_ring.close()
+        if app.state.normalize_pool:
+            app.state.normalize_pool.shutdown(wait= False, cancel_futures= True)
     
     except Exception as e:
         logger.error(f"Server startup failed with error: {e}.")
@@ -48,73 +162,475 @@ async def lifespan(app: FastAPI):
 app = FastAPI(lifespan=lifespan)
 
 
+class RequestMiddleware:
+    """
+    Pure ASGI middleware, outermost so every request is measured, requests rejected here included
+
+    Records the latency of every request, labelled with the route template rather than the raw path, and rejects
+    requests announcing a body above the configured limit before the multipart parser spools it.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            content_length = Headers(scope= scope).get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > config.UPLOAD['max_request_bytes']:
+                response = JSONResponse(content={"error": f"Request body is larger than {config.UPLOAD['max_request_bytes']} bytes"}, status_code=413)
+                await response(scope, receive, send_with_status)
+            else:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method= scope["method"],
+                                    route= route.path if route else "unmatched", status= status)
+
+
+app.add_middleware(RequestMiddleware)
+
+
 @app.get("/")
 async def read_root():
     return {"Hello": "World"}
 
+
+# Tenant tags end up in redis keys and log lines
+TENANT_PATTERN = r"^[A-Za-z0-9_.-]{1,64}$"
+
+
+class BulkStatusRequest(BaseModel):
+    image_ids: List[int]
+
+
+async def enqueue_message(image_id: int, message, priority: str) -> list:
+    """
+    Write the PENDING status of an image and push its message in one MULTI/EXEC round trip, shared with the
+    enqueues of concurrent requests when pipelining is enabled
+
+    :param image_id: Id of the image
+    :param message: Serialized image message
+    :param priority: Priority class of the image
+    :return: Replies of the commands
+    """
+    queue_command = lambda pipe: RedisManager.enqueue(pipe, image_id, message, app.state.result_store, priority= priority)
+    if app.state.queue_writer:
+        return await app.state.queue_writer.execute(queue_command)
+
+    pipe = app.state.redis_queue.pipeline(transaction= True)
+    queue_command(pipe)
+    return await pipe.execute()
+
+
+async def tenant_response(tenant: Union[str, None], count: int = 1) -> Union[JSONResponse, None]:
+    """
+    Reserve in-flight slots of a tenant for images about to be enqueued
+
+    :param tenant: Tenant tag of the request, None for untagged requests which are not limited
+    :param count: Number of images to enqueue
+    :return: A 429 JSON response if the tenant is at its limit, else None
+    """
+    if tenant is None or await app.state.tenant_limiter.acquire(tenant, count):
+        return None
+
+    TENANT_REJECTIONS.inc(count)
+    return JSONResponse(content={"error": f"Too many images in flight for tenant {tenant}, retry later"}, status_code=429,
+                        headers={"Retry-After": "1"})
+
+
+def priority_response(priority: str) -> Union[JSONResponse, None]:
+    """
+    Validate the priority class of a request
+
+    :param priority: Priority class requested
+    :return: A 400 JSON response for an unknown class, else None
+    """
+    if priority in config.PRIORITY['classes']:
+        return None
+    return JSONResponse(content={"error": f"Unknown priority {priority}, expected one of {config.PRIORITY['classes']}"}, status_code=400)
+
+
+def admission_response(count: int = 1) -> Union[JSONResponse, None]:
+    """
+    Check admission control for images about to be enqueued
+
+    :param count: Number of images to enqueue
+    :return: A 429 JSON response if the queue is too deep, else None
+    """
+    if not app.state.admission:
+        return None
+
+    retry_after = app.state.admission.admit(count)
+    if retry_after is None:
+        return None
+
+    logger.warning(msg= f"Image queue above high-water mark, rejecting {count} images for {retry_after}s")
+    return JSONResponse(content={"error": "Too many images queued, retry later"}, status_code=429, headers={"Retry-After": str(retry_after)})
+
+
+async def normalize_upload(upload: Upload) -> tuple:
+    """
+    Downscale and re-encode an upload in the normalization thread pool, when normalization is enabled
+
+    :param upload: Uploaded image as read by ImageIngest
+    :return: Upload to enqueue and metadata it needs in the backend
+    :raises CorruptImage: The upload cannot be decoded
+    """
+    if not app.state.normalize_pool:
+        ENQUEUED_IMAGE_BYTES.observe(upload.length)
+        return upload, {}
+
+    start = time.perf_counter()
+    normalized, shape = await asyncio.get_running_loop().run_in_executor(app.state.normalize_pool, ImageNormalizer.normalize, upload)
+    NORMALIZE_SECONDS.observe(time.perf_counter() - start)
+    ENQUEUED_IMAGE_BYTES.observe(normalized.length)
+    return normalized, ({"shape": list(shape)} if normalized.content_type == RAW_CONTENT_TYPE else {})
+
+
+def serialize_image(image_id: int, upload: Upload, meta: dict = None) -> Union[bytes, memoryview, str]:
+    """
+    Serialize an image to the configured wire format
+
+    :param image_id: Unique id of the image
+    :param upload: Uploaded image as read by ImageIngest
+    :param meta: Metadata for the backend
+    :return: Serialized message ready to be enqueued
+    """
+    if config.WIRE_FORMAT['format'] == "json":
+        # Legacy format, kept while backends are rolled over to the binary envelope
+        message = {
+            'image_id': image_id,
+            'image_data': base64.b64encode(upload.image_bytes).decode("utf-8")
+        }
+        # The backend needs the metadata in both formats, to release the in-flight slot of the tenant among others
+        if meta:
+            message['meta'] = meta
+        return json.dumps(message)
+
+    # Image bytes in shared memory, only a descriptor goes through redis, inline when the ring is full
+    if app.state.shm_ring:
+        descriptor = app.state.shm_ring.put(upload.image_bytes)
+        if descriptor is not None:
+            return WireFormat.encode_shm(image_id= image_id, descriptor= descriptor, content_type= upload.content_type, meta= meta)
+
+    # Uncompressed binary envelope: header written in front of the image bytes, inside the upload buffer
+    if config.WIRE_FORMAT['compression'] == "none":
+        try:
+            return WireFormat.encode_in_place(buffer= upload.buffer, offset= upload.offset, length= upload.length,
+                                              image_id= image_id, content_type= upload.content_type, meta= meta)
+        except ValueError as e:
+            logger.warning(msg= f"Falling back to a copying encode for image with id: {image_id}: {str(e)}")
+
+    # Binary envelope: small fixed header followed by the raw image bytes
+    return WireFormat.encode(image_id= image_id, image_bytes= upload.image_bytes, content_type= upload.content_type,
+                             compression= config.WIRE_FORMAT['compression'], meta= meta)
+
 @app.post("/image_prediction")
-async def get_predictions(file: UploadFile = File(...)) -> JSONResponse:
+async def get_predictions(file: UploadFile = File(...),
+                          wait_ms: int = Query(0, ge=0, le=config.RESULT_EVENTS['max_wait_ms']),
+                          priority: str = Query(config.PRIORITY['default']),
+                          tenant: Union[str, None] = Query(None, pattern=TENANT_PATTERN)) -> JSONResponse:
     """
-    Get the image from the request, compress and decode it and send it for prediction
+    Get the image from the request, wrap it in the binary wire format and send it for prediction
 
     :param file: The image file to send for prediction
+    :param wait_ms: Wait up to this many milliseconds for the prediction and return it inline, 0 returns immediately
+    :param priority: Priority class of the image, the backend schedules every class from its own queue
+    :param tenant: Optional tenant tag, the images of a tenant in flight are limited
     :return: A JSON response with the prediction status
     """
-    # Validate the content 
-    if file.content_type not in config.PERMISSIBLE_CONTENT_TYPES:
-        return JSONResponse(content={"error": "Invalid file type"}, status_code=400)
+    rejected = priority_response(priority)
+    if rejected:
+        return rejected
 
     try:
-        # Read the uploaded image as bytes
-        image_bytes = await file.read()
+        # Read the uploaded image in chunks, validating its size and format from the magic bytes
+        try:
+            upload = await ImageIngest.read(file, with_digest= app.state.result_cache is not None)
+        except UploadTooLarge as e:
+            return JSONResponse(content={"error": str(e)}, status_code=413)
+        except UnsupportedImage:
+            return JSONResponse(content={"error": "Invalid file type"}, status_code=400)
+        UPLOAD_BYTES.observe(upload.length)
 
-        # Compress the image using zlib
-        # compressed_image = zlib.compress(image_bytes)
+        # Return the cached prediction for images that were already classified
+        digest = upload.digest
+        if app.state.result_cache:
+            cached = await app.state.result_cache.get(digest)
+            if cached:
+                logging_config.log_sampled(logger, "Cache hit for image, returning prediction of image with id: %s", cached['image_prediction_id'])
+                return JSONResponse(content={"image_prediction_id": cached["image_prediction_id"], "status": "Done", "has_dog": cached["has_dog"]}, status_code= 200)
 
-        # Encode the compressed image to Base64 string
-        base64_encoded_image = base64.b64encode(image_bytes).decode("utf-8")
+        # Shrink the image to the model input size, rejecting images that cannot be decoded before they are queued
+        try:
+            upload, normalized_meta = await normalize_upload(upload)
+        except CorruptImage:
+            return JSONResponse(content={"error": "Corrupt image"}, status_code=400)
 
-        # Generate unique id for the image
-        image_id = await app.state.redis_store.incr("image_id")
+        # Reject the image if the queue is too deep, or its tenant has too many images in flight
+        rejected = admission_response() or await tenant_response(tenant)
+        if rejected:
+            return rejected
 
-        # Create a dictionary with the image and ID
-        message = {
-            'image_id': image_id,
-            'image_data': base64_encoded_image
-        }
+        serialized_data, result_future = None, None
+        try:
+            # Take a unique id for the image, from the block leased by this worker
+            image_id = (await app.state.id_allocator.allocate())[0]
 
-        # Serialize the dictionary to a JSON string
-        serialized_data= json.dumps(message)
-    
-        # send image for prediction
-        logger.info(msg= f"Sending image with id: {image_id} for prediction...")
-        await app.state.redis_store.rpush(config.REDIS_SERVER['data_queue'], serialized_data)
+            # Metadata for the backend: content hash to fill the cache, completion event for inline waits, trace id for the latency trace
+            meta = {"enqueued_at": time.time(), "priority": priority, **normalized_meta}
+            if config.TRACING['enabled']:
+                meta["trace_id"] = uuid.uuid4().hex
+            if digest:
+                meta["digest"] = digest
+            if wait_ms > 0:
+                meta["notify"] = True
+            if tenant:
+                meta["tenant"] = tenant
+
+            serialized_data= serialize_image(image_id= image_id, upload= upload, meta= meta)
+
+            # Subscribe to the result before enqueueing, so a fast completion cannot be missed
+            result_future = app.state.result_notifier.register(image_id) if wait_ms > 0 else None
+
+            # send image for prediction
+            logging_config.log_sampled(logger, "Sending image with id: %s for prediction...", image_id)
+            await enqueue_message(image_id, serialized_data, priority)
+        except Exception:
+            # The image never reached the queue, free its shared-memory slot and the in-flight slot of its tenant
+            if result_future:
+                app.state.result_notifier.discard(image_id)
+            if app.state.shm_ring and serialized_data is not None:
+                app.state.shm_ring.release_message(serialized_data)
+            if tenant:
+                await app.state.tenant_limiter.release(app.state.redis_store, tenant)
+            raise
+        IMAGES_ENQUEUED.inc(priority= priority)
+
+        try:
+            # Return the prediction inline if it arrives before the deadline
+            if result_future:
+                try:
+                    result = await asyncio.wait_for(result_future, timeout= wait_ms / 1000)
+                    return JSONResponse(content=result, status_code= 200)
+                except asyncio.TimeoutError:
+                    logging_config.log_sampled(logger, "Prediction for image with id: %s not ready after %s ms", image_id, wait_ms)
+        finally:
+            if result_future:
+                app.state.result_notifier.discard(image_id)
 
         # Return the response
-        return JSONResponse(content={"image_prediction_id": 1, "status": "PENDING", "has_dog": None}, status_code= 200)
+        return JSONResponse(content={"image_prediction_id": image_id, "status": "PENDING", "has_dog": None}, status_code= 200)
 
     except Exception as e:
         return JSONResponse(content={"error": f"Error while trying to read the image as : {str(e)}"}, status_code=500)
     
 
+@app.post("/image_predictions")
+async def get_bulk_predictions(files: List[UploadFile] = File(...),
+                               priority: str = Query(config.PRIORITY['bulk']),
+                               tenant: Union[str, None] = Query(None, pattern=TENANT_PATTERN)) -> JSONResponse:
+    """
+    Send many images for prediction in one request, ids come from the leased block of this worker
+    and all images are enqueued in one MULTI/EXEC round trip
+
+    :param files: The image files to send for prediction
+    :param priority: Priority class of the images, bulk by default so they do not hold up single-image requests
+    :param tenant: Optional tenant tag, the images of a tenant in flight are limited
+    :return: A JSON response with the prediction status of every file, in upload order
+    """
+    # Validate the request
+    rejected = priority_response(priority)
+    if rejected:
+        return rejected
+    if len(files) > config.BULK['max_files']:
+        return JSONResponse(content={"error": f"At most {config.BULK['max_files']} files are accepted per request"}, status_code=400)
+
+    try:
+        # Read the uploaded images in chunks, validating their size and format from the magic bytes
+        uploads, names, invalid_files, large_files = [], [], [], []
+        for file in files:
+            try:
+                uploads.append(await ImageIngest.read(file, with_digest= app.state.result_cache is not None))
+                names.append(file.filename)
+            except UploadTooLarge:
+                large_files.append(file.filename)
+            except UnsupportedImage:
+                invalid_files.append(file.filename)
+        if large_files:
+            return JSONResponse(content={"error": f"Images larger than {config.UPLOAD['max_bytes']} bytes", "files": large_files}, status_code=413)
+        if invalid_files:
+            return JSONResponse(content={"error": "Invalid file type", "files": invalid_files}, status_code=400)
+
+        for upload in uploads:
+            UPLOAD_BYTES.observe(upload.length)
+        predictions = [None] * len(files)
+
+        # Look up all images in the result cache in one round trip
+        digests = [upload.digest for upload in uploads]
+        if app.state.result_cache:
+            for index, cached in enumerate(await app.state.result_cache.get_many(digests)):
+                if cached:
+                    predictions[index] = {"image_prediction_id": cached["image_prediction_id"], "status": "Done", "has_dog": cached["has_dog"]}
+
+        # Take ids for the cache misses, at most one round trip when the leased block runs out
+        pending = [index for index, prediction in enumerate(predictions) if prediction is None]
+        if pending:
+            # Shrink the images in parallel, rejecting the request if any of them cannot be decoded
+            normalized = await asyncio.gather(*[normalize_upload(uploads[index]) for index in pending], return_exceptions= True)
+            corrupt_files = [names[index] for index, result in zip(pending, normalized) if isinstance(result, CorruptImage)]
+            if corrupt_files:
+                return JSONResponse(content={"error": "Corrupt image", "files": corrupt_files}, status_code=400)
+            for result in normalized:
+                if isinstance(result, Exception):
+                    raise result
+            normalized_meta = {}
+            for index, (upload, extra_meta) in zip(pending, normalized):
+                uploads[index], normalized_meta[index] = upload, extra_meta
+
+            # Reject the whole request if the queue is too deep, or its tenant has too many images in flight
+            rejected = admission_response(len(pending)) or await tenant_response(tenant, len(pending))
+            if rejected:
+                return rejected
+
+            messages = []
+            try:
+                image_ids = await app.state.id_allocator.allocate(len(pending))
+
+                # Write the PENDING statuses and enqueue all images in one transaction
+                pipe = app.state.redis_queue.pipeline(transaction= True)
+                enqueued_at = time.time()
+                for image_id, index in zip(image_ids, pending):
+                    meta = {"enqueued_at": enqueued_at, "priority": priority, **normalized_meta[index]}
+                    if config.TRACING['enabled']:
+                        meta["trace_id"] = uuid.uuid4().hex
+                    if digests[index]:
+                        meta["digest"] = digests[index]
+                    if tenant:
+                        meta["tenant"] = tenant
+                    messages.append(serialize_image(image_id= image_id, upload= uploads[index], meta= meta))
+                    RedisManager.enqueue(pipe, image_id, messages[-1], app.state.result_store, priority= priority)
+                    predictions[index] = {"image_prediction_id": image_id, "status": "PENDING", "has_dog": None}
+
+                logging_config.log_sampled(logger, "Sending %s images with ids: %s-%s for prediction...", len(pending), image_ids[0], image_ids[-1])
+                await pipe.execute()
+            except Exception:
+                # None of the images reached the queue, free their shared-memory slots and the in-flight slots of the tenant
+                if app.state.shm_ring:
+                    for message in messages:
+                        app.state.shm_ring.release_message(message)
+                if tenant:
+                    await app.state.tenant_limiter.release(app.state.redis_store, tenant, len(pending))
+                raise
+            IMAGES_ENQUEUED.inc(len(pending), priority= priority)
+
+        return JSONResponse(content={"predictions": predictions}, status_code= 200)
+
+    except Exception as e:
+        return JSONResponse(content={"error": f"Error while trying to read the images as : {str(e)}"}, status_code=500)
+
+
+@app.post("/image_predictions/status")
+async def get_bulk_prediction_status(request: BulkStatusRequest) -> JSONResponse:
+    """
+    Get the prediction status of many images in one pipelined read
+
+    :param request: The IDs of the images to get the prediction status for
+    :return: A JSON response with the prediction status of every ID, in request order
+    """
+    if len(request.image_ids) > config.BULK['max_ids']:
+        return JSONResponse(content={"error": f"At most {config.BULK['max_ids']} ids are accepted per request"}, status_code=400)
+
+    try:
+        # Get all prediction statuses from the Redis store in one round trip
+        results = await app.state.result_store.read_many(request.image_ids)
+        logging_config.log_sampled(logger, "Getting prediction status for %s images", len(request.image_ids))
+
+        predictions = [result if result else {"image_prediction_id": image_id, "error": "Prediction status not found"}
+                       for image_id, result in zip(request.image_ids, results)]
+        return JSONResponse(content={"predictions": predictions}, status_code=200)
+
+    except Exception as e:
+        return JSONResponse(content={"error": f"Error while trying to get the prediction status: {str(e)}"}, status_code=500)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Metrics in the Prometheus text format
+    """
+    return PlainTextResponse(content= REGISTRY.render(), media_type= "text/plain; version=0.0.4")
+
+
+@app.get("/queue/stats")
+async def get_queue_stats():
+    """
+    Get the last sampled queue depth and backend drain rate used for admission control
+
+    :return: A JSON response with the queue state
+    """
+    if not app.state.admission:
+        return JSONResponse(content={"enabled": False}, status_code=200)
+    return JSONResponse(content={"enabled": True, **app.state.admission.stats()}, status_code=200)
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Get the hit/miss counters of the result cache of this process
+
+    :return: A JSON response with the cache counters
+    """
+    if not app.state.result_cache:
+        return JSONResponse(content={"enabled": False}, status_code=200)
+    return JSONResponse(content={"enabled": True, **app.state.result_cache.stats()}, status_code=200)
+
+
+@app.get("/shm/stats")
+async def get_shm_stats():
+    """
+    Get the slot usage of the shared-memory image ring
+
+    :return: A JSON response with the ring state
+    """
+    if not app.state.shm_ring:
+        return JSONResponse(content={"enabled": False}, status_code=200)
+    return JSONResponse(content={"enabled": True, **app.state.shm_ring.stats()}, status_code=200)
+
+
 @app.get("/image_prediction/{image_id}")
-async def get_prediction(image_id: int):
+async def get_prediction(image_id: int, debug: bool = Query(False)):
     """
     Get the prediction status of the image with the given ID
 
     :param image_id: The ID of the image to get the prediction status for
+    :param debug: Add the latency trace of the image: trace id, time waiting in the queue and decode, inference and
+                  write durations in the backend, null until the backend has written it
     :return: A JSON response with the prediction status
     """
     # Get the prediction status from the Redis store
     try:
         # Get the prediction status from the Redis store
-        hash_data = await app.state.redis_store.hgetall(image_id)
-        logger.info(msg= f"Getting prediction status for image with id: {image_id}")
+        result = await app.state.result_store.read(image_id, with_trace= debug)
+        logging_config.log_sampled(logger, "Getting prediction status for image with id: %s", image_id)
 
         # Check if the prediction status is available
-        if hash_data:
+        if result:
             # Return the prediction status
-            return JSONResponse(content=hash_data, status_code=200)
+            return JSONResponse(content=result, status_code=200)
         else:
             # Return a 404 response if the prediction status is not available
             return JSONResponse(content={"error": "Prediction status not found"}, status_code=404)
@@ -123,4 +639,5 @@ async def get_prediction(image_id: int):
         return JSONResponse(content={"error": f"Error while trying to get the prediction status: {str(e)}"}, status_code=500)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host= config.API_SERVER['host'], port= config.API_SERVER['port'])
\ No newline at end of file
+    # Keep the logging setup of utils.logging_config, so server and access logs go through the same handlers
+    uvicorn.run(app, host= config.API_SERVER['host'], port= config.API_SERVER['port'], log_config= None)
\ No newline at end of file
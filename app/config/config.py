@@ -17,8 +17,149 @@ REDIS_SERVER = {
     "host"  : os.getenv("REDIS_HOST", "localhost"),
     "port"  : int(os.getenv("REDIS_PORT", 6379)),
     "db_store"    : 0,
-    "data_queue"  : "image_queue"
+    "data_queue"  : "image_queue",
+    "transport"   : os.getenv("QUEUE_TRANSPORT", "list"),    # "list" (RPUSH) or "stream" (XADD)
+    "processed_counter": "stats:processed"                   # Images processed by all backend workers, gives the drain rate
 }
 
-# Allowed Content Types
-PERMISSIBLE_CONTENT_TYPES = ["image/jpeg", "image/png", "image/gif", "image/bmp", "image/tiff"]
\ No newline at end of file
+# Connection pools, sized explicitly and shared by all requests of this process
+REDIS_POOL = {
+    "max_connections"       : int(os.getenv("REDIS_MAX_CONNECTIONS", 64)),   # Per client, requests wait for a free connection above it
+    "pool_timeout_s"        : 5,          # How long a command waits for a free connection
+    "socket_timeout_s"      : 5,
+    "socket_connect_timeout_s": 2,
+    "health_check_interval_s" : 15,       # Idle connections are checked with PING before reuse
+    "retry_attempts"        : 3,          # Retries of a command on connection errors, with exponential backoff
+    "backoff_base_s"        : 0.05,
+    "backoff_cap_s"         : 2,
+    "connect_attempts"      : 10          # Attempts to reach redis at startup, with the same backoff
+}
+
+# Commands of concurrent requests are coalesced into pipelines, flushed when full or after a short delay
+REDIS_PIPELINE = {
+    "enabled"     : os.getenv("REDIS_PIPELINE_ENABLED", "true").lower() == "true",
+    "max_commands": 128,
+    "max_delay_ms": 1
+}
+
+# Image ids are leased from redis in blocks and handed out locally, so most uploads need no round trip for their id
+IMAGE_IDS = {
+    "counter"   : "image_id",
+    "block_size": int(os.getenv("ID_BLOCK_SIZE", 64))       # Ids per INCRBY, 1 leases every id on its own
+}
+
+# Priority classes, every class has its own queue (list or stream), highest priority first
+PRIORITY = {
+    "classes": ["interactive", "bulk"],      # The first class keeps the base queue name, the others get a ":<class>" suffix
+    "default": "interactive",                # Class of POST /image_prediction without a priority
+    "bulk"   : "bulk"                        # Class of POST /image_predictions without a priority
+}
+
+# Per-tenant limit of images queued or being processed, for requests tagged with a tenant
+TENANTS = {
+    "max_in_flight": int(os.getenv("TENANT_MAX_IN_FLIGHT", 1000)),
+    "key_prefix"   : "inflight:",            # Counter per tenant, incremented by the app and decremented by the backend
+    "ttl_s"        : 3600                    # Counters of idle tenants expire, so a lost decrement cannot block a tenant for good
+}
+
+# Redis Streams transport, used when REDIS_SERVER['transport'] is "stream"
+REDIS_STREAM = {
+    "stream_name": "image_stream",
+    "consumer_group": "backend_workers",
+    "maxlen"     : int(os.getenv("STREAM_MAXLEN", 100000))   # Approximate cap on stream length, oldest entries are trimmed
+}
+
+# Storage of prediction results
+RESULT_STORE = {
+    "key_prefix" : "prediction:",
+    "ttl_s"      : int(os.getenv("RESULT_TTL_S", 7 * 24 * 3600)),
+    "encoding"   : os.getenv("RESULT_ENCODING", "hash"),   # "hash" per image or "bucketed" (ids // bucket_size share a small hash)
+    "bucket_size": 100                                     # Below hash-max-listpack-entries (128), so buckets stay listpack encoded
+}
+
+# Content-hash result cache for duplicate uploads
+RESULT_CACHE = {
+    "enabled"    : os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true",
+    "key_prefix" : "result_cache:",
+    "index_key"  : "result_cache:index",     # Sorted set of cached digests, bounds the cache size
+    "ttl_s"      : int(os.getenv("RESULT_CACHE_TTL_S", 86400)),
+    "max_entries": int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 100000))
+}
+
+# Completion events for requests waiting inline on their prediction
+RESULT_EVENTS = {
+    "channel_prefix": "prediction_done",
+    "num_shards"    : 16,        # Results are published on channel_prefix:{image_id % num_shards}
+    "max_wait_ms"   : 10000      # Upper bound of the wait_ms request parameter
+}
+
+# Admission control on the image queue
+ADMISSION = {
+    "enabled"          : os.getenv("ADMISSION_ENABLED", "true").lower() == "true",
+    "high_water"       : int(os.getenv("QUEUE_HIGH_WATER", 10000)),   # Queue depth above which the policy kicks in
+    "policy"           : os.getenv("ADMISSION_POLICY", "reject"),     # "reject" with 429 or "drop_oldest" queued images
+    "sample_interval_s": 0.5,                                         # How often queue depth and drain rate are sampled
+    "max_retry_after_s": 60
+}
+
+# Metrics exposed on /metrics
+METRICS = {
+    "sample_interval_s": 5     # How often queue depth and redis round-trip time are sampled
+}
+
+# Logging, handlers run on a listener thread in "queue" mode so console and file writes never block the event loop
+LOGGING = {
+    "mode"       : os.getenv("LOG_MODE", "queue"),                    # "queue" or "sync" (handlers called inline)
+    "queue_size" : int(os.getenv("LOG_QUEUE_SIZE", 10000)),           # Records waiting for the listener, more are dropped
+    "level"      : os.getenv("LOG_LEVEL", "INFO"),
+    "json"       : os.getenv("LOG_JSON", "false").lower() == "true",  # One JSON object per line instead of plain text
+    "file_path"  : os.getenv("LOG_FILE", "log/app.log"),              # Empty to log to the console only
+    "truncate"   : os.getenv("LOG_TRUNCATE", "false").lower() == "true",    # Clear the log file when the server starts
+    "sample_rate": float(os.getenv("LOG_SAMPLE_RATE", 0.01))          # Share of per-image messages logged at INFO, the rest are DEBUG
+}
+
+# Latency tracing, every message carries a trace id and the backend stores the stage durations next to the result
+TRACING = {
+    "enabled": os.getenv("TRACING_ENABLED", "true").lower() == "true"    # GET /image_prediction/{id}?debug=1 returns the trace
+}
+
+# Limits of the bulk endpoints
+BULK = {
+    "max_files": int(os.getenv("BULK_MAX_FILES", 100)),    # Files per POST /image_predictions
+    "max_ids"  : int(os.getenv("BULK_MAX_IDS", 1000))      # Ids per POST /image_predictions/status
+}
+
+# Limits of uploaded images
+UPLOAD = {
+    "max_bytes"        : int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024)),          # Per image, larger uploads get a 413
+    "max_request_bytes": int(os.getenv("MAX_REQUEST_BYTES", 200 * 1024 * 1024)),        # Per request, checked on Content-Length before parsing
+    "chunk_size"       : 256 * 1024                                                     # Size of a single read from the spooled upload
+}
+
+# Downscaling and re-encoding of uploads before they are enqueued, the backend then decodes small images only
+NORMALIZE = {
+    "enabled"     : os.getenv("NORMALIZE_IMAGES", "false").lower() == "true",
+    "short_edge"  : int(os.getenv("NORMALIZE_SHORT_EDGE", 320)),      # Model input size of the backend
+    "format"      : os.getenv("NORMALIZE_FORMAT", "jpeg"),            # "jpeg", "png" or "raw" (uint8 pixels, needs the binary wire format)
+    "jpeg_quality": int(os.getenv("NORMALIZE_JPEG_QUALITY", 90)),
+    "workers"     : int(os.getenv("NORMALIZE_WORKERS", 4))            # Threads decoding and encoding images, off the event loop
+}
+
+# Allowed Content Types, checked against the magic bytes of the upload
+PERMISSIBLE_CONTENT_TYPES = ["image/jpeg", "image/png", "image/gif", "image/bmp", "image/tiff"]
+
+# Shared-memory handoff of images when the app and the backend run on one host, only a slot descriptor goes through redis
+SHM_TRANSPORT = {
+    "enabled"  : os.getenv("SHM_TRANSPORT", "false").lower() == "true",
+    "path"     : os.getenv("SHM_RING_PATH", "/shm/images.ring"),          # On a tmpfs mounted in both containers
+    "num_slots": int(os.getenv("SHM_NUM_SLOTS", 128)),                    # Set by the app when it creates the file
+    "slot_size": int(os.getenv("SHM_SLOT_SIZE", 2 * 1024 * 1024)),        # Larger images, and all images once the ring is full, are sent inline
+    "lease_s"  : 300                                                      # Slots never released (dropped message, crashed backend) are reclaimed after it
+}
+
+# Wire format used for images sent to the backend
+WIRE_FORMAT = {
+    "format"     : os.getenv("WIRE_FORMAT", "binary"),        # "binary" envelope or legacy "json" (base64 in JSON), both carry the metadata,
+                                                              # e.g. the notify flag that inline waits (wait_ms) depend on
+    "compression": os.getenv("WIRE_COMPRESSION", "none")      # "none", "zlib" or "lz4" (binary format only)
+}
@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from config import config
+from utils.admission import AdmissionController
+from utils.redis_manager import RedisManager
+from utils.result_store import ResultStore
+from utils.wire_format import WireFormat
+
+
+def controller(policy: str = "reject", high_water: int = 10, depth: int = 0, drain_rate: float = 0.0) -> AdmissionController:
+    """
+    Admission controller with a sampled queue state, admit never touches redis
+    """
+    admission = AdmissionController(redis_store= None, redis_queue= None, result_store= None, high_water= high_water, policy= policy)
+    admission.depth = depth
+    admission.drain_rate = drain_rate
+    return admission
+
+
+def test_reject_at_the_high_water_mark():
+    admission = controller(depth= 8, drain_rate= 2.0)
+
+    assert admission.admit(2) is None
+    # The admitted images count towards the depth until the next sample
+    assert admission.admit(1) == 1
+    assert admission.admit(5) == 3
+
+
+def test_retry_after_is_capped():
+    assert controller(depth= 10).admit() == config.ADMISSION['max_retry_after_s']
+    assert controller(depth= 10_000, drain_rate= 1.0).admit() == config.ADMISSION['max_retry_after_s']
+
+
+def test_drop_oldest_always_admits():
+    admission = controller(policy= "drop_oldest", depth= 50)
+
+    assert admission.admit(5) is None
+    assert admission.enqueued_since_sample == 5
+
+
+def test_oversized_request_is_admitted_once_the_queue_is_empty():
+    assert controller(depth= 0).admit(25) is None
+
+    # While the queue is not empty it has to drain completely, not only below the high-water mark
+    assert controller(depth= 4, drain_rate= 2.0).admit(25) == 2
+
+
+def test_unsupported_policy():
+    with pytest.raises(ValueError):
+        controller(policy= "drop_newest")
+
+
+def test_shed_drops_the_oldest_images(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    monkeypatch.setitem(config.REDIS_SERVER, "transport", "list")
+
+    async def run():
+        server = fakeredis.FakeServer()
+        redis_store = fakeredis.aioredis.FakeRedis(server= server, decode_responses= True)
+        redis_queue = fakeredis.aioredis.FakeRedis(server= server)
+        result_store = ResultStore(redis_client= redis_store)
+
+        queue_key = RedisManager.queue_key()
+        for image_id in range(1, 5):
+            await redis_queue.rpush(queue_key, WireFormat.encode(image_id= image_id, image_bytes= b"image", content_type= "image/jpeg",
+                                                                 meta= {"tenant": "acme"}))
+        await redis_store.set(config.TENANTS['key_prefix'] + "acme", 4)
+
+        admission = AdmissionController(redis_store= redis_store, redis_queue= redis_queue, result_store= result_store,
+                                        high_water= 2, policy= "drop_oldest")
+        await admission.sample()
+        assert admission.depth == 4
+        await admission.shed(admission.depth - admission.high_water)
+
+        remaining = [WireFormat.decode(message).image_id for message in await redis_queue.lrange(queue_key, 0, -1)]
+        statuses = [(await result_store.read(image_id) or {}).get("status") for image_id in range(1, 5)]
+        return remaining, statuses, await redis_store.get(config.TENANTS['key_prefix'] + "acme"), admission.depth
+
+    remaining, statuses, inflight, depth = asyncio.run(run())
+    assert remaining == [3, 4]
+    assert statuses == ["Dropped", "Dropped", None, None]
+    assert inflight == "2"
+    assert depth == 2
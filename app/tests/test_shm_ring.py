@@ -0,0 +1,105 @@
+import time
+import pytest
+from config import config
+from utils.ingest import Upload
+from utils.shm_ring import ShmRing
+from utils.wire_format import HEADROOM, WireFormat
+
+IMAGE = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def ring(tmp_path):
+    ring = ShmRing(path= str(tmp_path / "ring"), num_slots= 2, slot_size= 4096, lease_s= 60, create= True)
+    yield ring
+    ring.close()
+
+
+def test_put_view_release(ring):
+    descriptor = ring.put(IMAGE)
+
+    with ring.view(descriptor) as view:
+        assert bytes(view) == IMAGE
+    assert ring.stats()["slots_in_use"] == 1
+    assert ring.release(descriptor)
+    assert ring.stats()["slots_in_use"] == 0
+
+    # A second release of the same reference is refused
+    assert not ring.release(descriptor)
+
+
+def test_attached_ring_sees_the_slots(ring):
+    descriptor = ring.put(IMAGE)
+
+    # The backend attaches to the file created by the app and reads its geometry from it
+    attached = ShmRing(path= ring.path, lease_s= 60)
+    try:
+        assert (attached.num_slots, attached.slot_size) == (ring.num_slots, ring.slot_size)
+        with attached.view(descriptor) as view:
+            assert bytes(view) == IMAGE
+        assert attached.release(descriptor)
+    finally:
+        attached.close()
+    assert ring.stats()["slots_in_use"] == 0
+
+
+def test_full_ring_and_large_images_are_refused(ring):
+    assert ring.put(b"x" * (ring.slot_size + 1)) is None
+
+    first, second = ring.put(IMAGE), ring.put(IMAGE)
+    assert first.slot != second.slot
+    assert ring.put(IMAGE) is None
+    assert ring.stats()["full"] == 1
+
+    # A released slot is taken again, with a new generation
+    ring.release(first)
+    third = ring.put(IMAGE)
+    assert third.slot == first.slot
+    assert third.generation != first.generation
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    ring = ShmRing(path= str(tmp_path / "ring"), num_slots= 1, slot_size= 4096, lease_s= 0.05, create= True)
+    try:
+        stale = ring.put(IMAGE)
+        assert ring.put(IMAGE) is None
+
+        # The reference of a message that was never consumed expires and the slot is reused
+        time.sleep(0.1)
+        fresh = ring.put(b"new image")
+        assert fresh.slot == stale.slot
+        assert ring.stats()["reclaimed"] == 1
+
+        # Readers and releases of the old descriptor notice the slot changed hands
+        with pytest.raises(ValueError, match= "reclaimed"):
+            ring.view(stale)
+        assert not ring.release(stale)
+        assert ring.release(fresh)
+    finally:
+        ring.close()
+
+
+def test_release_message(ring):
+    descriptor = ring.put(IMAGE)
+
+    assert ring.release_message(WireFormat.encode_shm(image_id= 1, descriptor= descriptor, content_type= "image/jpeg"))
+    assert not ring.release_message(WireFormat.encode(image_id= 2, image_bytes= IMAGE, content_type= "image/jpeg"))
+    assert ring.stats()["slots_in_use"] == 0
+
+
+def test_serialize_falls_back_to_inline_when_ring_is_full(ring, monkeypatch):
+    import app as app_module
+    monkeypatch.setitem(config.WIRE_FORMAT, "format", "binary")
+    monkeypatch.setattr(app_module.app.state, "shm_ring", ring, raising= False)
+
+    buffer = bytearray(HEADROOM + len(IMAGE))
+    buffer[HEADROOM:] = IMAGE
+    upload = Upload(buffer= buffer, offset= HEADROOM, length= len(IMAGE), content_type= "image/jpeg", digest= None)
+
+    messages = [WireFormat.decode(app_module.serialize_image(image_id= image_id, upload= upload, meta= {"priority": "bulk"}))
+                for image_id in range(ring.num_slots + 1)]
+
+    assert all(message.shm is not None for message in messages[:-1])
+    assert messages[-1].shm is None
+    assert bytes(messages[-1].image_bytes) == IMAGE
+    assert messages[-1].meta == {"priority": "bulk"}
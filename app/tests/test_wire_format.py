@@ -0,0 +1,82 @@
+import json
+import base64
+import pytest
+from utils.wire_format import HEADER, HEADROOM, MAGIC, ShmDescriptor, WireFormat
+
+IMAGE = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 4
+META  = {"priority": "bulk", "tenant": "acme", "notify": True}
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib"])
+def test_encode_decode_round_trip(compression):
+    message = WireFormat.encode(image_id= 42, image_bytes= IMAGE, content_type= "image/jpeg", compression= compression, meta= META)
+
+    decoded = WireFormat.decode(message)
+    assert decoded.image_id == 42
+    assert decoded.content_type == "image/jpeg"
+    assert bytes(decoded.image_bytes) == IMAGE
+    assert decoded.meta == META
+    assert decoded.shm is None
+
+
+def test_encode_in_place_round_trip():
+    buffer = bytearray(HEADROOM + len(IMAGE))
+    buffer[HEADROOM:] = IMAGE
+
+    message = WireFormat.encode_in_place(buffer= buffer, offset= HEADROOM, length= len(IMAGE), image_id= 7, content_type= "image/png", meta= META)
+
+    decoded = WireFormat.decode(message)
+    assert (decoded.image_id, decoded.content_type, bytes(decoded.image_bytes), decoded.meta) == (7, "image/png", IMAGE, META)
+
+
+def test_encode_in_place_without_headroom():
+    with pytest.raises(ValueError):
+        WireFormat.encode_in_place(buffer= bytearray(IMAGE), offset= 0, length= len(IMAGE), image_id= 7, content_type= "image/png")
+
+
+def test_encode_shm_round_trip():
+    descriptor = ShmDescriptor(slot= 3, generation= 9, offset= 8192, length= len(IMAGE))
+
+    decoded = WireFormat.decode(WireFormat.encode_shm(image_id= 5, descriptor= descriptor, content_type= "image/jpeg", meta= META))
+    assert decoded.shm == descriptor
+    assert decoded.meta == META
+    assert decoded.image_bytes == b""
+
+
+@pytest.mark.parametrize("meta", [META, None])
+def test_decode_legacy_json(meta):
+    message = {"image_id": 11, "image_data": base64.b64encode(IMAGE).decode("utf-8")}
+    if meta:
+        message["meta"] = meta
+
+    decoded = WireFormat.decode(json.dumps(message))
+    assert decoded.image_id == 11
+    assert bytes(decoded.image_bytes) == IMAGE
+    assert decoded.meta == (meta or {})
+    assert not WireFormat.is_binary(json.dumps(message))
+
+
+def test_decode_rejects_bad_magic():
+    message = bytearray(WireFormat.encode(image_id= 1, image_bytes= IMAGE, content_type= "image/jpeg"))
+    message[:len(MAGIC)] = b"XX"
+
+    # Without the magic the message is taken for a legacy JSON message, which it is not either
+    assert not WireFormat.is_binary(bytes(message))
+    with pytest.raises(ValueError):
+        WireFormat.decode(bytes(message))
+
+
+def test_decode_rejects_bad_version():
+    message = bytearray(WireFormat.encode(image_id= 1, image_bytes= IMAGE, content_type= "image/jpeg"))
+    message[len(MAGIC)] = 99
+
+    with pytest.raises(ValueError, match= "version"):
+        WireFormat.decode(bytes(message))
+
+
+@pytest.mark.parametrize("length", [HEADER.size - 1, HEADER.size + 10])
+def test_decode_rejects_truncated_message(length):
+    message = WireFormat.encode(image_id= 1, image_bytes= IMAGE, content_type= "image/jpeg")
+
+    with pytest.raises(ValueError, match= "Truncated"):
+        WireFormat.decode(message[:length])
@@ -0,0 +1,181 @@
+import math
+import time
+import asyncio
+from config import config as cfg
+from utils.wire_format import WireFormat
+from utils.redis_manager import RedisManager
+from utils import logging_config
+import logging
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class AdmissionController:
+    """
+    Admission control on the image queue based on a periodically sampled queue depth
+
+    Parameters:
+        redis_store: Redis connection object, replies decoded to str
+        redis_queue: Bytes-mode redis connection object used for the image messages
+        result_store: Result store the dropped images are marked in
+        high_water: Queue depth above which new images are rejected (or the oldest ones dropped)
+        policy: "reject" answers 429 above the high-water mark, "drop_oldest" sheds the oldest queued images instead
+        shm_ring: Shared-memory ring the slots of dropped images are released in, None when images are sent inline
+    """
+    def __init__(self, redis_store, redis_queue, result_store, high_water: int = cfg.ADMISSION['high_water'], policy: str = cfg.ADMISSION['policy'],
+                 shm_ring= None):
+        if policy not in ("reject", "drop_oldest"):
+            raise ValueError(f"Unsupported admission policy: {policy}")
+
+        self.redis_store = redis_store
+        self.redis_queue = redis_queue
+        self.result_store= result_store
+        self.high_water  = high_water
+        self.policy      = policy
+        self.shm_ring    = shm_ring
+
+        # Last sampled state, depth is kept up to date locally between samples
+        self.depth = 0
+        self.depths = {}
+        self.drain_rate = 0.0
+        self.enqueued_since_sample = 0
+        self._last_processed = None
+        self._last_sample_at = None
+        self.sampler_task = None
+
+    def start(self):
+        """
+        Start sampling the queue depth in background
+        """
+        self.sampler_task = asyncio.create_task(self._sample_loop())
+
+    async def stop(self):
+        """
+        Stop sampling the queue depth
+        """
+        if self.sampler_task:
+            self.sampler_task.cancel()
+            try:
+                await self.sampler_task
+            except asyncio.CancelledError:
+                logger.info("Queue depth sampler was cancelled.")
+
+    def admit(self, count: int = 1):
+        """
+        Decide whether images can be enqueued, no redis call is made
+
+        :param count: Number of images to enqueue
+        :return: None if admitted, else the number of seconds the client should wait before retrying
+        """
+        depth = self.depth + self.enqueued_since_sample
+
+        # More images than the high-water mark can never fit below it, they are admitted once the queue is empty
+        oversized = count > self.high_water
+        if self.policy == "drop_oldest" or depth + count <= self.high_water or (oversized and depth == 0):
+            self.enqueued_since_sample += count
+            return None
+
+        # Time until the backend drains the queue back below the high-water mark, or empties it for oversized requests
+        if self.drain_rate <= 0:
+            return cfg.ADMISSION['max_retry_after_s']
+        excess = depth if oversized else depth + count - self.high_water
+        retry_after = math.ceil(excess / self.drain_rate)
+        return min(max(retry_after, 1), cfg.ADMISSION['max_retry_after_s'])
+
+    def stats(self) -> dict:
+        """
+        Get the last sampled queue state
+        """
+        return {"depth": self.depth, "depths": self.depths, "drain_rate": round(self.drain_rate, 3), "high_water": self.high_water, "policy": self.policy}
+
+    async def _sample_loop(self):
+        while True:
+            try:
+                await self.sample()
+                if self.policy == "drop_oldest" and self.depth > self.high_water:
+                    await self.shed(self.depth - self.high_water)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error while sampling the queue depth: {str(e)}")
+            await asyncio.sleep(cfg.ADMISSION['sample_interval_s'])
+
+    async def sample(self):
+        """
+        Sample the queue depth and the backend drain rate in one round trip
+        """
+        pipe = self.redis_store.pipeline(transaction= False)
+        for priority in cfg.PRIORITY['classes']:
+            if cfg.REDIS_SERVER['transport'] == "stream":
+                pipe.xinfo_groups(RedisManager.queue_key(priority))
+            else:
+                pipe.llen(RedisManager.queue_key(priority))
+        pipe.get(cfg.REDIS_SERVER['processed_counter'])
+        *queue_infos, processed = await pipe.execute(raise_on_error= False)
+
+        # Streams do not exist until the first image or backend worker creates them
+        self.depths = {}
+        for priority, queue_info in zip(cfg.PRIORITY['classes'], queue_infos):
+            if isinstance(queue_info, Exception):
+                queue_info = [] if cfg.REDIS_SERVER['transport'] == "stream" else 0
+            self.depths[priority] = RedisManager.stream_depth(queue_info) if cfg.REDIS_SERVER['transport'] == "stream" else queue_info
+
+        now = time.monotonic()
+        processed = int(processed or 0)
+        self.depth = sum(self.depths.values())
+        self.enqueued_since_sample = 0
+
+        # Exponentially weighted drain rate of all backend workers, in images per second
+        if self._last_processed is not None and now > self._last_sample_at:
+            rate = max(processed - self._last_processed, 0) / (now - self._last_sample_at)
+            self.drain_rate = 0.7 * self.drain_rate + 0.3 * rate
+        self._last_processed = processed
+        self._last_sample_at = now
+
+    async def shed(self, count: int):
+        """
+        Drop the oldest queued images, lowest priority class first, and mark them as dropped so clients polling them get an answer
+
+        :param count: Number of images to drop
+        """
+        messages = []
+        for priority in reversed(cfg.PRIORITY['classes']):
+            if len(messages) >= count:
+                break
+            queue_key = RedisManager.queue_key(priority)
+            if cfg.REDIS_SERVER['transport'] == "stream":
+                messages.extend(await self._shed_stream(queue_key, count - len(messages)))
+            else:
+                messages.extend(await self.redis_queue.lpop(queue_key, count= count - len(messages)) or [])
+
+        pipe = self.redis_store.pipeline(transaction= False)
+        for message in messages:
+            decoded = WireFormat.decode(message)
+            self.result_store.write(pipe, decoded.image_id, status= "Dropped")
+            if decoded.meta.get("tenant"):
+                pipe.decr(cfg.TENANTS['key_prefix'] + decoded.meta["tenant"])
+            if decoded.shm and self.shm_ring:
+                self.shm_ring.release(decoded.shm)
+        await pipe.execute()
+
+        self.depth -= len(messages)
+        logger.warning(f"Queue above high-water mark, dropped the {len(messages)} oldest images")
+
+    async def _shed_stream(self, stream_name: str, count: int) -> list:
+        """
+        Delete the oldest entries of a stream the consumer group has not read yet
+        """
+        try:
+            groups = await self.redis_store.xinfo_groups(stream_name)
+        except Exception:
+            # The stream does not exist yet
+            return []
+        group = next((group for group in groups if group["name"] == cfg.REDIS_STREAM['consumer_group']), None)
+        if group is None:
+            return []
+
+        entries = await self.redis_queue.xrange(stream_name, min= "(" + group["last-delivered-id"], count= count)
+        if entries:
+            await self.redis_queue.xdel(stream_name, *[entry_id for entry_id, _ in entries])
+        return [fields[b"data"] for _, fields in entries]
@@ -0,0 +1,130 @@
+import hashlib
+from typing import NamedTuple, Union
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from config import config as cfg
+from utils.wire_format import HEADROOM
+
+# Leading bytes of the accepted image formats, the declared content type of an upload is not trusted
+MAGIC_BYTES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+]
+SNIFF_BYTES = max(len(magic) for magic, _ in MAGIC_BYTES)
+
+
+class UploadTooLarge(Exception):
+    """
+    The upload is larger than the configured maximum size
+    """
+
+
+class UnsupportedImage(Exception):
+    """
+    The upload does not start with the magic bytes of an accepted image format
+    """
+
+
+class Upload(NamedTuple):
+    buffer: bytearray        # Image bytes at buffer[offset:offset + length], headroom in front for the wire header
+    offset: int
+    length: int
+    content_type: str
+    digest: Union[str, None]
+
+    @property
+    def image_bytes(self) -> memoryview:
+        """
+        View of the image bytes, without copying them
+        """
+        return memoryview(self.buffer)[self.offset:self.offset + self.length]
+
+
+class ImageIngest:
+    """
+    Read uploaded images in chunks into a buffer that becomes the outgoing queue message
+    """
+    @staticmethod
+    def sniff(head: bytes) -> Union[str, None]:
+        """
+        Detect the image format from the first bytes of a file
+
+        :param head: At least the first SNIFF_BYTES bytes of the file
+        :return: Mime type of the image, None if the format is not accepted
+        """
+        for magic, content_type in MAGIC_BYTES:
+            if head.startswith(magic):
+                return content_type if content_type in cfg.PERMISSIBLE_CONTENT_TYPES else None
+        return None
+
+    @staticmethod
+    async def _readinto(file: UploadFile, view: memoryview) -> int:
+        """
+        Read from the spooled upload straight into the buffer, off the event loop once it was rolled to disk
+        """
+        if not getattr(file.file, "_rolled", True):
+            return file.file.readinto(view)
+        return await run_in_threadpool(file.file.readinto, view)
+
+    @staticmethod
+    async def read(file: UploadFile, max_bytes: int = cfg.UPLOAD['max_bytes'], chunk_size: int = cfg.UPLOAD['chunk_size'],
+                   with_digest: bool = True) -> Upload:
+        """
+        Read an uploaded image in chunks, validating its format and size on the way
+
+        :param file: The uploaded file
+        :param max_bytes: Maximum accepted size of the image
+        :param chunk_size: Size of a single read
+        :param with_digest: Hash the content incrementally while reading, for the result cache
+        :return: The image bytes in a buffer with headroom for the wire header
+        """
+        # Reject early when the multipart parser already knows the size
+        if file.size is not None and file.size > max_bytes:
+            raise UploadTooLarge(f"Image is larger than {max_bytes} bytes")
+
+        # Allocate the message buffer once when the size is known, grow it chunk by chunk otherwise
+        buffer = bytearray(HEADROOM + (file.size if file.size is not None else chunk_size))
+        hasher = hashlib.blake2b(digest_size= 16) if with_digest else None
+        length = 0
+        content_type = None
+
+        await file.seek(0)
+        while True:
+            end = HEADROOM + length
+            if end == len(buffer):
+                # A single byte past the announced size is enough to detect a lying upload, unsized ones grow chunk by chunk
+                grow = 1 if length == file.size else chunk_size
+                buffer.extend(bytes(min(grow, max_bytes + 1 - length)))
+
+            # The view is released before the buffer may grow again
+            with memoryview(buffer)[end:min(end + chunk_size, len(buffer))] as view:
+                read = await ImageIngest._readinto(file, view)
+                if not read:
+                    break
+
+                if length + read > max_bytes:
+                    raise UploadTooLarge(f"Image is larger than {max_bytes} bytes")
+
+                # Validate the format as soon as the first bytes are in
+                if content_type is None and length + read >= SNIFF_BYTES:
+                    content_type = ImageIngest.sniff(bytes(buffer[HEADROOM:HEADROOM + SNIFF_BYTES]))
+                    if content_type is None:
+                        raise UnsupportedImage("File is not a supported image format")
+
+                if hasher:
+                    hasher.update(view[:read])
+                length += read
+
+        # Files shorter than the longest magic number are sniffed once fully read
+        if content_type is None:
+            content_type = ImageIngest.sniff(bytes(buffer[HEADROOM:HEADROOM + length]))
+            if content_type is None:
+                raise UnsupportedImage("File is not a supported image format")
+
+        return Upload(buffer= buffer, offset= HEADROOM, length= length, content_type= content_type,
+                      digest= hasher.hexdigest() if hasher else None)
@@ -0,0 +1,128 @@
+import struct
+from typing import Union
+import cv2
+import numpy as np
+from config import config as cfg
+from utils.ingest import Upload
+from utils.wire_format import HEADROOM, RAW_CONTENT_TYPE
+
+# JPEG start-of-frame markers, the frame header holds the image size
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xDA)}
+
+# Reduced-resolution JPEG decodes, the DCT is scaled down by the decoder instead of resizing all pixels
+REDUCED_DECODE_FLAGS = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)]
+
+# Encoders of the normalized images
+ENCODINGS = {"jpeg": (".jpg", "image/jpeg"), "png": (".png", "image/png")}
+
+
+class CorruptImage(Exception):
+    """
+    The upload has the magic bytes of an image but cannot be decoded
+    """
+
+
+class ImageNormalizer:
+    """
+    Shrink uploaded images to the model input size before they are enqueued, so redis and the backend
+    only ever handle the pixels the model looks at
+    """
+    @staticmethod
+    def jpeg_size(data) -> Union[tuple, None]:
+        """
+        Read the size of a JPEG image from its frame header, without decoding it
+
+        :param data: JPEG bytes
+        :return: (width, height), None if no frame header was found
+        """
+        index = 2
+        while index + 4 <= len(data):
+            if data[index] != 0xFF:
+                return None
+            marker = data[index + 1]
+
+            # Fill bytes before a marker, and markers without a segment
+            if marker == 0xFF:
+                index += 1
+                continue
+            if marker in JPEG_STANDALONE_MARKERS:
+                index += 2
+                continue
+
+            if marker in JPEG_SOF_MARKERS:
+                if index + 9 > len(data):
+                    return None
+                height, width = struct.unpack_from(">HH", data, index + 5)
+                return width, height
+            index += 2 + struct.unpack_from(">H", data, index + 2)[0]
+        return None
+
+    @staticmethod
+    def decode(image_bytes, content_type: str, short_edge: int) -> np.ndarray:
+        """
+        Decode an image, at a reduced resolution for JPEGs much larger than the target size
+
+        :param image_bytes: Encoded image
+        :param content_type: Mime type sniffed from the magic bytes
+        :param short_edge: Target size of the shorter side
+        :return: BGR image, its shorter side at least short_edge unless the image is smaller
+        """
+        flags = cv2.IMREAD_COLOR
+        size = ImageNormalizer.jpeg_size(image_bytes) if content_type == "image/jpeg" else None
+        if size:
+            for factor, reduced_flags in REDUCED_DECODE_FLAGS:
+                if min(size) // factor >= short_edge:
+                    flags = reduced_flags
+                    break
+
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flags)
+        if image is None or image.size == 0:
+            raise CorruptImage(f"Cannot decode {content_type} image")
+        return image
+
+    @staticmethod
+    def normalize(upload: Upload, short_edge: int = cfg.NORMALIZE['short_edge'], output_format: str = cfg.NORMALIZE['format'],
+                  jpeg_quality: int = cfg.NORMALIZE['jpeg_quality']) -> tuple:
+        """
+        Downscale an upload so its shorter side is short_edge and re-encode it, runs in the normalization thread pool
+
+        JPEG and PNG images already at most short_edge are only validated and sent as uploaded.
+
+        :param upload: Uploaded image as read by ImageIngest
+        :param short_edge: Target size of the shorter side, the model input size of the backend
+        :param output_format: "jpeg", "png" or "raw" (uint8 BGR pixels, the backend skips decoding)
+        :param jpeg_quality: Quality of re-encoded JPEG images
+        :return: Normalized upload and shape (height, width, channels) of the normalized image
+        """
+        if output_format not in (*ENCODINGS, "raw"):
+            raise ValueError(f"Unsupported normalization format: {output_format}")
+
+        image = ImageNormalizer.decode(upload.image_bytes, upload.content_type, short_edge)
+        height, width = image.shape[:2]
+
+        # Small enough already, nothing to gain from re-encoding
+        scale = short_edge / min(height, width)
+        if scale >= 1 and output_format != "raw" and upload.content_type in ("image/jpeg", "image/png"):
+            return upload, image.shape
+
+        # Same resize as the backend, which then has nothing left to shrink
+        if scale < 1:
+            image = cv2.resize(image, (max(short_edge, round(width * scale)), max(short_edge, round(height * scale))), interpolation= cv2.INTER_AREA)
+
+        if output_format == "raw":
+            content_type, payload = RAW_CONTENT_TYPE, np.ascontiguousarray(image).reshape(-1)
+        else:
+            extension, content_type = ENCODINGS[output_format]
+            params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality] if output_format == "jpeg" else []
+            ok, encoded = cv2.imencode(extension, image, params)
+            if not ok:
+                raise CorruptImage(f"Cannot encode the normalized image as {output_format}")
+            payload = encoded.reshape(-1)
+
+        # Keep the headroom in front, so the wire header can still be written in place
+        buffer = bytearray(HEADROOM + payload.nbytes)
+        buffer[HEADROOM:] = payload.data
+        return Upload(buffer= buffer, offset= HEADROOM, length= payload.nbytes, content_type= content_type, digest= upload.digest), image.shape
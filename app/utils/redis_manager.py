@@ -1,6 +1,10 @@
 import redis
 from config import config as cfg
 import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from redis.utils import HIREDIS_AVAILABLE
 import asyncio
 import sys
 from utils import logging_config
@@ -12,16 +16,41 @@ logger = logging.getLogger(__name__)
 class RedisManager:
 
     @staticmethod
-    async def connect(db:int):
+    def retry_policy() -> Retry:
+        """
+        Retry policy of commands failing on connection errors, with exponential backoff
+        """
+        return Retry(backoff= ExponentialBackoff(cap= cfg.REDIS_POOL['backoff_cap_s'], base= cfg.REDIS_POOL['backoff_base_s']),
+                     retries= cfg.REDIS_POOL['retry_attempts'])
+
+    @staticmethod
+    async def connect(db:int, decode_responses: bool = True, max_connections: int = cfg.REDIS_POOL['max_connections']):
+        """
+        Connect to the redis server with an explicitly sized connection pool
+
+        :param db: Redis database number
+        :param decode_responses: Decode replies to str, use False for a bytes-mode connection carrying binary payloads
+        :param max_connections: Size of the connection pool, commands wait for a free connection above it
+        """
         try:
-            # Connect to redis server
-            logger.info(msg= f"Setting up redis server with db: {db}...")
-            redis_storage = await redis.from_url(cfg.REDIS_SERVER['client'] + ":" + "//" + cfg.REDIS_SERVER['host'] + ":" + str(cfg.REDIS_SERVER['port']) + "/" + str(db), decode_responses= True)
+            # Connect to redis server, replies are parsed by hiredis when it is installed
+            logger.info(msg= f"Setting up redis server with db: {db}, pool size: {max_connections}, hiredis parser: {HIREDIS_AVAILABLE}...")
+            pool = redis.BlockingConnectionPool(host= cfg.REDIS_SERVER['host'], port= cfg.REDIS_SERVER['port'], db= db,
+                                                decode_responses= decode_responses,
+                                                max_connections= max_connections,
+                                                timeout= cfg.REDIS_POOL['pool_timeout_s'],
+                                                socket_timeout= cfg.REDIS_POOL['socket_timeout_s'],
+                                                socket_connect_timeout= cfg.REDIS_POOL['socket_connect_timeout_s'],
+                                                socket_keepalive= True,
+                                                health_check_interval= cfg.REDIS_POOL['health_check_interval_s'],
+                                                retry= RedisManager.retry_policy(),
+                                                retry_on_error= [RedisConnectionError, RedisTimeoutError])
+            redis_storage = redis.Redis.from_pool(pool)
             logging.info(msg= f"Successfully created redis server object for db: {db}.")
 
-            # Check for redis successful connection 
+            # Check for redis successful connection, redis may still be starting up
             logger.info(msg=f"Checking connection status...")
-            await redis_storage.ping()
+            await RedisManager.wait_until_reachable(redis_storage)
            
             # Return connection object
             logger.info(msg= f"Connection successful. Returning redis connection object...")
@@ -31,6 +60,25 @@ class RedisManager:
             logging.error(msg=f"Cannot create redis connection object, exiting with error: {e}")
             return None
 
+    @staticmethod
+    async def wait_until_reachable(redis_client, attempts: int = cfg.REDIS_POOL['connect_attempts']):
+        """
+        Ping redis until it answers, sleeping with exponential backoff between attempts without blocking the event loop
+
+        :param redis_client: Redis connection object
+        :param attempts: Number of pings before giving up
+        """
+        backoff = ExponentialBackoff(cap= cfg.REDIS_POOL['backoff_cap_s'], base= cfg.REDIS_POOL['backoff_base_s'])
+        for attempt in range(1, attempts + 1):
+            try:
+                return await redis_client.ping()
+            except (RedisConnectionError, RedisTimeoutError, OSError) as e:
+                if attempt == attempts:
+                    raise
+                delay = backoff.compute(attempt)
+                logger.warning(msg= f"Redis not reachable (attempt {attempt}/{attempts}): {e}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
     @staticmethod
     async def close_connection(redis_connection_obj):
         try:
@@ -42,4 +90,174 @@ class RedisManager:
             # logger.info(msg="Successfully closed redis connection for queue.")
 
         except Exception as e:
-            logger.info(msg=f"Couldn't close redis connection with error: {e}")
\ No newline at end of file
+            logger.info(msg=f"Couldn't close redis connection with error: {e}")
+
+    @staticmethod
+    def queue_key(priority: str = None) -> str:
+        """
+        Queue (list or stream, depending on the transport) of a priority class, the first class keeps the base name
+
+        :param priority: Priority class, None for the default class
+        """
+        base = cfg.REDIS_STREAM['stream_name'] if cfg.REDIS_SERVER['transport'] == "stream" else cfg.REDIS_SERVER['data_queue']
+        priority = priority or cfg.PRIORITY['default']
+        return base if priority == cfg.PRIORITY['classes'][0] else f"{base}:{priority}"
+
+    @staticmethod
+    def push_message(redis_client, message, priority: str = None):
+        """
+        Push a message on the image queue of a priority class using the configured transport
+
+        :param redis_client: Redis connection object or pipeline
+        :param message: Serialized image message
+        :param priority: Priority class, None for the default class
+        :return: Awaitable for a connection object, the pipeline itself for a pipeline
+        """
+        if cfg.REDIS_SERVER['transport'] == "stream":
+            # Approximate trimming keeps XADD O(1) while bounding the stream length
+            return redis_client.xadd(RedisManager.queue_key(priority), {"data": message},
+                                     maxlen= cfg.REDIS_STREAM['maxlen'], approximate= True)
+
+        return redis_client.rpush(RedisManager.queue_key(priority), message)
+
+    @staticmethod
+    def enqueue(pipe, image_id: int, message, result_store, priority: str = None):
+        """
+        Queue the commands sending an image for prediction on a pipeline: its PENDING status and its message
+
+        Run on a transactional pipeline both are applied together, a status is never written for an image that is not
+        queued and a polling client never sees an unknown id for an image that is.
+
+        :param pipe: Redis pipeline, transactional for an atomic enqueue
+        :param image_id: Id of the image
+        :param message: Serialized image message
+        :param result_store: Storage of the prediction results
+        :param priority: Priority class, None for the default class
+        """
+        result_store.write(pipe, image_id, status= "PENDING")
+        RedisManager.push_message(pipe, message, priority= priority)
+
+    @staticmethod
+    async def queue_depth(redis_connection_obj) -> int:
+        """
+        Number of images waiting in the queues of all priority classes, for streams the consumer group lag plus its pending entries
+
+        :param redis_connection_obj: Redis connection object
+        """
+        pipe = redis_connection_obj.pipeline(transaction= False)
+        for priority in cfg.PRIORITY['classes']:
+            if cfg.REDIS_SERVER['transport'] == "stream":
+                pipe.xinfo_groups(RedisManager.queue_key(priority))
+            else:
+                pipe.llen(RedisManager.queue_key(priority))
+        replies = await pipe.execute(raise_on_error= False)
+
+        # Streams do not exist until the first image or backend worker creates them
+        return sum(RedisManager.stream_depth(reply) if cfg.REDIS_SERVER['transport'] == "stream" else reply
+                   for reply in replies if not isinstance(reply, Exception))
+
+    @staticmethod
+    def stream_depth(groups: list) -> int:
+        """
+        Backlog of the consumer group of a stream: entries not delivered yet plus entries delivered but not acknowledged
+
+        :param groups: Reply of XINFO GROUPS
+        """
+        for group in groups:
+            name = group["name"].decode("utf-8") if isinstance(group["name"], bytes) else group["name"]
+            if name == cfg.REDIS_STREAM['consumer_group']:
+                return (group.get("lag") or 0) + group["pending"]
+        return 0
+
+class PipelinedWriter:
+    """
+    Coalesce commands of concurrent requests into pipelines, flushed when max_commands are queued or
+    max_delay_ms after the first one, so a burst of requests costs a few round trips instead of one each
+
+    Parameters:
+        redis_client: Redis connection object the pipelines are created from
+        max_commands: Flush as soon as this many commands are queued
+        max_delay_ms: Flush at the latest this long after the first queued command
+        transaction: Wrap every pipeline in MULTI/EXEC, so the commands of a caller are applied together
+    """
+    def __init__(self, redis_client, max_commands: int = cfg.REDIS_PIPELINE['max_commands'], max_delay_ms: float = cfg.REDIS_PIPELINE['max_delay_ms'],
+                 transaction: bool = False):
+        self.redis_client = redis_client
+        self.max_commands = max_commands
+        self.max_delay_s  = max_delay_ms / 1000
+        self.transaction  = transaction
+
+        # Commands waiting for the next flush, with the futures of their callers
+        self.pending = []
+        self.flush_handle = None
+        self.flush_tasks = set()
+
+    async def execute(self, queue_command):
+        """
+        Queue commands on the next pipeline and wait for their replies
+
+        :param queue_command: Callable queueing commands on the pipeline passed to it, e.g. lambda pipe: pipe.incr("key")
+        :return: Reply of the command, list of the replies if it queued several
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((queue_command, future))
+
+        if len(self.pending) >= self.max_commands:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.max_delay_s, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """
+        Send the queued commands in one pipeline, in background
+        """
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.pending:
+            return
+
+        commands, self.pending = self.pending, []
+        task = asyncio.create_task(self._execute(commands))
+        self.flush_tasks.add(task)
+        task.add_done_callback(self.flush_tasks.discard)
+
+    async def _execute(self, commands):
+        """
+        Execute a pipeline and hand every reply, or error, to its caller
+        """
+        try:
+            # Remember which replies belong to which caller
+            pipe = self.redis_client.pipeline(transaction= self.transaction)
+            bounds = []
+            for queue_command, _ in commands:
+                start = len(pipe)
+                queue_command(pipe)
+                bounds.append((start, len(pipe)))
+            replies = await pipe.execute(raise_on_error= False)
+
+        except Exception as e:
+            for _, future in commands:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), (start, end) in zip(commands, bounds):
+            if future.done():
+                continue
+            caller_replies = replies[start:end]
+            errors = [reply for reply in caller_replies if isinstance(reply, Exception)]
+            if errors:
+                future.set_exception(errors[0])
+            else:
+                future.set_result(caller_replies[0] if len(caller_replies) == 1 else caller_replies)
+
+    async def close(self):
+        """
+        Flush the queued commands and wait for the pipelines in flight
+        """
+        self._flush()
+        if self.flush_tasks:
+            await asyncio.gather(*self.flush_tasks, return_exceptions= True)
@@ -0,0 +1,102 @@
+import json
+import asyncio
+from config import config as cfg
+from utils import logging_config
+import logging
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class ResultEvents:
+    """
+    Completion events published by the backend for clients waiting inline on a prediction
+    """
+    @staticmethod
+    def channel(image_id: int) -> str:
+        """
+        Pub/sub channel of an image, ids are spread over a fixed number of sharded channels
+        """
+        return f"{cfg.RESULT_EVENTS['channel_prefix']}:{int(image_id) % cfg.RESULT_EVENTS['num_shards']}"
+
+
+class ResultNotifier:
+    """
+    Single pub/sub listener per app process that resolves the futures of requests waiting on a result
+
+    Parameters:
+        redis_client: Redis connection object, replies must be decoded to str
+    """
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.waiters = {}
+        self.listener_task = None
+
+    def start(self):
+        """
+        Start listening to all result channels in background
+        """
+        self.listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        """
+        Stop the listener and release all waiting requests
+        """
+        if self.listener_task:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                logger.info("Result listener was cancelled.")
+
+        for future in self.waiters.values():
+            future.cancel()
+        self.waiters.clear()
+
+    def register(self, image_id: int) -> asyncio.Future:
+        """
+        Register interest in the result of an image, must happen before the image is enqueued
+
+        :param image_id: Id of the image
+        :return: Future resolved with the result of the image
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[int(image_id)] = future
+        return future
+
+    def discard(self, image_id: int):
+        """
+        Forget a waiting request once it returned
+        """
+        self.waiters.pop(int(image_id), None)
+
+    async def _listen(self):
+        channels = [f"{cfg.RESULT_EVENTS['channel_prefix']}:{shard}" for shard in range(cfg.RESULT_EVENTS['num_shards'])]
+
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages= True)
+            try:
+                await pubsub.subscribe(*channels)
+                logger.info(f"Listening for prediction results on {len(channels)} channels...")
+
+                while True:
+                    message = await pubsub.get_message(timeout= None)
+                    if message is None:
+                        continue
+
+                    # Resolve the waiting request, results of ids nobody waits for are ignored
+                    result = json.loads(message["data"])
+                    future = self.waiters.get(int(result["image_prediction_id"]))
+                    if future and not future.done():
+                        future.set_result(result)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as e:
+                # Resubscribe after connection errors, requests fall back to polling meanwhile
+                logger.error(f"Result listener failed with error: {e}, resubscribing...")
+                await asyncio.sleep(1)
+
+            finally:
+                await pubsub.aclose()
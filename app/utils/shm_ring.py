@@ -0,0 +1,193 @@
+import os
+import mmap
+import time
+import fcntl
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Union
+from utils.wire_format import ShmDescriptor, WireFormat
+
+"""
+Ring of fixed-size image slots in a memory-mapped file on a tmpfs shared by the app and the backend
+
+Layout (little endian):
+    file header: magic (4s) | version (B) | num slots (I) | slot size (I) | cursor (I), padded to 64 bytes
+    slot table:  refcount (I) | generation (I) | length (I) | leased at (d) per slot
+    slot data:   num slots * slot size bytes, starting on a page boundary
+
+The app allocates a slot with a reference held by the queued message, copies the image into it and only sends a
+descriptor through redis. The backend decodes straight from the mapping and releases the reference, freeing the slot.
+Slots whose reference was never released (message dropped, consumer crashed) are reclaimed after a lease timeout.
+Every allocation bumps the generation of the slot, so a descriptor of a reclaimed slot is detected instead of read.
+Slot table updates are serialized with a file lock across processes and a thread lock within a process.
+"""
+MAGIC       = b"FHRG"
+VERSION     = 1
+FILE_HEADER = struct.Struct("<4sB3xIII")
+SLOT_ENTRY  = struct.Struct("<IIIxxxxd")
+HEADER_SIZE = 64
+CURSOR_OFFSET = FILE_HEADER.size - 4     # Slot the next allocation starts looking from
+
+
+class ShmRing:
+    """
+    Shared-memory ring of image slots
+
+    Parameters:
+        path: Memory-mapped file, on a tmpfs shared by both services
+        num_slots: Number of slots, used when the file is created
+        slot_size: Size of a slot in bytes, larger images are sent inline
+        lease_s: Time after which a slot that was never released is reclaimed
+        create: Create the file if it does not exist, the app creates it and the backend attaches to it
+    """
+    def __init__(self, path: str, num_slots: int = 128, slot_size: int = 2 * 1024 * 1024, lease_s: float = 300, create: bool = False):
+        self.path    = path
+        self.lease_s = lease_s
+
+        # Reclamation counters of this process
+        self.reclaimed = 0
+        self.full      = 0
+
+        if create:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok= True)
+        self.fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0), 0o660)
+        self.thread_lock = threading.Lock()
+
+        with self._locked():
+            # Initialize a new file, an existing one keeps its geometry so processes attached to it agree on it
+            if create and os.fstat(self.fd).st_size == 0:
+                data_offset = ShmRing._data_offset(num_slots)
+                os.ftruncate(self.fd, data_offset + num_slots * slot_size)
+                os.pwrite(self.fd, FILE_HEADER.pack(MAGIC, VERSION, num_slots, slot_size, 0), 0)
+
+            magic, version, self.num_slots, self.slot_size, _ = FILE_HEADER.unpack(os.pread(self.fd, FILE_HEADER.size, 0))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a shared-memory image ring")
+
+        self.data_offset = ShmRing._data_offset(self.num_slots)
+        self.mm = mmap.mmap(self.fd, self.data_offset + self.num_slots * self.slot_size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    @staticmethod
+    def _data_offset(num_slots: int) -> int:
+        table_end = HEADER_SIZE + num_slots * SLOT_ENTRY.size
+        return -(-table_end // mmap.PAGESIZE) * mmap.PAGESIZE
+
+    @contextmanager
+    def _locked(self):
+        """
+        Exclusive access to the slot table, across threads of this process and across processes
+        """
+        with self.thread_lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _entry(self, slot: int) -> tuple:
+        return SLOT_ENTRY.unpack_from(self.mm, HEADER_SIZE + slot * SLOT_ENTRY.size)
+
+    def _set_entry(self, slot: int, refcount: int, generation: int, length: int, leased_at: float):
+        SLOT_ENTRY.pack_into(self.mm, HEADER_SIZE + slot * SLOT_ENTRY.size, refcount, generation, length, leased_at)
+
+    def allocate(self, length: int) -> Union[ShmDescriptor, None]:
+        """
+        Take the next free slot of the ring, with one reference held by the message about to be queued
+
+        :param length: Number of bytes to store
+        :return: Descriptor of the slot, None if the image does not fit in a slot or every slot is in use
+        """
+        if length > self.slot_size:
+            return None
+
+        now = time.time()
+        with self._locked():
+            cursor = struct.unpack_from("<I", self.mm, CURSOR_OFFSET)[0]
+            for step in range(self.num_slots):
+                slot = (cursor + step) % self.num_slots
+                refcount, generation, _, leased_at = self._entry(slot)
+
+                # Free slot, or a lease that expired because the reference was never released
+                if refcount and now - leased_at < self.lease_s:
+                    continue
+                if refcount:
+                    self.reclaimed += 1
+
+                generation = (generation + 1) & 0xFFFFFFFF
+                self._set_entry(slot, 1, generation, length, now)
+                struct.pack_into("<I", self.mm, CURSOR_OFFSET, (slot + 1) % self.num_slots)
+                return ShmDescriptor(slot= slot, generation= generation, offset= self.data_offset + slot * self.slot_size, length= length)
+
+        self.full += 1
+        return None
+
+    def put(self, data) -> Union[ShmDescriptor, None]:
+        """
+        Copy bytes into a newly allocated slot
+
+        :param data: Bytes-like object to store
+        :return: Descriptor of the slot, None if the bytes must be sent inline
+        """
+        descriptor = self.allocate(len(data))
+        if descriptor is not None:
+            self.mm[descriptor.offset:descriptor.offset + descriptor.length] = data
+        return descriptor
+
+    def view(self, descriptor: ShmDescriptor) -> memoryview:
+        """
+        Zero-copy view of the bytes of a slot, valid until the slot is released
+
+        :param descriptor: Descriptor received in a message
+        :return: View into the mapping
+        """
+        refcount, generation, length, _ = self._entry(descriptor.slot)
+        if not refcount or generation != descriptor.generation or length != descriptor.length:
+            raise ValueError(f"Shared-memory slot {descriptor.slot} was reclaimed (generation {generation}, expected {descriptor.generation})")
+        return memoryview(self.mm)[descriptor.offset:descriptor.offset + descriptor.length]
+
+    def release(self, descriptor: ShmDescriptor) -> bool:
+        """
+        Drop a reference to a slot, the slot is free again once no reference is left
+
+        :param descriptor: Descriptor of the slot
+        :return: False if the slot was already reclaimed for another image
+        """
+        with self._locked():
+            refcount, generation, length, leased_at = self._entry(descriptor.slot)
+            if not refcount or generation != descriptor.generation:
+                return False
+            self._set_entry(descriptor.slot, refcount - 1, generation, length, leased_at)
+            return True
+
+    def release_message(self, message) -> bool:
+        """
+        Release the slot referenced by a queue message that will never be consumed, e.g. a failed push or a dropped image
+
+        :param message: Serialized image message
+        :return: True if the message referenced a slot that was released
+        """
+        if not WireFormat.is_binary(message):
+            return False
+        descriptor = WireFormat.decode(message).shm
+        return self.release(descriptor) if descriptor else False
+
+    def stats(self) -> dict:
+        """
+        Slot usage of the ring and reclamation counters of this process
+        """
+        with self._locked():
+            in_use = sum(1 for slot in range(self.num_slots) if self._entry(slot)[0])
+        return {"num_slots": self.num_slots, "slot_size": self.slot_size, "slots_in_use": in_use,
+                "reclaimed": self.reclaimed, "full": self.full}
+
+    def close(self):
+        """
+        Unmap the file, views still held by the caller keep the mapping alive until they are released
+        """
+        try:
+            self.mm.close()
+        except BufferError:
+            pass
+        os.close(self.fd)
+
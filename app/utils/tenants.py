@@ -0,0 +1,58 @@
+from config import config as cfg
+from utils import logging_config
+import logging
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class TenantLimiter:
+    """
+    Per-tenant limit of images queued or being processed, so one client cannot fill the queue on its own
+
+    The app increments the counter of a tenant before enqueueing its images and the backend decrements it once their
+    results are written. Counters expire when a tenant is idle, so a decrement lost to a crash cannot block it for good.
+
+    Parameters:
+        redis_client: Redis connection object
+        max_in_flight: Maximum number of in-flight images per tenant
+        key_prefix: Prefix of the counter keys
+        ttl_s: Time to live of a counter, refreshed on every increment
+    """
+    def __init__(self, redis_client, max_in_flight: int = cfg.TENANTS['max_in_flight'], key_prefix: str = cfg.TENANTS['key_prefix'],
+                 ttl_s: int = cfg.TENANTS['ttl_s']):
+        self.redis_client  = redis_client
+        self.max_in_flight = max_in_flight
+        self.key_prefix    = key_prefix
+        self.ttl_s         = ttl_s
+
+    async def acquire(self, tenant: str, count: int = 1) -> bool:
+        """
+        Reserve in-flight slots for images of a tenant
+
+        :param tenant: Tenant tag of the request
+        :param count: Number of images to enqueue
+        :return: False, with nothing reserved, if the tenant would go above its limit
+        """
+        key = self.key_prefix + tenant
+        pipe = self.redis_client.pipeline(transaction= False)
+        pipe.incrby(key, count)
+        pipe.expire(key, self.ttl_s)
+        in_flight, _ = await pipe.execute()
+
+        if in_flight > self.max_in_flight:
+            await self.redis_client.decrby(key, count)
+            logger.warning(msg= f"Tenant {tenant} above its in-flight limit of {self.max_in_flight}, rejecting {count} images")
+            return False
+        return True
+
+    def release(self, redis_client, tenant: str, count: int = 1):
+        """
+        Give back in-flight slots of images that were not enqueued after all
+
+        :param redis_client: Redis connection object or pipeline
+        :param tenant: Tenant tag of the request
+        :param count: Number of images
+        :return: Awaitable for a connection object, the pipeline itself for a pipeline
+        """
+        return redis_client.decrby(self.key_prefix + tenant, count)
@@ -0,0 +1,332 @@
+"""
+Offline bulk scoring of images on disk, straight through the model without the HTTP api and redis
+
+Images are streamed from a directory (walked in sorted order), a file list (one path per line, - for stdin) or a
+tar archive (read as a stream, optionally compressed), decoded and resized in a thread or process pool and
+classified in batches with the serving model, and the cascade when it is enabled. Results are appended to a JSONL
+or CSV file in source order, and a checkpoint next to it records how many images are done and where the output
+ends, so a restarted run drops the results written after the checkpoint and continues from there.
+
+Usage (from the backend directory):
+    python bulk_score.py --source /data/images --output results.jsonl
+    python bulk_score.py --source images.tar.gz --output results.csv --batch-size 32 --decoder process --workers 8
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import logging
+import multiprocessing as mp
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from config import config
+from utils.preprocess import ImagePreprocessor
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Files of directories and tar archives that are scored, file lists are taken as they are
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+# Columns of the output
+OUTPUT_FIELDS = ("image", "has_dog", "error")
+
+
+def detect_source_type(source: str) -> str:
+    """
+    Tell a directory, a tar archive and a file list apart
+    """
+    if source == "-":
+        return "list"
+    if os.path.isdir(source):
+        return "dir"
+    if tarfile.is_tarfile(source):
+        return "tar"
+    return "list"
+
+
+def walk_directory(directory: str):
+    """
+    Yield the image files below a directory, in sorted order
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def read_file_list(path: str):
+    """
+    Yield the paths of a file list, one per line, - reads the list from stdin
+    """
+    with (nullcontext(sys.stdin) if path == "-" else open(path)) as file_list:
+        for line in file_list:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def iter_source(source: str, source_type: str, skip: int = 0):
+    """
+    Stream the images of a source in a stable order, so a run can be resumed by position
+
+    Files of directories and lists are read by the decode workers, only tar members are read here,
+    as an archive stream can only be read in order.
+
+    :param source: Directory, file list or tar archive
+    :param source_type: "dir", "list" or "tar"
+    :param skip: Number of leading images to skip, the ones done before the checkpoint
+    :return: Generator of (name, path, image bytes), path is None for tar members and image bytes None for files
+    """
+    index = 0
+    if source_type == "tar":
+        with tarfile.open(source, mode= "r|*") as archive:
+            for member in archive:
+                if not member.isfile() or not member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                index += 1
+                if index > skip:
+                    yield member.name, None, archive.extractfile(member).read()
+        return
+
+    paths = walk_directory(source) if source_type == "dir" else read_file_list(source)
+    for path in paths:
+        index += 1
+        if index > skip:
+            yield path, path, None
+
+
+def decode_image(path: str, image_bytes: bytes, img_size: int):
+    """
+    Read, decode and resize one image, runs in the decode pool
+    """
+    if image_bytes is None:
+        with open(path, "rb") as image_file:
+            image_bytes = image_file.read()
+
+    image = ImagePreprocessor.decode(image_bytes)
+    if image is None:
+        raise ValueError("Cannot decode image")
+    return ImagePreprocessor.resize(image, img_size)
+
+
+def load_checkpoint(path: str) -> dict:
+    with open(path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def save_checkpoint(path: str, state: dict):
+    """
+    Replace the checkpoint atomically, a crash leaves either the old or the new one
+    """
+    with open(path + ".tmp", "w") as checkpoint_file:
+        json.dump(state, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class ResultWriter:
+    """
+    Append results to a JSONL or CSV file
+
+    Parameters:
+        path: Output file
+        output_format: "jsonl" or "csv"
+        offset: Size of the output at the checkpoint, results written after it are dropped
+    """
+    def __init__(self, path: str, output_format: str, offset: int = 0):
+        if output_format not in ("jsonl", "csv"):
+            raise ValueError(f"Unsupported output format: {output_format}")
+
+        self.output_format = output_format
+        self.file = open(path, "r+b" if os.path.exists(path) else "wb")
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+        if output_format == "csv" and offset == 0:
+            self._write_csv([OUTPUT_FIELDS])
+
+    def _write_csv(self, rows: list):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        self.file.write(buffer.getvalue().encode("utf-8"))
+
+    def write(self, results: list):
+        """
+        Append results, dicts with the output fields
+        """
+        if self.output_format == "csv":
+            self._write_csv([["" if result[field] is None else result[field] for field in OUTPUT_FIELDS] for result in results])
+        else:
+            self.file.write("".join(json.dumps(result, separators=(",", ":")) + "\n" for result in results).encode("utf-8"))
+
+    def sync(self) -> int:
+        """
+        Flush the results to disk
+
+        :return: Size of the output
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class BulkScorer:
+    """
+    Stream images through the decode pool and the model in batches, appending the results to the output in source order
+
+    Decoding runs ahead of inference, up to max_in_flight images, so the pool works while the model runs.
+
+    Parameters:
+        process_image: ProcessImage whose classify runs a batch through the model, and the cascade
+        pool: Decode thread or process pool
+        writer: Output of the results
+        checkpoint_path: Location of the checkpoint
+        state: Checkpoint state, images done and output size
+        batch_size: Images per inference batch
+        checkpoint_every: Images between two checkpoints, every checkpoint syncs the output to disk
+    """
+    def __init__(self, process_image, pool, writer: ResultWriter, checkpoint_path: str, state: dict, batch_size: int, checkpoint_every: int):
+        self.process_image    = process_image
+        self.pool             = pool
+        self.writer           = writer
+        self.checkpoint_path  = checkpoint_path
+        self.state            = state
+        self.batch_size       = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.max_in_flight    = batch_size * 4
+
+        self.batch = []
+        self.since_checkpoint = 0
+        self.scored = 0
+        self.started = time.perf_counter()
+
+    def run(self, entries):
+        """
+        Score all entries of iter_source, then write a final checkpoint
+        """
+        img_size = config.MODEL_PARAMETERS['img_size']
+        pending = deque()
+        for name, path, image_bytes in entries:
+            pending.append((name, self.pool.submit(decode_image, path, image_bytes, img_size)))
+            if len(pending) >= self.max_in_flight:
+                self._collect(*pending.popleft())
+
+        while pending:
+            self._collect(*pending.popleft())
+        self._score_batch()
+        self._checkpoint()
+
+    def _collect(self, name: str, future):
+        """
+        Add a decoded image to the batch, images that cannot be read or decoded are kept with their error
+        """
+        try:
+            image, error = future.result(), None
+        except Exception as e:
+            image, error = None, str(e) or type(e).__name__
+        self.batch.append((name, image, error))
+
+        if len(self.batch) >= self.batch_size:
+            self._score_batch()
+
+    def _score_batch(self):
+        """
+        Classify the decoded images of the batch and write the results of all its entries
+        """
+        if not self.batch:
+            return
+
+        images = [image for _, image, _ in self.batch if image is not None]
+        labels = iter(self.process_image.classify(images) if images else [])
+        self.writer.write([{"image": name, "has_dog": ("true" if next(labels) == "true" else None) if image is not None else None, "error": error}
+                           for name, image, error in self.batch])
+
+        self.state["done"] += len(self.batch)
+        self.since_checkpoint += len(self.batch)
+        self.scored += len(self.batch)
+        self.batch = []
+        if self.since_checkpoint >= self.checkpoint_every:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self.state["offset"] = self.writer.sync()
+        save_checkpoint(self.checkpoint_path, self.state)
+        self.since_checkpoint = 0
+
+        rate = self.scored / (time.perf_counter() - self.started)
+        logger.info(f"Scored {self.state['done']} images, {rate:.1f} images/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required= True, help= "Directory, file list (- for stdin) or tar archive of images")
+    parser.add_argument("--source-type", choices= ["auto", "dir", "list", "tar"], default= "auto")
+    parser.add_argument("--output", required= True, help= "Results file, the checkpoint is written next to it")
+    parser.add_argument("--format", choices= ["jsonl", "csv"], help= "Output format, from the output extension by default")
+    parser.add_argument("--batch-size", type= int, default= config.MODEL_PARAMETERS['max_batch_size'])
+    parser.add_argument("--decoder", choices= ["thread", "process"], default= "thread", help= "Decode pool type")
+    parser.add_argument("--workers", type= int, default= config.PIPELINE['decode_workers'], help= "Decode pool size")
+    parser.add_argument("--checkpoint-every", type= int, default= 1000, help= "Images between two checkpoints")
+    parser.add_argument("--restart", action= "store_true", help= "Ignore the checkpoint and overwrite the output")
+    args = parser.parse_args()
+
+    source_type = detect_source_type(args.source) if args.source_type == "auto" else args.source_type
+    output_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    checkpoint_path = args.output + ".checkpoint"
+
+    # Resume from the checkpoint of the same source, never overwrite results silently
+    state = {"source": args.source if args.source == "-" else os.path.abspath(args.source), "done": 0, "offset": 0}
+    if not args.restart and os.path.exists(checkpoint_path):
+        saved = load_checkpoint(checkpoint_path)
+        if saved["source"] != state["source"]:
+            parser.error(f"{checkpoint_path} belongs to {saved['source']}, use --restart to score {state['source']} instead")
+        state = saved
+    elif not args.restart and os.path.exists(args.output) and os.path.getsize(args.output):
+        parser.error(f"{args.output} exists without a checkpoint, use --restart to overwrite it")
+
+    # Start the decode pool before the model is loaded, worker processes are spawned and never hold a model
+    if args.decoder == "process":
+        pool = ProcessPoolExecutor(max_workers= args.workers, mp_context= mp.get_context("spawn"))
+    else:
+        pool = ThreadPoolExecutor(max_workers= args.workers, thread_name_prefix= "decode")
+
+    # Model imports are deferred, so the decode processes, which import this module, stay free of them
+    from main import ProcessImage, load_models
+    from utils.auto_model_download import Model
+
+    if config.MODEL['runtime'] != "stub":
+        Model.download_model(model_path= config.MODEL["model_path"], model_url= config.MODEL["model_url"], sha256= config.MODEL["sha256"])
+        if config.CASCADE['enabled']:
+            Model.download_model(model_path= config.CASCADE["model_path"], model_url= config.CASCADE["model_url"], sha256= config.CASCADE["sha256"])
+    ai_model, cascade_model = load_models()
+
+    # Only classify is used, no redis involved
+    process_image = ProcessImage(redis_storage= None, ai_model_object= ai_model.get_model(), queue_name= config.REDIS_SERVER['in_queue'],
+                                 cascade_model_object= cascade_model.get_model() if cascade_model else None)
+
+    if state["done"]:
+        logger.info(f"Resuming from checkpoint, {state['done']} images already scored")
+    writer = ResultWriter(args.output, output_format, offset= state["offset"])
+    scorer = BulkScorer(process_image= process_image, pool= pool, writer= writer, checkpoint_path= checkpoint_path, state= state,
+                        batch_size= args.batch_size, checkpoint_every= args.checkpoint_every)
+    try:
+        scorer.run(iter_source(args.source, source_type, skip= state["done"]))
+        logger.info(f"Finished scoring {args.source}, {state['done']} images, results in {args.output}")
+    finally:
+        pool.shutdown(wait= False, cancel_futures= True)
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os 
+import socket
 
 # Application settings
 APP_NAME = "Frontera Health Assignment"
@@ -8,17 +9,124 @@ VERSION  = "1.0"
 MODEL = {
     "model_path": "./model/yolo11x-cls.pt",    # Path to model, model name to be provided as environment variable
     "model_url" : "https://github.com/ultralytics/assets/releases/download/v8.3.0/yolo11x-cls.pt",
+    "sha256"    : os.getenv("MODEL_SHA256") or None,   # Published SHA-256 of the file at model_url, without it the first download is trusted
     "model_name": "YOLO_v11",
-    "library"   : "ultralytics"
+    "library"   : "ultralytics",
+    "runtime"   : os.getenv("MODEL_RUNTIME", "torch"),                 # "torch", "onnx", "openvino" (exported models are cached under ./model/) or "stub" for benchmarks
+    "stub_latency_ms": float(os.getenv("STUB_MODEL_LATENCY_MS", 0)),   # Simulated inference time per batch of the stub model
+    "stub_confidence": float(os.getenv("STUB_MODEL_CONFIDENCE", 0.9)), # Top-1 confidence returned by the stub model
+    "int8"      : os.getenv("MODEL_INT8", "false").lower() == "true",  # INT8 quantization of the exported model
+    "int8_data" : os.getenv("MODEL_INT8_DATA", "imagenet10"),         # Calibration dataset for OpenVINO INT8 quantization
+    "top5_tolerance"     : 0.02,   # Max top-5 confidence difference of an exported model vs PyTorch
+    "top5_tolerance_int8": 0.1
+}
+
+# Model cascade, a small model classifies every image first and only uncertain images are run through the model above
+CASCADE = {
+    "enabled"   : os.getenv("CASCADE_ENABLED", "false").lower() == "true",
+    "model_path": "./model/yolo11n-cls.pt",
+    "model_url" : "https://github.com/ultralytics/assets/releases/download/v8.3.0/yolo11n-cls.pt",
+    "sha256"    : os.getenv("CASCADE_SHA256") or None,
+    "band"      : (float(os.getenv("CASCADE_BAND_LOW", 0.25)),     # Dog confidences of the small model within the band (inclusive)
+                   float(os.getenv("CASCADE_BAND_HIGH", 0.75)))    # are escalated to the large model
+}
+
+# Download of the model file at startup
+MODEL_DOWNLOAD = {
+    "num_segments": int(os.getenv("MODEL_DOWNLOAD_SEGMENTS", 8)),      # Parallel HTTP range requests, 1 for a single stream
+    "chunk_size"  : 1024 * 1024,
+    "timeout_s"   : 30,                                                # Connect and read timeout of a request
+    "retries"     : 5                                                  # Attempts to finish the download, resuming the partial segments
+}
+
+# Warmup inference after the model is loaded, so the first real batch does not pay for lazy initialization
+WARMUP = {
+    "iterations": int(os.getenv("WARMUP_ITERATIONS", 2)),   # 0 disables the warmup
+    "batch_size": int(os.getenv("WARMUP_BATCH_SIZE", os.getenv("MAX_BATCH_SIZE", 8)))
 }
 
 # Model parametera
 MODEL_PARAMETERS = {
     "save_result"    : False,
     "conf_threshold" : 0.5,
+    "dog_decision"   : os.getenv("DOG_DECISION", "top1"),   # "top1" dog class confidence or "sum" of all dog breed probabilities vs conf_threshold
     "iou"            : 0.7,
     "half"           : False,
-    "img_size"       : 320 
+    "img_size"       : 320,
+    "max_batch_size" : int(os.getenv("MAX_BATCH_SIZE", 8)),     # Max images per predict call, 1 disables batching
+    "max_wait_ms"    : int(os.getenv("MAX_BATCH_WAIT_MS", 10))  # Max time to wait for a batch to fill after the first image
+}
+
+# Shared-memory handoff of images when the app and the backend run on one host, only a slot descriptor goes through redis
+SHM_TRANSPORT = {
+    "enabled"  : os.getenv("SHM_TRANSPORT", "false").lower() == "true",
+    "path"     : os.getenv("SHM_RING_PATH", "/shm/images.ring"),          # On a tmpfs mounted in both containers
+    "num_slots": int(os.getenv("SHM_NUM_SLOTS", 128)),                    # Set by the app when it creates the file
+    "slot_size": int(os.getenv("SHM_SLOT_SIZE", 2 * 1024 * 1024)),        # Larger images, and all images once the ring is full, are sent inline
+    "lease_s"  : 300                                                      # Slots never released (dropped message, crashed backend) are reclaimed after it
+}
+
+# Storage of prediction results
+RESULT_STORE = {
+    "key_prefix" : "prediction:",
+    "ttl_s"      : int(os.getenv("RESULT_TTL_S", 7 * 24 * 3600)),
+    "encoding"   : os.getenv("RESULT_ENCODING", "hash"),   # "hash" per image or "bucketed" (ids // bucket_size share a small hash)
+    "bucket_size": 100                                     # Below hash-max-listpack-entries (128), so buckets stay listpack encoded
+}
+
+# Content-hash result cache for duplicate uploads
+RESULT_CACHE = {
+    "enabled"    : os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true",
+    "key_prefix" : "result_cache:",
+    "index_key"  : "result_cache:index",     # Sorted set of cached digests, bounds the cache size
+    "ttl_s"      : int(os.getenv("RESULT_CACHE_TTL_S", 86400)),
+    "max_entries": int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 100000))
+}
+
+# Completion events for requests waiting inline on their prediction
+RESULT_EVENTS = {
+    "channel_prefix": "prediction_done",
+    "num_shards"    : 16,        # Results are published on channel_prefix:{image_id % num_shards}
+    "max_wait_ms"   : 10000      # Upper bound of the wait_ms request parameter
+}
+
+# Staged decode -> infer -> write pipeline of the image worker
+PIPELINE = {
+    "decode_workers": int(os.getenv("DECODE_WORKERS", 4)),   # Threads decoding and resizing images
+    "queue_size"    : 2                                      # Batches buffered between two stages
+}
+
+# Inference worker pool, 0 workers runs inference inside the FastAPI process
+WORKER_POOL = {
+    "num_workers"        : int(os.getenv("WORKER_PROCESSES", 0)),
+    "threads_per_worker" : int(os.getenv("WORKER_THREADS", 0)),              # Torch intra-op threads per worker, 0 splits the cpus evenly
+    "pin_cpus"           : os.getenv("WORKER_PIN_CPUS", "false").lower() == "true",
+    "heartbeat_interval_s": 5,
+    "heartbeat_timeout_s" : 120,                                             # Ready workers silent for this long are restarted, loading ones are not
+    "supervise_interval_s": 2
+}
+
+# Metrics exposed on /metrics
+METRICS = {
+    "sample_interval_s": 5     # How often queue depth and throughput are sampled
+}
+
+# Logging, handlers run on a listener thread in "queue" mode so console and file writes never block the event loop
+LOGGING = {
+    "mode"       : os.getenv("LOG_MODE", "queue"),                    # "queue" or "sync" (handlers called inline)
+    "queue_size" : int(os.getenv("LOG_QUEUE_SIZE", 10000)),           # Records waiting for the listener, more are dropped
+    "level"      : os.getenv("LOG_LEVEL", "INFO"),
+    "json"       : os.getenv("LOG_JSON", "false").lower() == "true",  # One JSON object per line instead of plain text
+    "file_path"  : os.getenv("LOG_FILE", "log/app.log"),              # Empty to log to the console only
+    "truncate"   : os.getenv("LOG_TRUNCATE", "false").lower() == "true",    # Clear the log file when the server starts
+    "sample_rate": float(os.getenv("LOG_SAMPLE_RATE", 0.01))          # Share of per-image messages logged at INFO, the rest are DEBUG
+}
+
+# On-demand profiling of the image worker loop through POST /admin/profile, in-process mode only
+PROFILING = {
+    "enabled"    : os.getenv("ADMIN_PROFILING", "false").lower() == "true",
+    "max_seconds": 60,       # Longest profile a request can ask for
+    "top_n"      : 40        # Functions listed by the cProfile report
 }
 
 # Inference Server Details
@@ -33,7 +141,45 @@ REDIS_SERVER = {
     "host"  : os.getenv("REDIS_HOST", "localhost"),
     "port"  : int(os.getenv("REDIS_PORT", 6379)),
     "db_store"    : 0,
-    "in_queue"    : "image_queue"
+    "in_queue"    : "image_queue",
+    "transport"   : os.getenv("QUEUE_TRANSPORT", "list"),    # "list" (BLPOP) or "stream" (consumer group)
+    "processed_counter": "stats:processed"                   # Images processed by all workers, the app derives the drain rate from it
+}
+
+# Connection pools, blocking reads of the queue get their own client so result writes never wait behind them
+REDIS_POOL = {
+    "max_connections"       : int(os.getenv("REDIS_MAX_CONNECTIONS", 16)),   # Client used for result writes and pipelines
+    "blocking_max_connections": 2,        # Client used for BLPOP / XREADGROUP BLOCK, one reader per worker plus a spare
+    "pool_timeout_s"        : 5,          # How long a command waits for a free connection
+    "socket_timeout_s"      : 5,          # Not applied to the blocking client, its reads wait as long as the queue is empty
+    "socket_connect_timeout_s": 2,
+    "health_check_interval_s" : 15,       # Idle connections are checked with PING before reuse
+    "retry_attempts"        : 3,          # Retries of a command on connection errors, with exponential backoff
+    "backoff_base_s"        : 0.05,
+    "backoff_cap_s"         : 2,
+    "connect_attempts"      : 10          # Attempts to reach redis at startup, with the same backoff
+}
+
+# Priority classes, every class has its own queue (list or stream), highest priority first
+PRIORITY = {
+    "classes"  : ["interactive", "bulk"],                         # The first class keeps the base queue name, the others get a ":<class>" suffix
+    "default"  : "interactive",                                   # Class of messages without a priority
+    "scheduler": os.getenv("PRIORITY_SCHEDULER", "weighted"),     # "weighted" share of every batch, or "strict" priority order
+    "weights"  : {"interactive": 4, "bulk": 1}                    # Batch slots per class in weighted mode, while both classes have work
+}
+
+# Per-tenant in-flight counters, decremented once the result of an image is written
+TENANTS = {
+    "key_prefix": "inflight:"
+}
+
+# Redis Streams transport, used when REDIS_SERVER['transport'] is "stream"
+REDIS_STREAM = {
+    "stream_name"   : "image_stream",
+    "consumer_group": "backend_workers",
+    "consumer_name" : os.getenv("CONSUMER_NAME", socket.gethostname()),  # Must be unique per backend container, pool workers append ":<worker index>"
+    "claim_idle_ms" : int(os.getenv("STREAM_CLAIM_IDLE_MS", 60000)),     # Pending entries idle this long are claimed from dead consumers
+    "claim_interval_s": 5                                                # How often to look for entries to claim
 }
 
 # List of dog breeds class ids model is trained on 
@@ -1,26 +1,66 @@
 from ultralytics import YOLO
+from ultralytics.utils import ASSETS
 from typing import Union
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 import logging
 import json
 from contextlib import asynccontextmanager
 from config import config
 import os
+import shutil
 from utils.redis_manager import RedisManager
 from utils import logging_config
 import asyncio
-import base64
+import threading
+import time
 import numpy as np
-import zlib
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 from utils.auto_model_download import Model
+from utils.wire_format import WireFormat, RAW_CONTENT_TYPE
+from utils.worker_pool import WorkerPool
+from utils.result_cache import ResultCache
+from utils.result_store import ResultStore
+from utils.result_events import ResultEvents
+from utils.postprocess import DogClassifier
+from utils.preprocess import ImagePreprocessor
+from utils.metrics import REGISTRY
+from utils.stub_model import StubModel
+from utils.shm_ring import ShmRing
+from utils.scheduler import PriorityScheduler
+from utils.profiling import LoopProfiler, ProfilerBusy
 
 # Setup logging
 # logging.basicConfig(level= logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Prometheus metrics of the image worker
+QUEUE_WAIT_SECONDS   = REGISTRY.histogram("backend_queue_wait_seconds", "Time from enqueue in the app to dequeue in the backend", labelnames= ("priority",))
+DECODE_SECONDS       = REGISTRY.histogram("backend_decode_seconds", "Time to decode and resize one image")
+INFERENCE_SECONDS    = REGISTRY.histogram("backend_inference_seconds", "Time to run the model on one batch, post-processing included")
+RESULT_WRITE_SECONDS = REGISTRY.histogram("backend_result_write_seconds", "Time to write the results of finished batches to redis")
+BATCH_SIZE           = REGISTRY.histogram("backend_batch_size", "Number of images per inference batch", buckets= (1, 2, 4, 8, 16, 32, 64))
+IMAGES_PROCESSED     = REGISTRY.counter("backend_images_processed_total", "Images with a prediction written to redis")
+ERRORS               = REGISTRY.counter("backend_errors_total", "Errors of the image worker by stage", labelnames= ("stage",))
+QUEUE_DEPTH          = REGISTRY.gauge("backend_queue_depth", "Images waiting in the queue, sampled periodically")
+IMAGES_DEQUEUED      = REGISTRY.counter("backend_images_dequeued_total", "Images taken from the queue by priority class", labelnames= ("priority",))
+IMAGES_PER_SECOND    = REGISTRY.gauge("backend_images_per_second", "Images processed per second over the last sampling interval")
+CASCADE_IMAGES       = REGISTRY.counter("backend_cascade_images_total", "Images run through each model of the cascade, large over small is the escalation rate", labelnames= ("stage",))
+CASCADE_SECONDS      = REGISTRY.histogram("backend_cascade_stage_seconds", "Time to run one model of the cascade on a batch", labelnames= ("stage",))
+
+class UndecodableImage(ValueError):
+    """
+    The image of a queue message cannot be decoded, carries the id and metadata of the message so the image
+    still gets a terminal status
+    """
+    def __init__(self, image_id: int, meta: dict, reason: str):
+        super().__init__(f"Could not decode image with id: {image_id}: {reason}")
+        self.image_id = image_id
+        self.meta     = meta
+
+
 """
 Class to load the ai model into runtime environment and save the model object
 
@@ -28,8 +68,6 @@ Parameters:
     model_path: Model file location wrt to current directory
 """
 class AiModel:
-    model = None
-
     def __init__(self, model_path: str):
         """
         Initializes the YOLOv11 model from Ultralytics
@@ -37,17 +75,24 @@ class AiModel:
         Parameters:
             model_path (str): The YOLOv11 classification model variant to load
         """
-        logger.info(f"Creating environment to load {config.MODEL['model_name']} using {config.MODEL['library']} backend...")
+        logger.info(f"Creating environment to load {config.MODEL['model_name']} ({model_path}) using {config.MODEL['library']} backend...")
 
-        # Setup model path, load model and load model object
+        # Setup model path, load model and load model object, every instance holds its own model so the models of a cascade coexist
         self.model_path= model_path
+        self.model= None
+        self.ready= False
         self._load_model()
 
     """
-    Loads the model and save it as class attribute
+    Loads the model and save it as instance attribute
     """
     def _load_model(self):
         try:
+            # Stand-in model for benchmarks, no model file involved
+            if config.MODEL['runtime'] == "stub":
+                self.model= StubModel(latency_ms= config.MODEL['stub_latency_ms'], confidence= config.MODEL['stub_confidence'])
+                return
+
             # Check if path is a valid path 
             is_valid_path = self._is_valid_file_path(path= self.model_path)
 
@@ -55,9 +100,11 @@ class AiModel:
             if not is_valid_path:
                 raise FileNotFoundError(f"Path {self.model_path} is not a valid path.")
 
-            # Load the model
-            AiModel.model= YOLO(self.model_path)
-
+            # Load the model with the configured runtime
+            if config.MODEL['runtime'] == "torch":
+                self.model= YOLO(self.model_path)
+            else:
+                self.model= self._load_exported_model(runtime= config.MODEL['runtime'], int8= config.MODEL['int8'])
         
         except FileNotFoundError as e:
             # Handle file not found while loading the AI Model 
@@ -77,12 +124,137 @@ class AiModel:
             # Return error response as JSON 
             return JSONResponse(status_code=500, content= error_response)
     
+    def exported_model_path(self, runtime: str, int8: bool) -> str:
+        """
+        Location of the cached exported model, next to the PyTorch checkpoint
+
+        Parameters:
+            runtime: "onnx" or "openvino"
+            int8: INT8 quantized variant
+        """
+        stem = os.path.splitext(self.model_path)[0] + f"_{config.MODEL_PARAMETERS['img_size']}" + ("_int8" if int8 else "")
+
+        # Ultralytics recognizes the format from the suffix
+        if runtime == "onnx":
+            return stem + ".onnx"
+        if runtime == "openvino":
+            return stem + "_openvino_model"
+        raise ValueError(f"Unsupported model runtime: {runtime}")
+
+    def _load_exported_model(self, runtime: str, int8: bool):
+        """
+        Load the model exported for the runtime, exporting and verifying it on first start
+        """
+        artifact_path = self.exported_model_path(runtime= runtime, int8= int8)
+
+        if not os.path.exists(artifact_path):
+            logger.info(f"Exporting {self.model_path} to {runtime}{' INT8' if int8 else ''}, this only happens on first start...")
+            self._export_model(runtime= runtime, int8= int8, artifact_path= artifact_path)
+
+            # Never serve an export that disagrees with the PyTorch model
+            tolerance = config.MODEL['top5_tolerance_int8'] if int8 else config.MODEL['top5_tolerance']
+            if not self.verify_exported_model(artifact_path= artifact_path, tolerance= tolerance):
+                logger.error(f"Exported model {artifact_path} does not match the PyTorch model, falling back to PyTorch...")
+                if os.path.isdir(artifact_path):
+                    shutil.rmtree(artifact_path)
+                else:
+                    os.remove(artifact_path)
+                return YOLO(self.model_path)
+
+        logger.info(f"Loading exported model {artifact_path}...")
+        return YOLO(artifact_path, task= "classify")
+
+    def _export_model(self, runtime: str, int8: bool, artifact_path: str):
+        """
+        Export the PyTorch model with a dynamic batch dimension and move it to its cache location
+        """
+        export_args = {"imgsz": config.MODEL_PARAMETERS['img_size'], "half": config.MODEL_PARAMETERS['half'],
+                       "dynamic": True, "batch": config.MODEL_PARAMETERS['max_batch_size']}
+        torch_model = YOLO(self.model_path)
+
+        if runtime == "openvino":
+            # OpenVINO quantizes with NNCF, which needs a small calibration dataset
+            exported_path = torch_model.export(format= "openvino", int8= int8, data= config.MODEL['int8_data'] if int8 else None, **export_args)
+        elif runtime == "onnx":
+            exported_path = torch_model.export(format= "onnx", simplify= True, **export_args)
+
+            # Ultralytics has no INT8 ONNX export, quantize the weights with ONNX Runtime instead
+            if int8:
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(exported_path, artifact_path, weight_type= QuantType.QUInt8)
+                os.remove(exported_path)
+                return
+        else:
+            raise ValueError(f"Unsupported model runtime: {runtime}")
+
+        os.replace(exported_path, artifact_path)
+
+    def verify_exported_model(self, artifact_path: str, tolerance: float) -> bool:
+        """
+        Compare the top-5 predictions of an exported model with the PyTorch model on the ultralytics sample images
+
+        Parameters:
+            artifact_path: Location of the exported model
+            tolerance: Max absolute difference of the top-5 confidences
+        """
+        images = [cv2.imread(str(path)) for path in sorted(ASSETS.glob("*.jpg"))]
+        reference = YOLO(self.model_path).predict(images, imgsz= config.MODEL_PARAMETERS['img_size'], verbose= False)
+        candidate = YOLO(artifact_path, task= "classify").predict(images, imgsz= config.MODEL_PARAMETERS['img_size'], verbose= False)
+        return all(AiModel.top5_matches(ref, cand, tolerance) for ref, cand in zip(reference, candidate))
+
+    @staticmethod
+    def top5_matches(reference, candidate, tolerance: float) -> bool:
+        """
+        Check that two predictions agree on the top-1 class and on the top-5 confidences within the tolerance
+        """
+        top5 = reference.probs.top5
+        reference_conf = np.asarray(reference.probs.data.cpu())[top5]
+        candidate_conf = np.asarray(candidate.probs.data.cpu())[top5]
+        max_diff = float(np.max(np.abs(reference_conf - candidate_conf)))
+
+        if candidate.probs.top1 != reference.probs.top1 or max_diff > tolerance:
+            logger.error(f"Top-5 mismatch: top1 {reference.probs.top1} vs {candidate.probs.top1}, max confidence difference {max_diff:.4f}")
+            return False
+        return True
+
+    def get_status(self) -> str:
+        """
+        Get the status of the model
+        """
+        if self.model is None:
+            return "not loaded"
+        return "ready" if self.ready else "loaded"
+
+    def warmup(self, iterations: int = config.WARMUP['iterations'], batch_size: int = config.WARMUP['batch_size']):
+        """
+        Run inference on blank images with the serving parameters, so lazy initialization of the runtime
+        (allocator, kernels, graph compilation) happens before the first real batch, then mark the model ready
+
+        Parameters:
+            iterations: Number of warmup batches, 0 skips the warmup
+            batch_size: Number of images per warmup batch
+        """
+        if self.model is None:
+            raise Exception(f"Cannot warm up {self.model_path}, the model failed to load.")
+
+        img_size = config.MODEL_PARAMETERS['img_size']
+        images = [np.zeros((img_size, img_size, 3), dtype= np.uint8)] * max(batch_size, 1)
+        for iteration in range(iterations):
+            start = time.perf_counter()
+            self.model.predict(images, save=config.MODEL_PARAMETERS['save_result'],
+                                  imgsz=config.MODEL_PARAMETERS['img_size'],
+                                  conf=config.MODEL_PARAMETERS['conf_threshold'],
+                                  half=config.MODEL_PARAMETERS['half'],
+                                  verbose= False)
+            logger.info(f"Warmup batch {iteration + 1}/{iterations} of {len(images)} images took {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        self.ready= True
+
     """
-    Get the status of the model
+    Get the loaded model object
     """
-    @staticmethod
-    def get_model():
-        return AiModel.model
+    def get_model(self):
+        return self.model
 
 
     """
@@ -105,87 +277,635 @@ Parameters:
     img:
 """
 class ProcessImage:
-    def __init__(self, redis_storage, ai_model_object, queue_name):
+    def __init__(self, redis_storage, ai_model_object, queue_name, transport: str = config.REDIS_SERVER['transport'], on_batch= None, result_cache: ResultCache = None,
+                 redis_blocking= None, cascade_model_object= None, cascade_band: tuple = config.CASCADE['band'],
+                 consumer_name: str = config.REDIS_STREAM['consumer_name']):
         self.redis_store= redis_storage
+        # Blocking reads of the queue run on their own client, so result writes never queue behind them
+        self.redis_blocking= redis_blocking or redis_storage
         self.ai_model   = ai_model_object
+
+        # Optional small model run first on every batch, only images it is unsure about are run through ai_model
+        self.cascade_model = cascade_model_object
+        self.cascade_band  = cascade_band
         self.queue_name = queue_name
+        self.transport  = transport
 
-    async def deserialize_image(self, image_data: str) -> Union[bytes, None]:
-        # Deserialize the JSON string to a dictionary
-        data = json.loads(image_data)
+        # Consumer of the stream consumer group, unique per worker so every worker has its own pending entries
+        self.consumer_name = consumer_name
 
-        # Decode the base64 image data
-        image_decoded = base64.b64decode(data['image_data'])
+        # Every priority class has its own queue, batches are shared between them by the scheduler
+        self.scheduler  = PriorityScheduler()
+        self.queue_keys = [RedisManager.queue_key(priority) for priority in self.scheduler.classes]
 
-        # Decompress the image using zlib
-        # image_bytes = zlib.decompress(image_decoded)
-        
-        # Convert the image bytes to a NumPy array
-        image_array = np.frombuffer(image_decoded, np.uint8)
-        image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+        # Optional callback called with the size of every processed batch
+        self.on_batch   = on_batch
 
-        # Get the image ID
-        image_id = data['image_id']
-        print("Image type: ", type(image))
+        # Storage of the prediction results
+        self.result_store = ResultStore(redis_client= redis_storage)
 
-        return image, image_id
-    
+        # Optional content-hash cache filled with every result
+        self.result_cache = result_cache
+
+        # Vectorized dog detection over whole batches
+        self.dog_classifier = DogClassifier()
+
+        # Next time pending stream entries of dead consumers are checked for
+        self._next_claim = 0.0
+
+        # Shared-memory ring of the app, mapped by the first message referencing it
+        self.shm_ring  = None
+        self._shm_lock = threading.Lock()
+
+    def deserialize_image(self, image_data: bytes) -> Union[tuple, None]:
+        """
+        Decode a queue message to an image resized for the model, runs in the decode thread pool
+
+        :param image_data: Raw message popped from the queue
+        :return: Tuple of image, image id and message metadata
+        :raises UndecodableImage: The message was read but its image cannot be decoded
+        """
+        # Decode the binary envelope, legacy base64-in-JSON messages are handled transparently
+        message = WireFormat.decode(image_data)
+
+        try:
+            if message.shm:
+                # Decode straight from the shared-memory slot, which is free again as soon as the image is decoded
+                shm_ring = self.attach_shm_ring()
+                try:
+                    with shm_ring.view(message.shm) as view:
+                        image = self.decode_pixels(view, message)
+                        # Raw pixels still point into the slot, copy them before it is released
+                        if message.content_type == RAW_CONTENT_TYPE:
+                            image = image.copy()
+                finally:
+                    shm_ring.release(message.shm)
+            else:
+                # Decode straight from the message buffer without copying the image bytes
+                image = self.decode_pixels(message.image_bytes, message)
+        except Exception as e:
+            raise UndecodableImage(message.image_id, message.meta, str(e)) from e
+        if image is None:
+            raise UndecodableImage(message.image_id, message.meta, "invalid image data")
+
+        # Shrink the shorter side to the model input size, so the model only has to crop
+        return ImagePreprocessor.resize(image), message.image_id, message.meta
+
+    @staticmethod
+    def decode_pixels(image_bytes, message) -> Union[np.ndarray, None]:
+        """
+        Decode image bytes to BGR pixels, images normalized by the app to raw pixels only need a reshape
+
+        :param image_bytes: Encoded image, or raw pixels
+        :param message: Decoded message the bytes belong to
+        :return: BGR image, None if it cannot be decoded
+        """
+        if message.content_type == RAW_CONTENT_TYPE:
+            return np.frombuffer(image_bytes, np.uint8).reshape(message.meta["shape"])
+        return ImagePreprocessor.decode(image_bytes)
+
+    def attach_shm_ring(self) -> ShmRing:
+        """
+        Map the shared-memory ring created by the app, on the first message referencing it
+        """
+        with self._shm_lock:
+            if self.shm_ring is None:
+                self.shm_ring = ShmRing(path= config.SHM_TRANSPORT['path'], lease_s= config.SHM_TRANSPORT['lease_s'])
+                logger.info(f"Attached to the shared-memory image ring {config.SHM_TRANSPORT['path']}")
+            return self.shm_ring
+
+    async def fetch_batch(self) -> list:
+        """
+        Blocks until the first message is available, then drains up to max_batch_size - 1 more messages from
+        the queues of all priority classes within the max_wait_ms window, shared between the classes by the scheduler
+
+        :return: List of (entry, raw message) tuples, entry is (stream, entry id) for the stream transport and None for lists
+        """
+        if self.transport == "stream":
+            return await self._fetch_stream_batch()
+        return await self._fetch_list_batch()
+
+    async def _drain(self, slots: int, pop, parse) -> list:
+        """
+        Non blocking read of up to slots messages, split between the class queues by the scheduler
+
+        Slots left over by classes with less work than their quota go to the other classes, in priority order.
+
+        :param slots: Free slots of the batch
+        :param pop: Callable queueing a non blocking read of count messages of a queue on a pipeline, pop(pipe, queue_key, count)
+        :param parse: Callable converting the reply of a read to a list of messages, parse(reply)
+        """
+        quotas = self.scheduler.quotas(slots)
+        served = [(queue_key, quotas[priority]) for queue_key, priority in zip(self.queue_keys, self.scheduler.classes) if quotas[priority]]
+        pipe = self.redis_blocking.pipeline(transaction= False)
+        for queue_key, quota in served:
+            pop(pipe, queue_key, quota)
+
+        batch, short = [], set()
+        for (queue_key, quota), reply in zip(served, await pipe.execute()):
+            entries = parse(reply)
+            batch.extend(entries)
+            if len(entries) < quota:
+                short.add(queue_key)
+
+        for queue_key in self.queue_keys:
+            if len(batch) >= slots:
+                break
+            if queue_key not in short:
+                pipe = self.redis_blocking.pipeline(transaction= False)
+                pop(pipe, queue_key, slots - len(batch))
+                batch.extend(parse((await pipe.execute())[0]))
+        return batch
+
+    async def _fetch_list_batch(self) -> list:
+        max_batch_size = config.MODEL_PARAMETERS['max_batch_size']
+        max_wait_s     = config.MODEL_PARAMETERS['max_wait_ms'] / 1000
+        lpop = lambda pipe, queue_key, count: pipe.lpop(queue_key, count= count)
+        # LPOP with a count replies None for an empty list
+        parse = lambda reply: reply or []
+
+        # Messages already waiting are shared by the scheduler, else block on all queues (left pop) for the first message
+        batch = await self._drain(max_batch_size, lpop, parse)
+        if not batch:
+            _, image_data = await self.redis_blocking.blpop(keys= self.queue_keys, timeout=0)
+            batch = [image_data]
+
+        # Drain more messages until the batch is full or the wait window closes
+        deadline = time.monotonic() + max_wait_s
+        while len(batch) < max_batch_size:
+            # Non blocking pop of whatever is already waiting in the queues
+            drained = await self._drain(max_batch_size - len(batch), lpop, parse)
+            if drained:
+                batch.extend(drained)
+                continue
+
+            # Redis treats a zero timeout as "block forever", so stop once less than 1ms is left
+            remaining = deadline - time.monotonic()
+            if remaining < 0.001:
+                break
+
+            # Wait for the next message, but not past the deadline
+            popped = await self.redis_blocking.blpop(keys= self.queue_keys, timeout= remaining)
+            if popped is None:
+                break
+            batch.append(popped[1])
+
+        return [(None, image_data) for image_data in batch]
+
+    async def _fetch_stream_batch(self) -> list:
+        max_batch_size = config.MODEL_PARAMETERS['max_batch_size']
+        max_wait_ms    = config.MODEL_PARAMETERS['max_wait_ms']
+        group_name     = config.REDIS_STREAM['consumer_group']
+        consumer_name  = self.consumer_name
+        read = lambda pipe, stream_name, count: pipe.xreadgroup(group_name, consumer_name, {stream_name: ">"}, count= count)
+
+        # Take over entries that dead consumers read but never acknowledged
+        if time.monotonic() >= self._next_claim:
+            self._next_claim = time.monotonic() + config.REDIS_STREAM['claim_interval_s']
+            batch = []
+            for stream_name in self.queue_keys:
+                claimed = await self.redis_blocking.xautoclaim(stream_name, group_name, consumer_name,
+                                                               min_idle_time= config.REDIS_STREAM['claim_idle_ms'],
+                                                               start_id= "0-0", count= max_batch_size - len(batch))
+                batch.extend(self._stream_entries(stream_name, claimed[1]))
+                if len(batch) >= max_batch_size:
+                    break
+            if batch:
+                logger.info(f"Claimed {len(batch)} pending entries from dead consumers")
+                return batch
+
+        # Entries already waiting are shared by the scheduler, else block on all streams for the first message(s)
+        batch = await self._drain(max_batch_size, read, self._read_entries)
+        if not batch:
+            response = await self.redis_blocking.xreadgroup(group_name, consumer_name, {stream_name: ">" for stream_name in self.queue_keys},
+                                                            count= max_batch_size, block= 0)
+            batch = self._read_entries(response)[:max_batch_size]
+
+        # Read more entries until the batch is full or the wait window closes
+        deadline = time.monotonic() + max_wait_ms / 1000
+        while len(batch) < max_batch_size:
+            drained = await self._drain(max_batch_size - len(batch), read, self._read_entries)
+            if drained:
+                batch.extend(drained)
+                continue
+
+            # XREADGROUP treats a zero block time as "block forever", so stop once less than 1ms is left
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms < 1:
+                break
+
+            response = await self.redis_blocking.xreadgroup(group_name, consumer_name, {stream_name: ">" for stream_name in self.queue_keys},
+                                                            count= max_batch_size - len(batch), block= remaining_ms)
+            if not response:
+                break
+            batch.extend(self._read_entries(response))
+
+        return batch
+
+    @staticmethod
+    def _read_entries(response: list) -> list:
+        """
+        Flatten XREADGROUP replies, a reply holds [stream, entries] pairs and is empty when nothing was read
+        """
+        entries = []
+        for stream_name, stream_entries in response or []:
+            stream_name = stream_name.decode("utf-8") if isinstance(stream_name, bytes) else stream_name
+            entries.extend(ProcessImage._stream_entries(stream_name, stream_entries))
+        return entries
+
+    @staticmethod
+    def _stream_entries(stream_name: str, entries: list) -> list:
+        """
+        Convert stream entries to ((stream, entry id), raw message) tuples, entries trimmed from the stream have no fields
+        """
+        return [((stream_name, entry_id), fields[b"data"]) for entry_id, fields in entries if fields]
+
+    def ack(self, redis_client, entries: list):
+        """
+        Acknowledge processed stream entries, no-op for the list transport
+
+        :param redis_client: Redis connection object or pipeline
+        :param entries: (stream, entry id) of the processed stream entries, None for list messages
+        """
+        if self.transport != "stream":
+            return
+
+        entry_ids = {}
+        for entry in entries:
+            if entry is not None:
+                entry_ids.setdefault(entry[0], []).append(entry[1])
+        for stream_name, stream_entry_ids in entry_ids.items():
+            redis_client.xack(stream_name, config.REDIS_STREAM['consumer_group'], *stream_entry_ids)
 
     async def fetch_and_process_images(self):
+        """
+        Fetches batches of images from the Redis queue and processes them using the AI model
+
+        The work is split in concurrent stages connected by bounded queues, so fetching, decoding and
+        writing results overlap with inference: prefetch -> decode -> infer -> write
+        """
+        queue_size = config.PIPELINE['queue_size']
+        fetched_queue = asyncio.Queue(maxsize= queue_size)
+        decoded_queue = asyncio.Queue(maxsize= queue_size)
+        results_queue = asyncio.Queue(maxsize= queue_size)
+
+        # Decoding runs in its own thread pool so it never waits behind inference
+        self.decode_pool = ThreadPoolExecutor(max_workers= config.PIPELINE['decode_workers'], thread_name_prefix= "decode")
+
+        try:
+            await asyncio.gather(self._prefetch_stage(fetched_queue),
+                                 self._decode_stage(fetched_queue, decoded_queue),
+                                 self._infer_stage(decoded_queue, results_queue),
+                                 self._write_stage(results_queue))
+
+        except asyncio.CancelledError:
+            logger.info("Backgroud running task failed. Fetch and process images was cancelled.")
+            raise asyncio.CancelledError
 
+        finally:
+            self.decode_pool.shutdown(wait= False, cancel_futures= True)
+
+    async def _prefetch_stage(self, out_queue: asyncio.Queue):
+        """
+        Fetch batches from redis, blocks on the bounded queue when downstream stages are busy
+        """
         while True:
-                """
-                Fetches images from the Redis queue and processes them using the AI model
-                """
-                try:
-                    # Check if the task is cancelled
-                    if asyncio.current_task().cancelled():
-                        logger.info("Background task was cancelled. Exiting...")
-                        return
-                    
-                    # Blocking pop from the input queue (left pop)
-                    logger.info(msg="Waiting for image...")
-                    _, image_data= await self.redis_store.blpop(keys= [self.queue_name], timeout=0)
-
-                    # Decode image data
-                    image, image_id = await self.deserialize_image(image_data)
-                    logger.info(f"Received image with id: {image_id}")
-                    
-                    # Processing images using AI model
-                    predictions = await asyncio.to_thread(self.ai_model.predict, image,
-                                                          save=config.MODEL_PARAMETERS['save_result'], 
-                                                          imgsz=config.MODEL_PARAMETERS['img_size'], 
-                                                          conf=config.MODEL_PARAMETERS['conf_threshold'])
-                    
-                    # Get the results, type List
-                    pred_class_ids  = predictions[0].probs.top5
-                    pred_class_conf = predictions[0].probs.top5conf.tolist()
-
-                    # Check if there is atlest 1 prediction output
-                    # if len(pred_class_ids) >= 1:
-
-                    # Class id with max conf
-                    class_id = pred_class_ids[0]
-
-                    # Get conf score for the class
-                    class_conf_score= [pred_class_conf[0]] if class_id in config.DOG_BREEDS else []
-
-                    # Check if the class is a dog
-                    has_dog = "true" if class_conf_score else "null"
+            try:
+                logger.debug(msg="Waiting for image...")
+                batch = await self.fetch_batch()
+                await out_queue.put({"started": time.perf_counter(), "dequeued_at": time.time(), "messages": batch})
 
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as e:
+                logger.error(f"Error while fetching images: {str(e)}")
+                ERRORS.inc(stage= "fetch")
+                await asyncio.sleep(1)
+
+    async def _decode_stage(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        """
+        Decode and resize the images of a batch in parallel in the decode thread pool
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await in_queue.get()
+            messages = batch.pop("messages")
+            batch["entry_ids"] = [entry_id for entry_id, _ in messages]
+
+            # Decode image data, skipping messages that cannot be decoded
+            decoded = await asyncio.gather(*[loop.run_in_executor(self.decode_pool, self._timed_deserialize_image, image_data)
+                                             for _, image_data in messages], return_exceptions= True)
+            batch["images"], batch["image_ids"], batch["metas"], batch["decode_s"] = [], [], [], []
+            # (image id, meta) of the images that get an Error status instead of a prediction
+            batch["failed"] = []
+            for item in decoded:
+                if isinstance(item, Exception):
+                    logger.error(f"Dropping undecodable message: {str(item)}")
+                    ERRORS.inc(stage= "decode")
+                    if isinstance(item, UndecodableImage):
+                        batch["failed"].append((item.image_id, item.meta))
+                    continue
+                image, image_id, meta, decode_s = item
+
+                # The app stamps every message with its enqueue time and priority class
+                priority = meta.get("priority", config.PRIORITY['default'])
+                IMAGES_DEQUEUED.inc(priority= priority)
+                if "enqueued_at" in meta:
+                    QUEUE_WAIT_SECONDS.observe(max(batch["dequeued_at"] - meta["enqueued_at"], 0), priority= priority)
+                batch["images"].append(image)
+                batch["image_ids"].append(image_id)
+                batch["metas"].append(meta)
+                batch["decode_s"].append(decode_s)
+
+            await out_queue.put(batch)
+
+    def _timed_deserialize_image(self, image_data: bytes) -> tuple:
+        start = time.perf_counter()
+        decoded = self.deserialize_image(image_data)
+        decode_s = time.perf_counter() - start
+        DECODE_SECONDS.observe(decode_s)
+        return (*decoded, decode_s)
+
+    async def _infer_stage(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        """
+        Run the model on decoded batches, the next batch is already decoded while this one runs
+        """
+        while True:
+            batch = await in_queue.get()
+            images = batch.pop("images")
+            batch["has_dog"] = []
+            batch["inference_s"] = 0.0
+
+            try:
+                if images:
+                    logging_config.log_sampled(logger, "Received images with ids: %s", batch['image_ids'])
+                    BATCH_SIZE.observe(len(images))
+                    start = time.perf_counter()
+
+                    # Processing the whole batch using AI model in a single call
+                    batch["has_dog"] = await asyncio.to_thread(self.classify, images)
+                    batch["inference_s"] = time.perf_counter() - start
+                    INFERENCE_SECONDS.observe(batch["inference_s"])
+
+            except Exception as e:
+                # Mark the images as failed and still pass the batch on so its entries get acknowledged
+                logger.error(f"Error while processing image: {str(e)}")
+                ERRORS.inc(stage= "inference")
+                batch["failed"].extend(zip(batch["image_ids"], batch["metas"]))
+                batch["image_ids"], batch["metas"], batch["decode_s"] = [], [], []
+
+            await out_queue.put(batch)
+
+    def classify(self, images: list) -> list:
+        """
+        Dog decision of every image of a batch, runs in a worker thread
+
+        With a cascade the small model classifies the whole batch and the images whose dog confidence falls within
+        the uncertainty band are run again, as one batch, through the large model, whose decision replaces the first one.
+
+        :param images: Decoded images of the batch
+        :return: "true" if a dog is found else "null", for every image
+        """
+        if self.cascade_model is None:
+            return self.dog_classifier.has_dog(self.predict(self.ai_model, images))
+
+        start = time.perf_counter()
+        summary = self.dog_classifier.summarize(DogClassifier.stack_probs(self.predict(self.cascade_model, images)))
+        CASCADE_SECONDS.observe(time.perf_counter() - start, stage= "small")
+        CASCADE_IMAGES.inc(len(images), stage= "small")
+        has_dog = summary["has_dog"]
+
+        escalated = DogClassifier.uncertain(summary, self.cascade_band)
+        if len(escalated):
+            start = time.perf_counter()
+            escalated_summary = self.dog_classifier.summarize(DogClassifier.stack_probs(self.predict(self.ai_model, [images[index] for index in escalated])))
+            CASCADE_SECONDS.observe(time.perf_counter() - start, stage= "large")
+            CASCADE_IMAGES.inc(len(escalated), stage= "large")
+            has_dog = has_dog.copy()
+            has_dog[escalated] = escalated_summary["has_dog"]
+
+        return DogClassifier.labels(has_dog)
+
+    @staticmethod
+    def predict(model, images: list) -> list:
+        """
+        Run a model on a batch of images with the serving parameters
+        """
+        return model.predict(images,
+                             save=config.MODEL_PARAMETERS['save_result'],
+                             imgsz=config.MODEL_PARAMETERS['img_size'],
+                             conf=config.MODEL_PARAMETERS['conf_threshold'],
+                             half=config.MODEL_PARAMETERS['half'])
+
+    async def _write_stage(self, in_queue: asyncio.Queue):
+        """
+        Write the results of all finished batches to redis in one pipeline
+        """
+        while True:
+            # Coalesce every batch that finished while the previous write was in flight
+            batches = [await in_queue.get()]
+            while not in_queue.empty():
+                batches.append(in_queue.get_nowait())
+
+            try:
+                pipe = self.redis_store.pipeline(transaction= False)
+                now = time.time()
+                for batch in batches:
                     # Save to redis storage
-                    logger.info(f"Saving prediction results for image with id: {image_id}")
-                    await self.redis_store.hset(image_id, mapping={"image_prediction_id": image_id, 
-                                                                   "status": "Done", 
-                                                                   "has_dog": has_dog})
-        
-                except asyncio.CancelledError:
-                    logger.info("Backgroud running task failed. Fetch and process images was cancelled.")
-                    raise asyncio.CancelledError
+                    logging_config.log_sampled(logger, "Saving prediction results for images with ids: %s", batch['image_ids'])
+                    for image_id, meta, has_dog in zip(batch["image_ids"], batch["metas"], batch["has_dog"]):
+                        self.result_store.write(pipe, image_id, status= "Done", has_dog= has_dog)
+
+                        # Cache the result under the content hash sent by the app
+                        if self.result_cache and meta.get("digest"):
+                            self.result_cache.put(pipe, meta["digest"], {"image_prediction_id": image_id, "has_dog": has_dog}, now= now)
+
+                        # Wake up the request waiting inline for this result
+                        if meta.get("notify"):
+                            ResultEvents.publish(pipe, image_id, {"image_prediction_id": image_id, "status": "Done", "has_dog": has_dog})
+
+                    # Images that cannot be decoded or classified end as Error instead of staying PENDING
+                    for image_id, meta in batch["failed"]:
+                        self.result_store.write(pipe, image_id, status= "Error")
+                        if meta.get("notify"):
+                            ResultEvents.publish(pipe, image_id, {"image_prediction_id": image_id, "status": "Error", "has_dog": None})
+
+                    # Images of the batch no longer count against the in-flight limit of their tenant, failed ones included
+                    for meta in batch["metas"] + [meta for _, meta in batch["failed"]]:
+                        if meta.get("tenant"):
+                            pipe.decr(config.TENANTS['key_prefix'] + meta["tenant"])
+
+                    # Acknowledge the batch only once its results are written
+                    self.ack(pipe, batch["entry_ids"])
+
+                if self.result_cache:
+                    self.result_cache.trim(pipe)
 
-                except Exception as e:
-                    logger.error(f"Error while processing image: {str(e)}")
+                # Count processed messages, the app derives the drain rate of the queue from it
+                pipe.incrby(config.REDIS_SERVER['processed_counter'], sum(len(batch["entry_ids"]) for batch in batches))
+                start = time.perf_counter()
+                await pipe.execute()
+                write_s = time.perf_counter() - start
+                RESULT_WRITE_SECONDS.observe(write_s)
+
+            except Exception as e:
+                logger.error(f"Error while saving prediction results: {str(e)}")
+                ERRORS.inc(stage= "write")
+                continue
+
+            # Log per batch size and latency
+            for batch in batches:
+                batch_ms = (time.perf_counter() - batch["started"]) * 1000
+                logging_config.log_sampled(logger, "Processed batch of %s images in %.1f ms", len(batch['image_ids']), batch_ms)
+                IMAGES_PROCESSED.inc(len(batch["image_ids"]))
+                if self.on_batch:
+                    self.on_batch(len(batch["image_ids"]))
+
+            # Latency traces go in a follow-up write, they need the duration of the write above
+            try:
+                await self._write_traces(batches, write_s)
+            except Exception as e:
+                logger.error(f"Error while saving latency traces: {str(e)}")
+                ERRORS.inc(stage= "trace")
+
+    async def _write_traces(self, batches: list, write_s: float):
+        """
+        Store the latency trace of every image stamped with a trace id by the app, next to its result
+
+        Durations are in milliseconds: queue is the time from enqueue in the app to dequeue, decode the decode and
+        resize of the image, inference and write those of its batch, and backend the time from dequeue to the result
+        written, which also covers the waits between the stages.
+        """
+        pipe = self.redis_store.pipeline(transaction= False)
+        written = time.perf_counter()
+        worker = f"{self.consumer_name}:{os.getpid()}"
+        for batch in batches:
+            for image_id, meta, decode_s in zip(batch["image_ids"], batch["metas"], batch["decode_s"]):
+                if not meta.get("trace_id"):
                     continue
+                trace = {"trace_id": meta["trace_id"],
+                         "queue_ms": round(max(batch["dequeued_at"] - meta["enqueued_at"], 0) * 1000, 3) if "enqueued_at" in meta else None,
+                         "decode_ms": round(decode_s * 1000, 3),
+                         "inference_ms": round(batch["inference_s"] * 1000, 3),
+                         "write_ms": round(write_s * 1000, 3),
+                         "backend_ms": round((written - batch["started"]) * 1000, 3),
+                         "batch_size": len(batch["image_ids"]),
+                         "worker": worker}
+                self.result_store.write_trace(pipe, image_id, trace)
+
+        if len(pipe):
+            await pipe.execute()
+
+def load_models() -> tuple:
+    """
+    Load and warm up the model, and the small model run before it when the cascade is enabled
+
+    Returns:
+        Tuple of the model and the cascade model, None without a cascade
+    """
+    ai_model= AiModel(model_path= config.MODEL['model_path'])
+    ai_model.warmup()
+
+    cascade_model= None
+    if config.CASCADE['enabled']:
+        cascade_model= AiModel(model_path= config.CASCADE['model_path'])
+        cascade_model.warmup()
+        logger.info(f"Model cascade enabled, images with a dog confidence within {config.CASCADE['band']} are escalated to {config.MODEL['model_path']}")
+    return ai_model, cascade_model
+
+
+async def run_worker_loop(worker_index: int, status_queue):
+    """
+    Load a model and consume the image queue inside a pool worker process
+
+    Parameters:
+        worker_index: Index of the worker in the pool
+        status_queue: Queue used to report heartbeats to the supervisor
+    """
+    redis_store= await RedisManager.connect(db=config.REDIS_SERVER['db_store'])
+    redis_blocking= await RedisManager.connect(db=config.REDIS_SERVER['db_store'], blocking= True)
+    if not redis_store or not redis_blocking:
+        raise Exception(f"Worker {worker_index} cannot start without a valid redis connection.")
+
+    # Loading can take minutes on first start (export, INT8 calibration, warmup), a thread keeps reporting
+    # the worker as loading meanwhile, as the supervisor only restarts silent workers once they are ready
+    loaded = threading.Event()
+    def send_loading_heartbeats():
+        while not loaded.is_set():
+            WorkerPool.report(status_queue, worker_index, status= "loading")
+            loaded.wait(config.WORKER_POOL['heartbeat_interval_s'])
+
+    loading_heartbeats= threading.Thread(target= send_loading_heartbeats, name= "loading-heartbeat", daemon= True)
+    loading_heartbeats.start()
+    try:
+        # Every worker loads its own copy of the models, and warms them up before reporting as ready
+        ai_model, cascade_model= load_models()
+    finally:
+        # No loading heartbeat may arrive after the first ready one
+        loaded.set()
+        loading_heartbeats.join()
+
+    # Count processed images for the heartbeats
+    processed = 0
+    def on_batch(batch_size: int):
+        nonlocal processed
+        processed += batch_size
+
+    result_cache= ResultCache(redis_client= redis_store) if config.RESULT_CACHE['enabled'] else None
+    process_image= ProcessImage(redis_storage= redis_store, ai_model_object= ai_model.get_model(),
+                                queue_name= config.REDIS_SERVER['in_queue'], on_batch= on_batch, result_cache= result_cache,
+                                redis_blocking= redis_blocking, cascade_model_object= cascade_model.get_model() if cascade_model else None,
+                                consumer_name= f"{config.REDIS_STREAM['consumer_name']}:{worker_index}")
+
+    async def send_heartbeats():
+        while True:
+            WorkerPool.report(status_queue, worker_index, status= "ready", processed= processed, metrics= REGISTRY.snapshot())
+            await asyncio.sleep(config.WORKER_POOL['heartbeat_interval_s'])
+
+    heartbeat_task= asyncio.create_task(send_heartbeats())
+    try:
+        await process_image.fetch_and_process_images()
+    finally:
+        heartbeat_task.cancel()
+        await RedisManager.close_connection(redis_storage= redis_store)
+        await RedisManager.close_connection(redis_storage= redis_blocking)
+
+
+def run_worker(worker_index: int, status_queue):
+    """
+    Entry point of a pool worker process
+    """
+    asyncio.run(run_worker_loop(worker_index, status_queue))
+
+
+async def sample_metrics(redis_store, processed_total):
+    """
+    Sample queue depth and throughput periodically, so scrapes never touch redis
+
+    Parameters:
+        redis_store: Redis connection object
+        processed_total: Callable returning the number of images processed so far
+    """
+    last_sample = None
+    while True:
+        try:
+            QUEUE_DEPTH.set(await RedisManager.queue_depth(redis_store))
+
+            now, processed = time.monotonic(), processed_total()
+            if last_sample:
+                # Restarted pool workers start counting from zero again
+                IMAGES_PER_SECOND.set(max(processed - last_sample[1], 0) / (now - last_sample[0]))
+            last_sample = (now, processed)
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as e:
+            logger.error(f"Error while sampling metrics: {str(e)}")
+
+        await asyncio.sleep(config.METRICS['sample_interval_s'])
+
 
 # This will store any background tasks we need to track
 background_tasks = []
@@ -197,28 +917,67 @@ async def lifespan(app: FastAPI):
     logger.info(f"Starting up Ai Model server for {config.APP_NAME}... ")
 
     # Donwload the model
-    logging.info(msg=f"Checking if model file is present or else it will be downloaded automatically...")
-    Model.download_model(model_path= config.MODEL["model_path"], model_url= config.MODEL["model_url"])
+    if config.MODEL['runtime'] != "stub":
+        logging.info(msg=f"Checking if model file is present or else it will be downloaded automatically...")
+        Model.download_model(model_path= config.MODEL["model_path"], model_url= config.MODEL["model_url"], sha256= config.MODEL["sha256"])
+        if config.CASCADE['enabled']:
+            Model.download_model(model_path= config.CASCADE["model_path"], model_url= config.CASCADE["model_url"], sha256= config.CASCADE["sha256"])
 
     # Initialize redis connection object and store it in app.state to make it accessible globally
     redis_store= await RedisManager.connect(db=config.REDIS_SERVER['db_store'])
+    worker_pool= None
+    redis_blocking= None
 
     # Initialize model object and process image object if connection to redis is successful
     try:
         if not redis_store:
             raise Exception("Cannot start app server without a valid redis connection.")
 
-        # Initialize Ai Model and store it in app.state to make it accessible globally
-        ai_model= AiModel(model_path= config.MODEL['model_path'])
+        # Make sure the consumer group exists on the stream of every priority class before reading from them
+        if config.REDIS_SERVER['transport'] == "stream":
+            for priority in config.PRIORITY['classes']:
+                await RedisManager.ensure_consumer_group(redis_store, RedisManager.queue_key(priority), config.REDIS_STREAM['consumer_group'])
+
+        if config.WORKER_POOL['num_workers'] > 0:
+            # Run inference in a pool of worker processes, each with its own model
+            worker_pool= WorkerPool(target= run_worker,
+                                    num_workers= config.WORKER_POOL['num_workers'],
+                                    threads_per_worker= config.WORKER_POOL['threads_per_worker'],
+                                    pin_cpus= config.WORKER_POOL['pin_cpus'])
+            worker_pool.start()
+
+            # Restart crashed or hung workers in background
+            task= asyncio.create_task(worker_pool.supervise(interval= config.WORKER_POOL['supervise_interval_s'],
+                                                            heartbeat_timeout= config.WORKER_POOL['heartbeat_timeout_s']))
+            processed_total= lambda: sum(worker.get("processed", 0) for worker in worker_pool.health())
+            ai_model, cascade_model= None, None
+        else:
+            # Initialize Ai Model and store it in app.state to make it accessible globally
+            ai_model, cascade_model= load_models()
 
-        # Initialize ProcessImage class object
-        process_image= ProcessImage(redis_storage= redis_store, ai_model_object= ai_model.get_model(), queue_name= config.REDIS_SERVER['in_queue'])
+            # Blocking reads of the queue get their own connection pool
+            redis_blocking= await RedisManager.connect(db=config.REDIS_SERVER['db_store'], blocking= True)
+            if not redis_blocking:
+                raise Exception("Cannot start app server without a valid redis connection.")
 
-        # Run process image infinite loop in background
-        task= asyncio.create_task(process_image.fetch_and_process_images())
+            # Initialize ProcessImage class object
+            result_cache= ResultCache(redis_client= redis_store) if config.RESULT_CACHE['enabled'] else None
+            process_image= ProcessImage(redis_storage= redis_store, ai_model_object= ai_model.get_model(), queue_name= config.REDIS_SERVER['in_queue'],
+                                        result_cache= result_cache, redis_blocking= redis_blocking,
+                                        cascade_model_object= cascade_model.get_model() if cascade_model else None)
 
-        # Add the task to our list of background tasks
+            # Run process image infinite loop in background
+            task= asyncio.create_task(process_image.fetch_and_process_images())
+            processed_total= IMAGES_PROCESSED.total
+
+        # Add the tasks to our list of background tasks
         background_tasks.append(task)
+        background_tasks.append(asyncio.create_task(sample_metrics(redis_store, processed_total)))
+        app.state.worker_pool= worker_pool
+        app.state.ai_model= ai_model
+        app.state.cascade_model= cascade_model
+        app.state.loop_profiler= LoopProfiler()
+        app.state.redis_store= redis_store
 
         # Yield control back to FastAPI (it will start handling requests now)
         yield
@@ -234,10 +993,15 @@ async def lifespan(app: FastAPI):
                 await task
             except asyncio.CancelledError:
                 logger.info(f"Background task {task} was cancelled.")
-    
 
-        # Close the redis connection
+        # Stop the worker processes
+        if worker_pool:
+            await asyncio.to_thread(worker_pool.stop)
+
+        # Close the redis connections
         await RedisManager.close_connection(redis_storage= redis_store)
+        if redis_blocking:
+            await RedisManager.close_connection(redis_storage= redis_blocking)
         logger.info("Ai Model server is shutting down...")
 
     except Exception as e:
@@ -247,12 +1011,92 @@ async def lifespan(app: FastAPI):
 # FastAPI app initialization with lifespan
 app = FastAPI(lifespan=lifespan)
 
-# Example route that uses the initialized class object
 @app.get("/status")
 async def get_status():
-    # Access the class instance from app.state
-    service = app.state.ai_model
-    return {"status": service.get_status()}
+    """
+    Get the status of the model, or of the worker pool when inference runs in worker processes
+    """
+    worker_pool = app.state.worker_pool
+    if worker_pool is not None:
+        workers = worker_pool.health()
+        return {"status": "running" if all(worker["alive"] for worker in workers) else "degraded", "mode": "pool",
+                "workers_alive": sum(worker["alive"] for worker in workers), "num_workers": len(workers)}
+
+    status = {"status": app.state.ai_model.get_status(), "mode": "in-process"}
+    if app.state.cascade_model is not None:
+        status["cascade_status"] = app.state.cascade_model.get_status()
+    return status
+
+@app.get("/ready")
+async def get_ready():
+    """
+    Readiness probe, 200 once a warmed up model can take images off the queue and redis answers, 503 otherwise
+    """
+    worker_pool = app.state.worker_pool
+    if worker_pool is not None:
+        workers_ready = sum(worker["alive"] and worker["status"] == "ready" for worker in worker_pool.health())
+        model_ready = workers_ready > 0
+        detail = {"mode": "pool", "workers_ready": workers_ready, "num_workers": worker_pool.num_workers}
+    else:
+        model_ready = app.state.ai_model.ready and (app.state.cascade_model is None or app.state.cascade_model.ready)
+        detail = {"mode": "in-process"}
+
+    try:
+        redis_ready = bool(await app.state.redis_store.ping())
+    except Exception as e:
+        logger.warning(f"Readiness check cannot reach redis: {str(e)}")
+        redis_ready = False
+
+    ready = model_ready and redis_ready
+    return JSONResponse(content={"ready": ready, "model_ready": model_ready, "redis_ready": redis_ready, **detail},
+                        status_code= 200 if ready else 503)
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Metrics in the Prometheus text format, worker pool metrics are labelled with the worker index
+    """
+    worker_pool = app.state.worker_pool
+    extra_snapshots = worker_pool.metrics_snapshots() if worker_pool is not None else []
+    return PlainTextResponse(content= REGISTRY.render(extra_snapshots), media_type= "text/plain; version=0.0.4")
+
+@app.post("/admin/profile")
+async def profile_worker(seconds: float = Query(10, gt=0, le=config.PROFILING['max_seconds']),
+                         profiler: str = Query("cprofile", pattern="^(cprofile|pyinstrument)$"),
+                         sort: str = Query("cumulative", pattern="^(cumulative|tottime|ncalls)$"),
+                         top_n: int = Query(config.PROFILING['top_n'], ge=1, le=500)):
+    """
+    Profile the image worker loop for a while and return the report as text, when ADMIN_PROFILING is enabled
+
+    Parameters:
+        seconds: How long to profile, the request returns once the profile is done
+        profiler: "cprofile" or "pyinstrument" (sampling, needs the pyinstrument package)
+        sort: Sort key of the cProfile report
+        top_n: Functions listed by the cProfile report
+    """
+    if not config.PROFILING['enabled']:
+        return JSONResponse(content={"error": "Profiling is disabled, set ADMIN_PROFILING=true"}, status_code=403)
+    if app.state.worker_pool is not None:
+        return JSONResponse(content={"error": "Inference runs in worker processes, profiling needs the in-process mode"}, status_code=409)
+
+    try:
+        report = await app.state.loop_profiler.profile(seconds= seconds, profiler= profiler, sort= sort, top_n= top_n)
+    except ProfilerBusy as e:
+        return JSONResponse(content={"error": str(e)}, status_code=409)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    return PlainTextResponse(content= report)
+
+@app.get("/workers")
+async def get_workers():
+    """
+    Get the health of every inference worker process
+    """
+    worker_pool = app.state.worker_pool
+    if worker_pool is None:
+        return JSONResponse(content={"mode": "in-process", "workers": []}, status_code=200)
+    return JSONResponse(content={"mode": "pool", "workers": worker_pool.health()}, status_code=200)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host= config.INFERENCE_SERVER['host'], port= config.INFERENCE_SERVER['port'])
\ No newline at end of file
+    # Keep the logging setup of utils.logging_config, so server and access logs go through the same handlers
+    uvicorn.run(app, host= config.INFERENCE_SERVER['host'], port= config.INFERENCE_SERVER['port'], log_config= None)
\ No newline at end of file
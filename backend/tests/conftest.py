@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Import the modules the way the service does ("from config import config"), from the service directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,52 @@
+import pytest
+from utils.scheduler import PriorityScheduler
+
+CLASSES = ["interactive", "bulk"]
+
+
+def test_weighted_shares():
+    scheduler = PriorityScheduler(classes= CLASSES, weights= {"interactive": 4, "bulk": 1}, policy= "weighted")
+
+    assert scheduler.quotas(10) == {"interactive": 8, "bulk": 2}
+    assert scheduler.quotas(100) == {"interactive": 80, "bulk": 20}
+
+
+def test_weighted_shares_carry_over_between_batches():
+    scheduler = PriorityScheduler(classes= CLASSES, weights= {"interactive": 4, "bulk": 1}, policy= "weighted")
+
+    # Batches of one slot still give the low priority class its share, instead of starving it
+    served = [next(priority for priority, quota in scheduler.quotas(1).items() if quota) for _ in range(10)]
+    assert served.count("interactive") == 8
+    assert served.count("bulk") == 2
+
+    # Smooth round robin spreads the bulk slots evenly instead of serving them back to back
+    assert [index for index, priority in enumerate(served) if priority == "bulk"] == [2, 7]
+
+
+@pytest.mark.parametrize("slots", [0, 1, 3, 7, 32])
+def test_weighted_quotas_fill_the_batch(slots):
+    scheduler = PriorityScheduler(classes= ["interactive", "normal", "bulk"], weights= {"interactive": 5, "normal": 2, "bulk": 1}, policy= "weighted")
+
+    quotas = scheduler.quotas(slots)
+    assert list(quotas) == ["interactive", "normal", "bulk"]
+    assert sum(quotas.values()) == slots
+
+
+def test_missing_and_zero_weights_count_as_one():
+    scheduler = PriorityScheduler(classes= CLASSES, weights= {"interactive": 0}, policy= "weighted")
+
+    assert scheduler.weights == {"interactive": 1, "bulk": 1}
+    assert scheduler.quotas(10) == {"interactive": 5, "bulk": 5}
+
+
+def test_strict_order():
+    scheduler = PriorityScheduler(classes= ["interactive", "normal", "bulk"], weights= {"interactive": 1, "bulk": 100}, policy= "strict")
+
+    # Weights do not matter, every slot goes to the highest class first and leftovers are handed on by the fetch loop
+    for _ in range(3):
+        assert scheduler.quotas(8) == {"interactive": 8, "normal": 0, "bulk": 0}
+
+
+def test_unsupported_policy():
+    with pytest.raises(ValueError):
+        PriorityScheduler(classes= CLASSES, weights= {}, policy= "fifo")
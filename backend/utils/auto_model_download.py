@@ -1,5 +1,8 @@
 import os
+import fcntl
+import hashlib
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from utils import logging_config
 import logging
 from config import config
@@ -12,23 +15,181 @@ class Model:
     Class to download the model file
     """
     @staticmethod
-    def download_model(model_path, model_url):
-        """
-        Download the model file
-        """
-        # Check if file exists
-        if not os.path.exists(model_path):
-            logging.info(msg=f"Downloading model file from {config.MODEL['model_url']} to {config.MODEL['model_path']}...")
-
-            # Download the file
-            response = requests.get(model_url, stream=True)
-            if response.status_code == 200:
-                with open(model_path, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=1024):
-                        if chunk:
-                            f.write(chunk)
-                logging.info(msg=f"Download complete: {model_path}")
+    def download_model(model_path, model_url, **kwargs):
+        """
+        Download the model file unless a verified copy exists, serialized with a lock file so replicas sharing
+        the model volume do not write the same part files
+
+        Parameters:
+            model_path: Location of the model file
+            model_url: URL of the model file
+            kwargs: Options of Model._download_model
+        """
+        model_dir = os.path.dirname(model_path)
+        if model_dir:
+            os.makedirs(model_dir, exist_ok= True)
+
+        with open(model_path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                Model._download_model(model_path, model_url, **kwargs)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _download_model(model_path, model_url, sha256: str = None,
+                       num_segments: int = config.MODEL_DOWNLOAD['num_segments'], chunk_size: int = config.MODEL_DOWNLOAD['chunk_size']):
+        """
+        Download the model file, in parallel HTTP range requests when the server supports them
+
+        Segments are written to model_path.partN files, so an interrupted download resumes where it stopped.
+        The assembled file is checked against the expected SHA-256 before it is atomically renamed to model_path,
+        and the digest is recorded in model_path.sha256 to verify the file on later starts.
+
+        Parameters:
+            model_path: Location of the model file
+            model_url: URL of the model file
+            sha256: Expected SHA-256 of the model file, without it the digest recorded by a previous download is used
+            num_segments: Number of parallel range requests, 1 downloads in a single stream
+            chunk_size: Size of the chunks streamed to disk
+        """
+        sidecar_path = model_path + ".sha256"
+        if not sha256 and os.path.exists(sidecar_path):
+            with open(sidecar_path) as f:
+                sha256 = f.read().strip()
+        if not sha256:
+            logger.warning(msg=f"No pinned SHA-256 for {model_path}, the file is only checked against the remote size and its digest is trusted from now on")
+
+        with requests.Session() as session:
+            # Check if file exists and is the expected one, a truncated or corrupt file is downloaded again
+            if os.path.exists(model_path):
+                if sha256:
+                    if Model.file_sha256(model_path, chunk_size) == sha256.lower():
+                        logging.info(f"{model_path} already exists and matches its checksum.")
+                        return
+                    logger.warning(msg=f"{model_path} does not match its checksum, downloading it again...")
+                else:
+                    # No checksum yet, e.g. a file left by an older release, at least compare the size with the remote file
+                    try:
+                        _, size, _ = Model._probe(session, model_url)
+                    except requests.RequestException as e:
+                        logger.warning(msg=f"{model_path} already exists, cannot reach {model_url} to check its size: {e}")
+                        return
+                    if size in (0, os.path.getsize(model_path)):
+                        logging.info(f"{model_path} already exists and matches the remote size.")
+                        with open(sidecar_path, "w") as f:
+                            f.write(Model.file_sha256(model_path, chunk_size))
+                        return
+                    logger.warning(msg=f"{model_path} is {os.path.getsize(model_path)} bytes instead of {size}, downloading it again...")
+                os.remove(model_path)
+
+            logging.info(msg=f"Downloading model file from {model_url} to {model_path}...")
+            url, size, accepts_ranges = Model._probe(session, model_url)
+
+            # Split the file in contiguous segments, fetched in parallel
+            if not accepts_ranges:
+                segments = [(0, None)]
             else:
-                logging.info(msg=f"Failed to download file. Status code: {response.status_code}")
-        else:
-            logging.info(f"{model_path} already exists at {model_path}.")
\ No newline at end of file
+                num_segments = max(1, min(num_segments, size // chunk_size or 1))
+                bounds = [size * index // num_segments for index in range(num_segments + 1)]
+                segments = [(bounds[index], bounds[index + 1] - 1) for index in range(num_segments)]
+            part_paths = [f"{model_path}.part{index}" for index in range(len(segments))]
+
+            # Failed segments are retried from where they stopped
+            retries = config.MODEL_DOWNLOAD['retries']
+            for attempt in range(1, retries + 1):
+                try:
+                    with ThreadPoolExecutor(max_workers= len(segments)) as executor:
+                        list(executor.map(lambda args: Model._download_segment(session, url, *args, chunk_size= chunk_size, resumable= accepts_ranges),
+                                          [(part_path, start, end) for part_path, (start, end) in zip(part_paths, segments)]))
+                    break
+                except requests.RequestException as e:
+                    if attempt == retries:
+                        raise
+                    logger.warning(msg=f"Model download interrupted (attempt {attempt}/{retries}): {e}, resuming...")
+
+        # Assemble the segments in a temporary file, hashing on the way
+        tmp_path = model_path + ".tmp"
+        hasher = hashlib.sha256()
+        with open(tmp_path, "wb") as f:
+            for part_path in part_paths:
+                with open(part_path, "rb") as part:
+                    while chunk := part.read(chunk_size):
+                        hasher.update(chunk)
+                        f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+        digest = hasher.hexdigest()
+        downloaded = os.path.getsize(tmp_path)
+        for part_path in part_paths:
+            os.remove(part_path)
+
+        if (accepts_ranges and downloaded != size) or (sha256 and digest != sha256.lower()):
+            os.remove(tmp_path)
+            raise ValueError(f"Downloaded model file is corrupt: {downloaded} bytes with SHA-256 {digest}, "
+                             f"expected {size if accepts_ranges else 'any'} bytes with SHA-256 {sha256 or 'any'}")
+
+        # Readers only ever see the complete file
+        os.replace(tmp_path, model_path)
+        with open(sidecar_path, "w") as f:
+            f.write(digest)
+        logging.info(msg=f"Download complete: {model_path}, SHA-256 {digest}")
+
+    @staticmethod
+    def _probe(session, model_url: str) -> tuple:
+        """
+        Resolve redirects and check if the server accepts range requests, with a one byte range request since
+        presigned asset URLs often refuse HEAD
+
+        Parameters:
+            session: HTTP session
+            model_url: URL of the model file
+        Returns:
+            Final URL, size of the file (0 when unknown) and whether range requests are accepted
+        """
+        with session.get(model_url, headers= {"Range": "bytes=0-0"}, stream= True, timeout= config.MODEL_DOWNLOAD['timeout_s']) as response:
+            response.raise_for_status()
+            total = response.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+            if response.status_code == 206 and total.isdigit():
+                return response.url, int(total), True
+            return response.url, int(response.headers.get("Content-Length", 0)), False
+
+    @staticmethod
+    def _download_segment(session, url: str, part_path: str, start: int, end: int, chunk_size: int, resumable: bool):
+        """
+        Download the bytes start..end (inclusive, end None for the whole file) to a part file, resuming a partial one
+
+        Parameters:
+            session: HTTP session shared by the segments
+            url: URL of the model file
+            part_path: File the segment is written to
+            start: First byte of the segment
+            end: Last byte of the segment
+            chunk_size: Size of the chunks streamed to disk
+            resumable: The server accepts range requests, so existing bytes of the part file are kept
+        """
+        done = os.path.getsize(part_path) if resumable and os.path.exists(part_path) else 0
+        if end is not None and start + done > end:
+            return
+
+        headers = {"Range": f"bytes={start + done}-{end}"} if resumable else {}
+        with session.get(url, headers= headers, stream= True, timeout= config.MODEL_DOWNLOAD['timeout_s']) as response:
+            response.raise_for_status()
+            if resumable and response.status_code != 206:
+                raise ValueError(f"Server ignored the range request for bytes {start + done}-{end}")
+
+            with open(part_path, "ab" if done else "wb") as f:
+                for chunk in response.iter_content(chunk_size= chunk_size):
+                    f.write(chunk)
+
+    @staticmethod
+    def file_sha256(path: str, chunk_size: int = config.MODEL_DOWNLOAD['chunk_size']) -> str:
+        """
+        SHA-256 of a file, read in chunks
+        """
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                hasher.update(chunk)
+        return hasher.hexdigest()
@@ -1,47 +1,139 @@
-import logging
 import os
-import logging.config
-
-# Define log directory and log file path
-log_directory = "log"
-log_file_path = os.path.join(log_directory, "app.log")
-
-# Ensure the log directory exists
-os.makedirs(log_directory, exist_ok=True)
-
-# Clear (truncate) the log file on application restart
-with open(log_file_path, 'w'):
-    pass
-
-# Logging configuration
-LOGGING_CONFIG = {
-    "version": 1,
-    "disable_existing_loggers": False,
-    "formatters": {
-        "default": {
-            "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        },
-    },
-    "handlers": {
-        "console": {
-            "class": "logging.StreamHandler",
-            "formatter": "default",
-        },
-        "file": {
-            "class": "logging.FileHandler",
-            "filename": log_file_path,  # Dynamically set log file path
-            "formatter": "default",
-        },
-    },
-    "root": {
-        "level": "INFO",
-        "handlers": ["console", "file"],
-    },
-}
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+import multiprocessing
+from config import config
+
+"""
+Logging setup shared by all modules, applied once on first import
+
+In "queue" mode loggers only put records on an in-memory queue. A QueueListener thread formats them and writes
+them to the console and the log file, so a slow terminal or disk never stalls the event loop.
+Per-image messages go through log_sampled, which logs a sample of them at INFO and the rest at DEBUG.
+"""
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Listener thread of the "queue" mode, None in "sync" mode
+listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage(), "process": record.process, "thread": record.threadName}
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler for a listener in the same process
+
+    Records are not pickled, so only the message is merged with its arguments here and
+    formatting, tracebacks included, is left to the listener thread.
+    Records are dropped, and counted, when the queue is full instead of blocking the caller.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg  = record.getMessage()
+        record.args = None
+        return record
+
+
+class LocalQueueListener(logging.handlers.QueueListener):
+    """
+    Queue listener that waits for room in a full queue to signal the end of the records when it is stopped
+    """
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def setup(settings: dict = config.LOGGING):
+    """
+    Configure the root logger
+
+    :param settings: Logging settings, see config.LOGGING
+    """
+    global listener
+
+    formatter = JsonFormatter() if settings['json'] else logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if settings['file_path']:
+        # Ensure the log directory exists
+        log_directory = os.path.dirname(settings['file_path'])
+        if log_directory:
+            os.makedirs(log_directory, exist_ok= True)
+
+        # Clear the log file on restart if asked to, but not when a worker process is spawned
+        truncate = settings['truncate'] and multiprocessing.parent_process() is None
+        handlers.append(logging.FileHandler(settings['file_path'], mode= "w" if truncate else "a"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # Replace the handlers of a previous setup
+    stop()
+    root = logging.getLogger()
+    root.setLevel(settings['level'].upper())
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+    if settings['mode'] == "queue":
+        log_queue = queue.Queue(maxsize= settings['queue_size'])
+        listener = LocalQueueListener(log_queue, *handlers, respect_handler_level= True)
+        listener.start()
+        root.addHandler(LocalQueueHandler(log_queue))
+    else:
+        for handler in handlers:
+            root.addHandler(handler)
+
+
+def stop():
+    """
+    Write the records still queued and stop the listener thread, called when the process exits
+    """
+    global listener
+    if listener:
+        listener.stop()
+        listener = None
+
+
+def log_sampled(logger: logging.Logger, msg: str, *args, sample_rate: float = config.LOGGING['sample_rate']):
+    """
+    Log a per-image message at INFO for a sample of the calls and at DEBUG for the others
+
+    Arguments are only merged into the message when the record is emitted, so skipped messages cost a level check.
+
+    :param logger: Logger of the calling module
+    :param msg: Message, with %-style placeholders for args
+    :param sample_rate: Share of the calls logged at INFO
+    """
+    if sample_rate and random.random() < sample_rate:
+        logger.info(msg, *args)
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug(msg, *args)
+
 
 # Set up logging configuration
-logging.config.dictConfig(LOGGING_CONFIG)
+setup()
+atexit.register(stop)
 
-# Example usage
 logger = logging.getLogger(__name__)
 logger.info("Application started. Logging is set up.")
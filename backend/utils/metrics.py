@@ -0,0 +1,167 @@
+import math
+import threading
+
+# Default histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metric:
+    """
+    Base class of the metrics, values are kept per tuple of label values
+
+    Parameters:
+        name: Metric name
+        help: Description shown in the exposition
+        labelnames: Names of the labels of the metric
+    """
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name       = name
+        self.help       = help
+        self.labelnames = tuple(labelnames)
+        self.values     = {}
+        self.lock       = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[labelname]) for labelname in self.labelnames)
+
+    def snapshot(self) -> dict:
+        """
+        Picklable copy of the metric, used to ship metrics out of worker processes
+        """
+        with self.lock:
+            values = [(key, list(value) if isinstance(value, list) else value) for key, value in self.values.items()]
+        return {"type": self.type, "help": self.help, "labelnames": self.labelnames, "values": values}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self) -> float:
+        with self.lock:
+            return sum(self.values.values())
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            # Per bucket counts followed by the +Inf count and the sum
+            state = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "buckets": self.buckets}
+
+
+class MetricsRegistry:
+    """
+    Registry of the metrics of a process, rendered in the Prometheus text exposition format
+    """
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self) -> dict:
+        """
+        Picklable copy of all metrics
+        """
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def render(self, extra_snapshots: list = ()) -> str:
+        """
+        Render the metrics of this process and of other processes
+
+        :param extra_snapshots: List of (constant labels, snapshot) of other processes, e.g. ({"worker": "0"}, snapshot)
+        :return: Metrics in the Prometheus text format
+        """
+        sources = [({}, self.snapshot())] + list(extra_snapshots)
+
+        lines = []
+        for name in dict.fromkeys(name for _, snapshot in sources for name in snapshot):
+            family = next(snapshot[name] for _, snapshot in sources if name in snapshot)
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+
+            for const_labels, snapshot in sources:
+                metric = snapshot.get(name)
+                if metric is None:
+                    continue
+                for key, value in metric["values"]:
+                    labels = {**dict(zip(metric["labelnames"], key)), **const_labels}
+                    if metric["type"] == "histogram":
+                        lines.extend(self._render_histogram(name, labels, metric["buckets"], value))
+                    else:
+                        lines.append(f"{name}{self._labels(labels)} {self._number(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(name: str, labels: dict, buckets: tuple, state: list) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(buckets) + [math.inf], state[:-1]):
+            cumulative += count
+            lines.append(f"{name}_bucket{MetricsRegistry._labels({**labels, 'le': MetricsRegistry._number(bound)})} {cumulative}")
+        lines.append(f"{name}_sum{MetricsRegistry._labels(labels)} {MetricsRegistry._number(state[-1])}")
+        lines.append(f"{name}_count{MetricsRegistry._labels(labels)} {cumulative}")
+        return lines
+
+    @staticmethod
+    def _labels(labels: dict) -> str:
+        if not labels:
+            return ""
+        escaped = (f'{key}="{MetricsRegistry._escape(value)}"' for key, value in labels.items())
+        return "{" + ",".join(escaped) + "}"
+
+    @staticmethod
+    def _escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @staticmethod
+    def _number(value: float) -> str:
+        if value == math.inf:
+            return "+Inf"
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Registry of this process
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,92 @@
+import numpy as np
+from config import config as cfg
+
+
+class DogClassifier:
+    """
+    Vectorized dog detection over the class probabilities of a whole batch
+
+    Parameters:
+        dog_class_ids: Class ids of the dog breeds
+        conf_threshold: Minimum confidence for an image to count as a dog
+        decision: "top1" checks the top-1 class and its confidence, "sum" the summed probability of all dog breeds
+    """
+    def __init__(self, dog_class_ids: list = cfg.DOG_BREEDS, conf_threshold: float = cfg.MODEL_PARAMETERS['conf_threshold'],
+                 decision: str = cfg.MODEL_PARAMETERS['dog_decision']):
+        if decision not in ("top1", "sum"):
+            raise ValueError(f"Unsupported dog decision: {decision}")
+
+        self.dog_class_ids  = np.asarray(dog_class_ids, dtype= np.int64)
+        self.conf_threshold = conf_threshold
+        self.decision       = decision
+
+        # Boolean mask over the classes, built for the class count of the first batch
+        self.dog_mask = None
+
+    @staticmethod
+    def stack_probs(predictions: list) -> np.ndarray:
+        """
+        Stack the raw probability tensors of a batch of predictions into one (batch, classes) array
+
+        Only the underlying tensor of every result is touched, none of the per-image top-k properties
+        """
+        data = [prediction.probs.data for prediction in predictions]
+
+        # Torch runtimes return tensors, one stack and one device copy for the whole batch
+        if hasattr(data[0], "cpu"):
+            import torch
+            return torch.stack(data).float().cpu().numpy()
+        return np.stack(data).astype(np.float32, copy= False)
+
+    def summarize(self, probs: np.ndarray) -> dict:
+        """
+        Summarize a batch of class probabilities in one vectorized pass
+
+        :param probs: Class probabilities with shape (batch, classes)
+        :return: Arrays of top-1 class, top-1 confidence, summed dog probability, dog confidence and the dog decision
+        """
+        if self.dog_mask is None or self.dog_mask.shape[0] != probs.shape[1]:
+            self.dog_mask = np.zeros(probs.shape[1], dtype= bool)
+            self.dog_mask[self.dog_class_ids] = True
+
+        top1 = probs.argmax(axis= 1)
+        top1_conf = probs[np.arange(probs.shape[0]), top1]
+        dog_prob = probs @ self.dog_mask.astype(probs.dtype)
+
+        # Dog confidence, the score the decision compares with the threshold. With "top1" it is the top-1 confidence
+        # when the top-1 class is a dog breed, else the probability of the dog breeds, how close the image came to one
+        if self.decision == "sum":
+            dog_conf = dog_prob
+            has_dog = dog_prob >= self.conf_threshold
+        else:
+            dog_conf = np.where(self.dog_mask[top1], top1_conf, dog_prob)
+            has_dog = self.dog_mask[top1] & (top1_conf >= self.conf_threshold)
+
+        return {"top1": top1, "top1_conf": top1_conf, "dog_prob": dog_prob, "dog_conf": dog_conf, "has_dog": has_dog}
+
+    @staticmethod
+    def uncertain(summary: dict, band: tuple) -> np.ndarray:
+        """
+        Indices of the images of a batch whose dog confidence falls within the uncertainty band
+
+        :param summary: Summary of the batch from summarize
+        :param band: (low, high) dog confidences, both inclusive
+        """
+        low, high = band
+        return np.flatnonzero((summary["dog_conf"] >= low) & (summary["dog_conf"] <= high))
+
+    @staticmethod
+    def labels(has_dog) -> list:
+        """
+        Dog decisions in the format stored with the results, "true" if a dog is found else "null"
+        """
+        return ["true" if value else "null" for value in has_dog]
+
+    def has_dog(self, predictions: list) -> list:
+        """
+        Dog decision of every prediction of a batch, in the format stored with the results
+
+        :param predictions: Ultralytics classification results of a batch
+        :return: "true" if a dog is found else "null", for every image
+        """
+        return self.labels(self.summarize(self.stack_probs(predictions))["has_dog"])
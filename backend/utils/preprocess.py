@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+from config import config as cfg
+
+
+class ImagePreprocessor:
+    """
+    Decoding and resizing of images before inference, shared by the queue worker and offline scoring
+    """
+    @staticmethod
+    def decode(image_bytes) -> np.ndarray:
+        """
+        Decode image bytes to a BGR image
+
+        :param image_bytes: Encoded image
+        :return: BGR image, None if it cannot be decoded
+        """
+        return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+    @staticmethod
+    def resize(image: np.ndarray, img_size: int = cfg.MODEL_PARAMETERS['img_size']) -> np.ndarray:
+        """
+        Shrink the shorter side to the model input size, so the model only has to crop
+
+        :param image: Decoded BGR image
+        :param img_size: Model input size
+        :return: Resized image, smaller images are returned as they are
+        """
+        height, width = image.shape[:2]
+        scale = img_size / min(height, width)
+        if scale < 1:
+            image = cv2.resize(image, (max(img_size, round(width * scale)), max(img_size, round(height * scale))), interpolation= cv2.INTER_AREA)
+        return image
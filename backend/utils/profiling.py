@@ -0,0 +1,66 @@
+import io
+import asyncio
+import cProfile
+import pstats
+
+# pyinstrument is an optional dependency, cProfile is always available
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+
+class ProfilerBusy(Exception):
+    """
+    A profile is already running, the profilers of a thread cannot be stacked
+    """
+
+
+class LoopProfiler:
+    """
+    Profile the event loop thread, where the stages of the image worker run, for a while
+
+    Only the loop thread is profiled: decode and inference threads show as the time the stages await them.
+    """
+    def __init__(self):
+        self.lock = asyncio.Lock()
+
+    async def profile(self, seconds: float, profiler: str = "cprofile", sort: str = "cumulative", top_n: int = 40) -> str:
+        """
+        Profile the loop for seconds and return the report as text
+
+        :param seconds: How long to profile
+        :param profiler: "cprofile" (deterministic, every call) or "pyinstrument" (sampling, lower overhead)
+        :param sort: Sort key of the cProfile report
+        :param top_n: Functions listed by the cProfile report
+        :return: Text report
+        """
+        if self.lock.locked():
+            raise ProfilerBusy("A profile is already running")
+
+        async with self.lock:
+            if profiler == "pyinstrument":
+                if SamplingProfiler is None:
+                    raise ValueError("pyinstrument profiling requested but the pyinstrument package is not installed")
+                # Sample the whole thread, not only the awaiting task
+                sampler = SamplingProfiler(async_mode= "disabled")
+                sampler.start()
+                try:
+                    await asyncio.sleep(seconds)
+                finally:
+                    sampler.stop()
+                return sampler.output_text(unicode= False, color= False)
+
+            if profiler != "cprofile":
+                raise ValueError(f"Unsupported profiler: {profiler}")
+
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+
+            stream = io.StringIO()
+            pstats.Stats(profile, stream= stream).sort_stats(sort).print_stats(top_n)
+            return stream.getvalue()
@@ -1,6 +1,10 @@
 import redis
 from config import config as cfg
 import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ResponseError, ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from redis.utils import HIREDIS_AVAILABLE
 import asyncio
 import sys
 from utils import logging_config
@@ -12,16 +16,41 @@ logger = logging.getLogger(__name__)
 class RedisManager:
 
     @staticmethod
-    async def connect(db:int):
+    def retry_policy() -> Retry:
+        """
+        Retry policy of commands failing on connection errors, with exponential backoff
+        """
+        return Retry(backoff= ExponentialBackoff(cap= cfg.REDIS_POOL['backoff_cap_s'], base= cfg.REDIS_POOL['backoff_base_s']),
+                     retries= cfg.REDIS_POOL['retry_attempts'])
+
+    @staticmethod
+    async def connect(db:int, blocking: bool = False):
+        """
+        Connect to the redis server with an explicitly sized connection pool
+
+        :param db: Redis database number
+        :param blocking: Client dedicated to blocking reads of the queue, without a socket timeout so BLPOP / XREADGROUP BLOCK
+                         can wait indefinitely, and kept apart from the client used for result writes
+        """
         try:
-            # Connect to redis server
-            logger.info(msg= f"Setting up redis server for db: {db}...")
-            redis_storage = await redis.from_url(cfg.REDIS_SERVER['client'] + ":" + "//" + cfg.REDIS_SERVER['host'] + ":" + str(cfg.REDIS_SERVER['port']) + "/" + str(db))
+            # Connect to redis server, replies are parsed by hiredis when it is installed
+            max_connections = cfg.REDIS_POOL['blocking_max_connections'] if blocking else cfg.REDIS_POOL['max_connections']
+            logger.info(msg= f"Setting up {'blocking ' if blocking else ''}redis server for db: {db}, pool size: {max_connections}, hiredis parser: {HIREDIS_AVAILABLE}...")
+            pool = redis.BlockingConnectionPool(host= cfg.REDIS_SERVER['host'], port= cfg.REDIS_SERVER['port'], db= db,
+                                                max_connections= max_connections,
+                                                timeout= cfg.REDIS_POOL['pool_timeout_s'],
+                                                socket_timeout= None if blocking else cfg.REDIS_POOL['socket_timeout_s'],
+                                                socket_connect_timeout= cfg.REDIS_POOL['socket_connect_timeout_s'],
+                                                socket_keepalive= True,
+                                                health_check_interval= cfg.REDIS_POOL['health_check_interval_s'],
+                                                retry= RedisManager.retry_policy(),
+                                                retry_on_error= [RedisConnectionError, RedisTimeoutError])
+            redis_storage = redis.Redis.from_pool(pool)
             logging.info(msg= f"Successfully created redis server object for db: {db}.")
 
-            # Check for redis successful connection 
+            # Check for redis successful connection, redis may still be starting up
             logger.info(msg=f"Checking connection status...")
-            await redis_storage.ping()
+            await RedisManager.wait_until_reachable(redis_storage)
            
             # Return connection object
             logger.info(msg= f"Connection successful. Returning redis connection object...")
@@ -35,6 +64,25 @@ class RedisManager:
         #     print('Connection successful, closing the connection')
         #     await redis_server.close()
 
+    @staticmethod
+    async def wait_until_reachable(redis_storage, attempts: int = cfg.REDIS_POOL['connect_attempts']):
+        """
+        Ping redis until it answers, sleeping with exponential backoff between attempts without blocking the event loop
+
+        :param redis_storage: Redis connection object
+        :param attempts: Number of pings before giving up
+        """
+        backoff = ExponentialBackoff(cap= cfg.REDIS_POOL['backoff_cap_s'], base= cfg.REDIS_POOL['backoff_base_s'])
+        for attempt in range(1, attempts + 1):
+            try:
+                return await redis_storage.ping()
+            except (RedisConnectionError, RedisTimeoutError, OSError) as e:
+                if attempt == attempts:
+                    raise
+                delay = backoff.compute(attempt)
+                logger.warning(msg= f"Redis not reachable (attempt {attempt}/{attempts}): {e}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
     async def close_connection(redis_storage):
         try:
             # Close connection to redis server
@@ -45,6 +93,67 @@ class RedisManager:
         except Exception as e:
             logger.info(msg=f"Couldn't close redis connection with error: {e}")
 
+    @staticmethod
+    async def ensure_consumer_group(redis_storage, stream_name: str, group_name: str):
+        """
+        Create the consumer group, and the stream itself, if they do not exist yet
+
+        :param redis_storage: Redis connection object
+        :param stream_name: Name of the stream to consume
+        :param group_name: Name of the consumer group shared by all backend workers
+        """
+        try:
+            await redis_storage.xgroup_create(name= stream_name, groupname= group_name, id= "0", mkstream= True)
+            logger.info(msg=f"Created consumer group {group_name} on stream {stream_name}.")
+
+        except ResponseError as e:
+            # Another worker already created the group
+            if "BUSYGROUP" not in str(e):
+                raise
+            logger.info(msg=f"Consumer group {group_name} already exists on stream {stream_name}.")
+
+    @staticmethod
+    def queue_key(priority: str = None) -> str:
+        """
+        Queue (list or stream, depending on the transport) of a priority class, the first class keeps the base name
+
+        :param priority: Priority class, None for the default class
+        """
+        base = cfg.REDIS_STREAM['stream_name'] if cfg.REDIS_SERVER['transport'] == "stream" else cfg.REDIS_SERVER['in_queue']
+        priority = priority or cfg.PRIORITY['default']
+        return base if priority == cfg.PRIORITY['classes'][0] else f"{base}:{priority}"
+
+    @staticmethod
+    async def queue_depth(redis_storage) -> int:
+        """
+        Number of images waiting in the queues of all priority classes, for streams the consumer group lag plus its pending entries
+
+        :param redis_storage: Redis connection object
+        """
+        pipe = redis_storage.pipeline(transaction= False)
+        for priority in cfg.PRIORITY['classes']:
+            if cfg.REDIS_SERVER['transport'] == "stream":
+                pipe.xinfo_groups(RedisManager.queue_key(priority))
+            else:
+                pipe.llen(RedisManager.queue_key(priority))
+        replies = await pipe.execute(raise_on_error= False)
+
+        # Streams do not exist until the first image or backend worker creates them
+        return sum(RedisManager.stream_depth(reply) if cfg.REDIS_SERVER['transport'] == "stream" else reply
+                   for reply in replies if not isinstance(reply, Exception))
+
+    @staticmethod
+    def stream_depth(groups: list) -> int:
+        """
+        Backlog of the consumer group of a stream: entries not delivered yet plus entries delivered but not acknowledged
+
+        :param groups: Reply of XINFO GROUPS
+        """
+        for group in groups:
+            name = group["name"].decode("utf-8") if isinstance(group["name"], bytes) else group["name"]
+            if name == cfg.REDIS_STREAM['consumer_group']:
+                return (group.get("lag") or 0) + group["pending"]
+        return 0
 
 # if __name__ == "__main__":
 #     asyncio.run(RedisManager.connect())
\ No newline at end of file
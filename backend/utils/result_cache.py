@@ -0,0 +1,107 @@
+import json
+import hashlib
+from config import config as cfg
+
+# Evict the oldest entries once the index grows past max entries
+TRIM_SCRIPT = """
+local excess = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[1])
+if excess > 0 then
+    local oldest = redis.call('ZPOPMIN', KEYS[1], excess)
+    for i = 1, #oldest, 2 do
+        redis.call('DEL', ARGV[2] .. oldest[i])
+    end
+end
+return excess
+"""
+
+
+class ResultCache:
+    """
+    Prediction results cached by the content hash of the uploaded image
+
+    Parameters:
+        redis_client: Redis connection object
+        key_prefix: Prefix of the cache entry keys
+        index_key: Sorted set of cached digests by insertion time, used to bound the cache size
+        ttl_s: Time to live of a cache entry in seconds
+        max_entries: Maximum number of cache entries
+    """
+    def __init__(self, redis_client, key_prefix: str = cfg.RESULT_CACHE['key_prefix'], index_key: str = cfg.RESULT_CACHE['index_key'],
+                 ttl_s: int = cfg.RESULT_CACHE['ttl_s'], max_entries: int = cfg.RESULT_CACHE['max_entries']):
+        self.redis_client = redis_client
+        self.key_prefix   = key_prefix
+        self.index_key    = index_key
+        self.ttl_s        = ttl_s
+        self.max_entries  = max_entries
+
+        # Hit/miss counters of this process
+        self.hits   = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(image_bytes) -> str:
+        """
+        Content hash of the image bytes used as cache key
+        """
+        return hashlib.blake2b(image_bytes, digest_size= 16).hexdigest()
+
+    async def get(self, digest: str) -> dict:
+        """
+        Get the cached prediction for an image digest
+
+        :param digest: Content hash of the image
+        :return: Cached result or None on a miss
+        """
+        cached = await self.redis_client.get(self.key_prefix + digest)
+        if cached is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(cached)
+
+    async def get_many(self, digests: list) -> list:
+        """
+        Get the cached predictions for many image digests in one round trip
+
+        :param digests: Content hashes of the images
+        :return: Cached result or None for every digest
+        """
+        pipe = self.redis_client.pipeline(transaction= False)
+        for digest in digests:
+            pipe.get(self.key_prefix + digest)
+
+        results = []
+        for cached in await pipe.execute():
+            if cached is None:
+                self.misses += 1
+                results.append(None)
+            else:
+                self.hits += 1
+                results.append(json.loads(cached))
+        return results
+
+    def put(self, pipe, digest: str, result: dict, now: float):
+        """
+        Queue the commands caching a prediction on a pipeline
+
+        :param pipe: Redis pipeline the result is written with
+        :param digest: Content hash of the image
+        :param result: Prediction result to cache
+        :param now: Insertion timestamp
+        """
+        pipe.set(self.key_prefix + digest, json.dumps(result, separators=(",", ":")), ex= self.ttl_s)
+        pipe.zadd(self.index_key, {digest: now})
+
+    def trim(self, pipe):
+        """
+        Queue the command bounding the cache size on a pipeline, run once per batch of puts
+        """
+        pipe.eval(TRIM_SCRIPT, 1, self.index_key, self.max_entries, self.key_prefix)
+
+    def stats(self) -> dict:
+        """
+        Get the hit/miss counters
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": round(self.hits / lookups, 4) if lookups else None}
@@ -0,0 +1,25 @@
+import json
+from config import config as cfg
+
+
+class ResultEvents:
+    """
+    Completion events published for clients waiting inline on a prediction
+    """
+    @staticmethod
+    def channel(image_id: int) -> str:
+        """
+        Pub/sub channel of an image, ids are spread over a fixed number of sharded channels
+        """
+        return f"{cfg.RESULT_EVENTS['channel_prefix']}:{int(image_id) % cfg.RESULT_EVENTS['num_shards']}"
+
+    @staticmethod
+    def publish(pipe, image_id: int, result: dict):
+        """
+        Queue the completion event of an image on a pipeline
+
+        :param pipe: Redis pipeline the result is written with
+        :param image_id: Id of the image
+        :param result: Prediction result returned to the waiting client
+        """
+        pipe.publish(ResultEvents.channel(image_id), json.dumps(result, separators=(",", ":")))
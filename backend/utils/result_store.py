@@ -0,0 +1,164 @@
+import json
+from config import config as cfg
+
+# Fields of a prediction result, in the order they are packed in the bucketed encoding
+RESULT_FIELDS = ("status", "has_dog")
+
+# Field of the result hash holding the latency trace of the image as JSON, bucketed results keep traces in their own buckets
+TRACE_FIELD = "trace"
+
+
+class ResultStore:
+    """
+    Storage of prediction results shared by the app and the backend
+
+    Results live under namespaced keys with a TTL, in one of two encodings:
+        "hash":     one hash per image at {prefix}{image_id} holding the result fields
+        "bucketed": results of bucket_size consecutive ids share one hash at {prefix}b:{image_id // bucket_size},
+                    keyed by image id with the fields packed in one value, small enough for Redis' listpack encoding
+
+    Latency traces are stored next to the result: in the trace field of the result hash, or for bucketed results
+    in a bucket of traces at {prefix}t:{image_id // bucket_size}, so reads of the status alone never fetch them.
+
+    Parameters:
+        redis_client: Redis connection object
+        key_prefix: Namespace of the result keys
+        ttl_s: Time to live of a result in seconds
+        encoding: "hash" or "bucketed"
+        bucket_size: Ids per bucket, keep it below the hash-max-listpack-entries setting of Redis (128 by default)
+    """
+    def __init__(self, redis_client, key_prefix: str = cfg.RESULT_STORE['key_prefix'], ttl_s: int = cfg.RESULT_STORE['ttl_s'],
+                 encoding: str = cfg.RESULT_STORE['encoding'], bucket_size: int = cfg.RESULT_STORE['bucket_size']):
+        if encoding not in ("hash", "bucketed"):
+            raise ValueError(f"Unsupported result store encoding: {encoding}")
+
+        self.redis_client = redis_client
+        self.key_prefix   = key_prefix
+        self.ttl_s        = ttl_s
+        self.encoding     = encoding
+        self.bucket_size  = bucket_size
+
+    def key(self, image_id: int) -> str:
+        """
+        Key holding the result of an image
+        """
+        if self.encoding == "bucketed":
+            return f"{self.key_prefix}b:{int(image_id) // self.bucket_size}"
+        return f"{self.key_prefix}{int(image_id)}"
+
+    def trace_key(self, image_id: int) -> str:
+        """
+        Key holding the latency trace of an image
+        """
+        if self.encoding == "bucketed":
+            return f"{self.key_prefix}t:{int(image_id) // self.bucket_size}"
+        return self.key(image_id)
+
+    @staticmethod
+    def pack(result: dict) -> str:
+        """
+        Pack the result fields in one value, missing fields are stored empty
+        """
+        return "|".join("" if result.get(field) is None else str(result[field]) for field in RESULT_FIELDS)
+
+    @staticmethod
+    def unpack(value) -> dict:
+        """
+        Unpack a value written by pack, empty fields become None
+        """
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return {field: item or None for field, item in zip(RESULT_FIELDS, value.split("|"))}
+
+    def write(self, pipe, image_id: int, status: str, has_dog: str = None):
+        """
+        Queue the commands storing a result on a pipeline
+
+        :param pipe: Redis pipeline or connection object the result is written with
+        :param image_id: Id of the image
+        :param status: Prediction status
+        :param has_dog: Dog decision, None while the prediction is not done
+        """
+        key = self.key(image_id)
+        result = {"status": status, "has_dog": has_dog}
+
+        if self.encoding == "bucketed":
+            pipe.hset(key, str(int(image_id)), self.pack(result))
+        else:
+            pipe.hset(key, mapping={field: value for field, value in result.items() if value is not None})
+        pipe.expire(key, self.ttl_s)
+
+    def write_trace(self, pipe, image_id: int, trace: dict):
+        """
+        Queue the commands storing the latency trace of an image on a pipeline
+
+        :param pipe: Redis pipeline or connection object the trace is written with
+        :param image_id: Id of the image
+        :param trace: Stage durations and timestamps of the image
+        """
+        key = self.trace_key(image_id)
+        field = str(int(image_id)) if self.encoding == "bucketed" else TRACE_FIELD
+        pipe.hset(key, field, json.dumps(trace, separators=(",", ":")))
+        pipe.expire(key, self.ttl_s)
+
+    def _queue_read(self, pipe, image_id: int):
+        if self.encoding == "bucketed":
+            pipe.hget(self.key(image_id), str(int(image_id)))
+        else:
+            # Only the result fields, the trace stored in the same hash is read on demand
+            pipe.hmget(self.key(image_id), "status", "has_dog")
+
+    def _queue_read_trace(self, pipe, image_id: int):
+        if self.encoding == "bucketed":
+            pipe.hget(self.trace_key(image_id), str(int(image_id)))
+        else:
+            pipe.hget(self.key(image_id), TRACE_FIELD)
+
+    @staticmethod
+    def _to_str(value) -> str:
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def _parse(self, image_id: int, value) -> dict:
+        if self.encoding == "bucketed":
+            if not value:
+                return None
+            result = self.unpack(value)
+        else:
+            # HMGET answers None for every field of a missing key
+            status, has_dog = value
+            if status is None:
+                return None
+            result = {"status": self._to_str(status), "has_dog": self._to_str(has_dog)}
+        return {"image_prediction_id": int(image_id), "status": result.get("status"), "has_dog": result.get("has_dog")}
+
+    async def read(self, image_id: int, with_trace: bool = False) -> dict:
+        """
+        Get the result of an image
+
+        :param image_id: Id of the image
+        :param with_trace: Add the latency trace of the image, None until the backend has written it
+        :return: The result or None if it is unknown or expired
+        """
+        if not with_trace:
+            return (await self.read_many([image_id]))[0]
+
+        pipe = self.redis_client.pipeline(transaction= False)
+        self._queue_read(pipe, image_id)
+        self._queue_read_trace(pipe, image_id)
+        value, trace = await pipe.execute()
+        result = self._parse(image_id, value)
+        if result:
+            result["trace"] = json.loads(trace) if trace else None
+        return result
+
+    async def read_many(self, image_ids: list) -> list:
+        """
+        Get the results of many images in one round trip
+
+        :param image_ids: Ids of the images
+        :return: The result or None for every id
+        """
+        pipe = self.redis_client.pipeline(transaction= False)
+        for image_id in image_ids:
+            self._queue_read(pipe, image_id)
+        return [self._parse(image_id, value) for image_id, value in zip(image_ids, await pipe.execute())]
@@ -0,0 +1,45 @@
+from config import config as cfg
+
+
+class PriorityScheduler:
+    """
+    Split the slots of every batch between the queues of the priority classes
+
+    Parameters:
+        classes: Priority classes, highest priority first
+        weights: Share of the batch slots of every class in weighted mode
+        policy: "strict" fills batches in priority order, a class is only served while all higher ones are empty.
+                "weighted" interleaves the classes with smooth weighted round robin, so a backlog of a low priority
+                class still gets its share and a high priority class is never stuck behind it
+    """
+    def __init__(self, classes: list = cfg.PRIORITY['classes'], weights: dict = cfg.PRIORITY['weights'],
+                 policy: str = cfg.PRIORITY['scheduler']):
+        if policy not in ("strict", "weighted"):
+            raise ValueError(f"Unsupported scheduler policy: {policy}")
+
+        self.classes = list(classes)
+        self.weights = {priority: max(weights.get(priority, 1), 1) for priority in self.classes}
+        self.policy  = policy
+
+        # Smooth weighted round robin state, carried over between batches
+        self.current = {priority: 0 for priority in self.classes}
+
+    def quotas(self, slots: int) -> dict:
+        """
+        Number of slots every class gets in the next batch, before leftovers of empty classes are handed on
+
+        :param slots: Free slots of the batch
+        :return: Slots per class, summing to slots
+        """
+        if self.policy == "strict":
+            return {priority: slots if index == 0 else 0 for index, priority in enumerate(self.classes)}
+
+        quotas = {priority: 0 for priority in self.classes}
+        total_weight = sum(self.weights.values())
+        for _ in range(slots):
+            for priority in self.classes:
+                self.current[priority] += self.weights[priority]
+            chosen = max(self.classes, key= lambda priority: self.current[priority])
+            self.current[chosen] -= total_weight
+            quotas[chosen] += 1
+        return quotas
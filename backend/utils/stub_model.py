@@ -0,0 +1,31 @@
+import time
+import numpy as np
+from types import SimpleNamespace
+
+# ImageNet class count of the YOLO classification models
+NUM_CLASSES = 1000
+
+
+class StubModel:
+    """
+    Stand-in for the YOLO model with the same predict interface, used to benchmark transport and serialization alone
+
+    Every image is classified as the same class with a fixed confidence, after an optional simulated latency.
+
+    Parameters:
+        latency_ms: Simulated inference time per batch
+        class_id: Top-1 class returned for every image
+        confidence: Probability of the top-1 class, the rest is spread evenly over the other classes
+    """
+    def __init__(self, latency_ms: float = 0, class_id: int = 207, confidence: float = 0.9):
+        self.latency_ms = latency_ms
+
+        # Fixed probabilities
+        self.probs = np.full(NUM_CLASSES, (1 - confidence) / (NUM_CLASSES - 1), dtype= np.float32)
+        self.probs[class_id] = confidence
+
+    def predict(self, source, **kwargs) -> list:
+        images = source if isinstance(source, list) else [source]
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [SimpleNamespace(probs= SimpleNamespace(data= self.probs)) for _ in images]
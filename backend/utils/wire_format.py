@@ -0,0 +1,191 @@
+import json
+import base64
+import struct
+import zlib
+from typing import NamedTuple, Union
+
+# lz4 is an optional dependency, zlib is always available
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+"""
+Binary envelope used to send images through the redis queue
+
+Layout (network byte order):
+    magic (2s) | version (B) | flags (B) | content type (B) | compression (B) | image id (Q) | payload length (I) | meta length (H)
+followed by the optional JSON metadata and the (optionally compressed) raw image bytes, or with FLAG_SHM by
+a descriptor of the shared-memory slot holding the image:
+    slot (I) | generation (I) | offset (Q) | length (I)
+
+Legacy JSON messages carry the same metadata (tenant, notify flag, trace id, ...) next to the base64 image:
+    {"image_id": ..., "image_data": ..., "meta": {...}}
+"""
+MAGIC   = b"FH"
+VERSION = 1
+HEADER  = struct.Struct("!2sBBBBQIH")
+
+# Flags
+FLAG_SHM = 0x01
+SHM_DESCRIPTOR = struct.Struct("!IIQI")
+
+# Space reserved in front of image bytes read from an upload, so the header and metadata can be written in place
+HEADROOM = 512
+
+# Content type codes, index in the list is the code on the wire
+CONTENT_TYPES = ["application/octet-stream", "image/jpeg", "image/png", "image/gif", "image/bmp", "image/tiff", "image/x-raw-bgr"]
+
+# Decoded uint8 BGR pixels, normalized by the app, their shape is sent in the metadata
+RAW_CONTENT_TYPE = "image/x-raw-bgr"
+
+# Compression codes
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZ4  = 2
+COMPRESSION_CODES = {"none": COMPRESSION_NONE, "zlib": COMPRESSION_ZLIB, "lz4": COMPRESSION_LZ4}
+
+
+class ShmDescriptor(NamedTuple):
+    slot: int
+    generation: int        # Bumped on every allocation of the slot, detects reads of a reclaimed slot
+    offset: int            # Start of the image bytes in the shared-memory file
+    length: int
+
+
+class ImageMessage(NamedTuple):
+    image_id: int
+    content_type: str
+    image_bytes: Union[bytes, memoryview]
+    meta: dict
+    shm: Union[ShmDescriptor, None] = None    # Set when the image bytes are in shared memory instead of the message
+
+
+class WireFormat:
+    """
+    Encode and decode image messages exchanged between the app and the backend
+    """
+    @staticmethod
+    def encode(image_id: int, image_bytes: bytes, content_type: str, compression: str = "none", meta: dict = None) -> bytes:
+        """
+        Build a binary message for an image
+
+        :param image_id: Unique id of the image
+        :param image_bytes: Raw image bytes as uploaded
+        :param content_type: Mime type of the image
+        :param compression: One of "none", "zlib" or "lz4"
+        :param meta: Optional metadata stored as JSON next to the header
+        :return: Encoded message
+        """
+        if compression not in COMPRESSION_CODES:
+            raise ValueError(f"Unsupported compression: {compression}")
+
+        # Compress the image bytes if requested
+        if compression == "zlib":
+            image_bytes = zlib.compress(image_bytes)
+        elif compression == "lz4":
+            if lz4_frame is None:
+                raise ValueError("lz4 compression requested but the lz4 package is not installed")
+            image_bytes = lz4_frame.compress(image_bytes)
+
+        # Unknown content types are sent as generic binary data
+        content_code = CONTENT_TYPES.index(content_type) if content_type in CONTENT_TYPES else 0
+        meta_bytes   = json.dumps(meta, separators=(",", ":")).encode("utf-8") if meta else b""
+
+        header = HEADER.pack(MAGIC, VERSION, 0, content_code, COMPRESSION_CODES[compression], image_id, len(image_bytes), len(meta_bytes))
+        return b"".join((header, meta_bytes, image_bytes))
+
+    @staticmethod
+    def encode_in_place(buffer: bytearray, offset: int, length: int, image_id: int, content_type: str, meta: dict = None) -> memoryview:
+        """
+        Build an uncompressed binary message around image bytes already stored in the buffer, without copying them
+
+        :param buffer: Buffer holding the raw image bytes at buffer[offset:offset + length]
+        :param offset: Start of the image bytes, the header and metadata are written into the space before it
+        :param length: Number of image bytes
+        :param image_id: Unique id of the image
+        :param content_type: Mime type of the image
+        :param meta: Optional metadata stored as JSON next to the header
+        :return: View of the encoded message inside the buffer
+        """
+        content_code = CONTENT_TYPES.index(content_type) if content_type in CONTENT_TYPES else 0
+        meta_bytes   = json.dumps(meta, separators=(",", ":")).encode("utf-8") if meta else b""
+
+        start = offset - len(meta_bytes) - HEADER.size
+        if start < 0:
+            raise ValueError(f"Not enough headroom for the message header: {offset} bytes, {offset - start} needed")
+
+        HEADER.pack_into(buffer, start, MAGIC, VERSION, 0, content_code, COMPRESSION_NONE, image_id, length, len(meta_bytes))
+        buffer[start + HEADER.size:offset] = meta_bytes
+        return memoryview(buffer)[start:offset + length]
+
+    @staticmethod
+    def encode_shm(image_id: int, descriptor: ShmDescriptor, content_type: str, meta: dict = None) -> bytes:
+        """
+        Build a binary message pointing to an image stored in a shared-memory slot
+
+        :param image_id: Unique id of the image
+        :param descriptor: Shared-memory slot holding the raw image bytes
+        :param content_type: Mime type of the image
+        :param meta: Optional metadata stored as JSON next to the header
+        :return: Encoded message
+        """
+        content_code = CONTENT_TYPES.index(content_type) if content_type in CONTENT_TYPES else 0
+        meta_bytes   = json.dumps(meta, separators=(",", ":")).encode("utf-8") if meta else b""
+
+        header = HEADER.pack(MAGIC, VERSION, FLAG_SHM, content_code, COMPRESSION_NONE, image_id, SHM_DESCRIPTOR.size, len(meta_bytes))
+        return b"".join((header, meta_bytes, SHM_DESCRIPTOR.pack(*descriptor)))
+
+    @staticmethod
+    def decode(message: Union[bytes, str]) -> ImageMessage:
+        """
+        Decode a message from the queue, legacy base64-in-JSON messages are still accepted
+
+        :param message: Raw message popped from the queue
+        :return: Decoded image message
+        """
+        # Legacy JSON messages, the metadata is optional as older apps do not send it
+        if not WireFormat.is_binary(message):
+            data = json.loads(message)
+            return ImageMessage(image_id= data['image_id'], content_type= CONTENT_TYPES[0],
+                                image_bytes= base64.b64decode(data['image_data']), meta= data.get('meta') or {})
+
+        if len(message) < HEADER.size:
+            raise ValueError(f"Truncated message header: {len(message)} bytes, expected at least {HEADER.size}")
+        magic, version, flags, content_code, compression, image_id, length, meta_len = HEADER.unpack_from(message)
+        if version != VERSION:
+            raise ValueError(f"Unsupported message version: {version}")
+
+        # Slice the message without copying the image bytes
+        view = memoryview(message)
+        meta_end = HEADER.size + meta_len
+        meta = json.loads(bytes(view[HEADER.size:meta_end])) if meta_len else {}
+        image_bytes = view[meta_end:meta_end + length]
+        if len(image_bytes) != length:
+            raise ValueError(f"Truncated message for image id {image_id}: expected {length} bytes, got {len(image_bytes)}")
+
+        content_type = CONTENT_TYPES[content_code] if content_code < len(CONTENT_TYPES) else CONTENT_TYPES[0]
+
+        # The image bytes are in shared memory, the payload only describes where
+        if flags & FLAG_SHM:
+            descriptor = ShmDescriptor(*SHM_DESCRIPTOR.unpack(image_bytes))
+            return ImageMessage(image_id= image_id, content_type= content_type, image_bytes= b"", meta= meta, shm= descriptor)
+
+        # Decompress the image bytes if needed
+        if compression == COMPRESSION_ZLIB:
+            image_bytes = zlib.decompress(image_bytes)
+        elif compression == COMPRESSION_LZ4:
+            if lz4_frame is None:
+                raise ValueError("Received lz4 compressed message but the lz4 package is not installed")
+            image_bytes = lz4_frame.decompress(image_bytes)
+        elif compression != COMPRESSION_NONE:
+            raise ValueError(f"Unsupported compression code: {compression}")
+
+        return ImageMessage(image_id= image_id, content_type= content_type, image_bytes= image_bytes, meta= meta)
+
+    @staticmethod
+    def is_binary(message: Union[bytes, str]) -> bool:
+        """
+        Check if a message uses the binary envelope
+        """
+        return isinstance(message, (bytes, bytearray, memoryview)) and bytes(message[:len(MAGIC)]) == MAGIC
@@ -0,0 +1,199 @@
+import os
+import time
+import asyncio
+import queue
+import multiprocessing as mp
+from utils import logging_config
+import logging
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Spawn keeps the children free of the parent's event loop, sockets and torch state
+mp_context = mp.get_context("spawn")
+
+
+def _bootstrap(target, worker_index: int, num_threads: int, cpu_ids: list, status_queue):
+    """
+    Entry point of every worker process, applies the cpu budget and then runs the target
+
+    :param target: Picklable callable run as target(worker_index, status_queue)
+    :param worker_index: Index of the worker in the pool
+    :param num_threads: Torch intra-op thread budget of the worker
+    :param cpu_ids: Cpus to pin the worker to, empty to leave the affinity untouched
+    :param status_queue: Queue used to report heartbeats to the supervisor
+    """
+    # Pin the worker before any thread pool is created
+    if cpu_ids and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_ids)
+
+    # Limit torch intra-op threads so workers do not oversubscribe the cpus
+    import torch
+    torch.set_num_threads(num_threads)
+
+    logger.info(f"Worker {worker_index} started with pid {os.getpid()}, {num_threads} threads, cpus: {cpu_ids or 'all'}")
+    target(worker_index, status_queue)
+
+
+class WorkerPool:
+    """
+    Pool of inference worker processes supervised from the FastAPI process
+
+    Parameters:
+        target: Picklable callable run in every worker as target(worker_index, status_queue)
+        num_workers: Number of worker processes
+        threads_per_worker: Torch intra-op threads per worker, 0 splits the available cpus evenly
+        pin_cpus: Pin every worker to its own set of cpus
+    """
+    def __init__(self, target, num_workers: int, threads_per_worker: int = 0, pin_cpus: bool = False):
+        self.target      = target
+        self.num_workers = num_workers
+        self.pin_cpus    = pin_cpus
+
+        # Split the available cpus between the workers
+        self.cpu_ids = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self.threads_per_worker = threads_per_worker or max(1, len(self.cpu_ids) // num_workers)
+
+        self.status_queue = mp_context.Queue()
+        self.processes = [None] * num_workers
+        self.metrics = [None] * num_workers
+        self.workers = [{"pid": None, "restarts": 0, "started_at": None, "last_heartbeat": None, "status": "stopped"}
+                        for _ in range(num_workers)]
+
+    def _cpus_for(self, worker_index: int) -> list:
+        """
+        Get the cpus a worker is pinned to, wraps around when there are more threads than cpus
+        """
+        if not self.pin_cpus:
+            return []
+        start = worker_index * self.threads_per_worker
+        return [self.cpu_ids[(start + i) % len(self.cpu_ids)] for i in range(self.threads_per_worker)]
+
+    def _start_worker(self, worker_index: int):
+        """
+        Start (or restart) the worker with the given index
+        """
+        # Children inherit the environment, so set the OpenMP budget before torch is imported there
+        os.environ["OMP_NUM_THREADS"] = str(self.threads_per_worker)
+
+        process = mp_context.Process(target= _bootstrap, name= f"inference-worker-{worker_index}", daemon= True,
+                                     args= (self.target, worker_index, self.threads_per_worker, self._cpus_for(worker_index), self.status_queue))
+        process.start()
+
+        self.processes[worker_index] = process
+        self.workers[worker_index].update({"pid": process.pid, "started_at": time.time(), "last_heartbeat": None, "status": "starting"})
+
+    def start(self):
+        """
+        Start all worker processes
+        """
+        logger.info(f"Starting {self.num_workers} inference workers with {self.threads_per_worker} threads each...")
+        for worker_index in range(self.num_workers):
+            self._start_worker(worker_index)
+
+    def stop(self, timeout: float = 10):
+        """
+        Terminate all worker processes
+        """
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for worker_index, process in enumerate(self.processes):
+            if process is not None:
+                process.join(timeout)
+                self.workers[worker_index]["status"] = "stopped"
+        logger.info("All inference workers stopped.")
+
+    @staticmethod
+    def report(status_queue, worker_index: int, **fields):
+        """
+        Send a heartbeat from a worker process to the supervisor
+
+        :param status_queue: Status queue handed to the worker
+        :param worker_index: Index of the reporting worker
+        :param fields: Extra status fields, e.g. status and processed count
+        """
+        status_queue.put({"worker_index": worker_index, "pid": os.getpid(), "ts": time.time(), **fields})
+
+    def _drain_status(self):
+        """
+        Apply all heartbeats received since the last check
+        """
+        while True:
+            try:
+                message = self.status_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            worker_index = message.pop("worker_index")
+            worker = self.workers[worker_index]
+            # Ignore late heartbeats of a worker that was already replaced
+            if message.pop("pid") != worker["pid"]:
+                continue
+            worker["last_heartbeat"] = message.pop("ts")
+
+            # Metrics snapshots are kept apart from the health fields
+            worker_metrics = message.pop("metrics", None)
+            if worker_metrics is not None:
+                self.metrics[worker_index] = worker_metrics
+            worker.update(message)
+
+    def check_workers(self, heartbeat_timeout: float):
+        """
+        Restart workers that crashed, or stopped sending heartbeats once ready
+
+        Workers still starting or loading their models are only restarted when their process exits, loading
+        may take longer than the heartbeat timeout.
+        """
+        self._drain_status()
+        now = time.time()
+
+        for worker_index, process in enumerate(self.processes):
+            worker = self.workers[worker_index]
+
+            if not process.is_alive():
+                logger.error(f"Worker {worker_index} (pid {process.pid}) exited with code {process.exitcode}, restarting...")
+            elif worker["status"] == "ready" and now - worker["last_heartbeat"] > heartbeat_timeout:
+                logger.error(f"Worker {worker_index} (pid {process.pid}) missed heartbeats for {heartbeat_timeout}s, restarting...")
+                process.kill()
+                process.join()
+            else:
+                continue
+
+            worker["restarts"] += 1
+            self._start_worker(worker_index)
+
+    async def supervise(self, interval: float, heartbeat_timeout: float):
+        """
+        Supervisor loop run as a background task of the FastAPI process
+        """
+        while True:
+            try:
+                self.check_workers(heartbeat_timeout= heartbeat_timeout)
+            except Exception as e:
+                logger.error(f"Error while supervising workers: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def metrics_snapshots(self) -> list:
+        """
+        Get the last metrics snapshot of every worker, labelled with the worker index
+        """
+        self._drain_status()
+        return [({"worker": str(worker_index)}, snapshot) for worker_index, snapshot in enumerate(self.metrics) if snapshot is not None]
+
+    def health(self) -> list:
+        """
+        Get the health of every worker
+        """
+        self._drain_status()
+        now = time.time()
+
+        health = []
+        for worker_index, process in enumerate(self.processes):
+            worker = self.workers[worker_index]
+            last_heartbeat = worker["last_heartbeat"]
+            health.append({**worker,
+                           "worker_index": worker_index,
+                           "alive": process is not None and process.is_alive(),
+                           "heartbeat_age_s": round(now - last_heartbeat, 3) if last_heartbeat else None})
+        return health
@@ -0,0 +1,6 @@
+"""
+Benchmarks for the app and backend services
+
+Every benchmark is run from the repository root, e.g.
+    python -m benchmarks.runtime_benchmark --help
+"""
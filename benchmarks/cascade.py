@@ -0,0 +1,94 @@
+"""
+Throughput of the model cascade against the large model alone, with the escalation rate of every uncertainty band
+and the agreement of the cascade decisions with the large model
+
+Images are read from a directory (jpg and png), the ultralytics sample images by default, and cycled to fill the run.
+Random pixels are useless here, the small model is unsure about all of them and escalates every image.
+
+Usage:
+    python -m benchmarks.cascade --images ./dogs_and_cats --num-images 512 --batch-size 8 --bands 0.25,0.75 0.1,0.9
+"""
+import argparse
+import glob
+import os
+import time
+import cv2
+from benchmarks.service_path import use_service
+
+use_service("backend")
+
+from ultralytics.utils import ASSETS
+from config import config
+from main import AiModel, ProcessImage, CASCADE_IMAGES
+from utils.auto_model_download import Model
+
+
+def load_images(directory: str, num_images: int) -> list:
+    """
+    Read the images of a directory, resized the way the backend resizes them, and cycle them to num_images
+    """
+    paths = sorted(path for pattern in ("*.jpg", "*.jpeg", "*.png") for path in glob.glob(os.path.join(directory, pattern)))
+    if not paths:
+        raise ValueError(f"No jpg or png images in {directory}")
+
+    img_size = config.MODEL_PARAMETERS['img_size']
+    images = []
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        height, width = image.shape[:2]
+        scale = img_size / min(height, width)
+        if scale < 1:
+            image = cv2.resize(image, (max(img_size, round(width * scale)), max(img_size, round(height * scale))), interpolation= cv2.INTER_AREA)
+        images.append(image)
+    return [images[index % len(images)] for index in range(num_images)]
+
+
+def run(process_image: ProcessImage, images: list, batch_size: int) -> tuple:
+    """
+    Classify all images in batches, the way the infer stage does
+
+    :return: Dog decisions, images per second and images escalated to the large model
+    """
+    escalated_before = CASCADE_IMAGES.values.get(("large",), 0)
+    decisions = []
+    start = time.perf_counter()
+    for index in range(0, len(images), batch_size):
+        decisions.extend(process_image.classify(images[index:index + batch_size]))
+    elapsed = time.perf_counter() - start
+    return decisions, len(images) / elapsed, CASCADE_IMAGES.values.get(("large",), 0) - escalated_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default= str(ASSETS), help= "Directory of jpg and png images")
+    parser.add_argument("--num-images", type= int, default= 256)
+    parser.add_argument("--batch-size", type= int, default= config.MODEL_PARAMETERS['max_batch_size'])
+    parser.add_argument("--bands", nargs= "+", default= [",".join(str(value) for value in config.CASCADE['band'])],
+                        help= "Uncertainty bands as LOW,HIGH dog confidences")
+    args = parser.parse_args()
+
+    Model.download_model(model_path= config.MODEL["model_path"], model_url= config.MODEL["model_url"], sha256= config.MODEL["sha256"])
+    Model.download_model(model_path= config.CASCADE["model_path"], model_url= config.CASCADE["model_url"], sha256= config.CASCADE["sha256"])
+    large_model, small_model = AiModel(model_path= config.MODEL['model_path']), AiModel(model_path= config.CASCADE['model_path'])
+    large_model.warmup()
+    small_model.warmup()
+    images = load_images(args.images, args.num_images)
+
+    # Only classify is used, no redis involved
+    def process_image(cascade_model= None, band= config.CASCADE['band']):
+        return ProcessImage(redis_storage= None, ai_model_object= large_model.get_model(), queue_name= config.REDIS_SERVER['in_queue'],
+                            cascade_model_object= cascade_model, cascade_band= band)
+
+    reference, large_rate, _ = run(process_image(), images, args.batch_size)
+    print(f"{'setup':<24}{'img/s':>10}{'escalated':>12}{'agreement':>12}")
+    print(f"{'large model':<24}{large_rate:>10.1f}{'-':>12}{'100.0%':>12}")
+
+    # The small model alone never escalates, an empty band
+    for name, band in [("small model", (1, 0))] + [(f"cascade {band}", tuple(float(value) for value in band.split(","))) for band in args.bands]:
+        decisions, rate, escalated = run(process_image(small_model.get_model(), band), images, args.batch_size)
+        agreement = sum(decision == expected for decision, expected in zip(decisions, reference)) / len(images)
+        print(f"{name:<24}{rate:>10.1f}{escalated / len(images):>12.1%}{agreement:>12.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Enqueue throughput and latency of the two-call path (INCR for the id, then RPUSH) against leased id blocks with a
+single MULTI/EXEC round trip writing the PENDING status and pushing the message, with and without pipelining of
+concurrent requests
+
+Only keys under a bench_ prefix are written and they are deleted afterwards, nothing else in the database is touched.
+
+Usage:
+    python -m benchmarks.enqueue --redis-url redis://localhost:6379/0 --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import time
+import numpy as np
+from benchmarks.service_path import use_service
+
+use_service("app")
+
+import redis.asyncio as redis
+from config import config
+from utils.redis_manager import RedisManager, PipelinedWriter
+from utils.result_store import ResultStore
+from utils.id_allocator import IdAllocator
+
+# Keep the benchmark apart from the queues and counter of a running stack
+config.REDIS_SERVER['data_queue'] = "bench_image_queue"
+config.REDIS_STREAM['stream_name'] = "bench_image_stream"
+COUNTER = "bench_image_id"
+PREFIX  = "bench_"
+
+
+async def two_call(client, store, message):
+    image_id = await client.incr(COUNTER)
+    await RedisManager.push_message(client, message)
+    return image_id
+
+
+async def two_call_pipelined(writer, store, message):
+    image_id = await writer.execute(lambda pipe: pipe.incr(COUNTER))
+    await writer.execute(lambda pipe: RedisManager.push_message(pipe, message))
+    return image_id
+
+
+def atomic(allocator):
+    async def enqueue(client, store, message):
+        image_id = (await allocator.allocate())[0]
+        pipe = client.pipeline(transaction= True)
+        RedisManager.enqueue(pipe, image_id, message, store)
+        await pipe.execute()
+        return image_id
+    return enqueue
+
+
+def atomic_pipelined(allocator):
+    async def enqueue(writer, store, message):
+        image_id = (await allocator.allocate())[0]
+        await writer.execute(lambda pipe: RedisManager.enqueue(pipe, image_id, message, store))
+        return image_id
+    return enqueue
+
+
+async def delete_prefix(client, prefix: str):
+    async for key in client.scan_iter(match= prefix + "*", count= 1000):
+        await client.unlink(key)
+
+
+async def measure(target, enqueue, store, message: bytes, concurrency: int, duration_s: float) -> dict:
+    """
+    Enqueue from concurrency clients in a closed loop for duration_s
+    """
+    deadline = time.perf_counter() + duration_s
+    latencies = []
+
+    async def client_loop():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await enqueue(target, store, message)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client_loop() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+    return {"enqueues_per_s": len(latencies) / elapsed, "p50_ms": p50, "p99_ms": p99}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default= "redis://localhost:6379/0")
+    parser.add_argument("--concurrency", type= int, default= 64)
+    parser.add_argument("--duration", type= float, default= 10, help= "Seconds per enqueue path")
+    parser.add_argument("--payload-kb", type= float, default= 4, help= "Size of the queued messages")
+    parser.add_argument("--block-size", type= int, default= config.IMAGE_IDS['block_size'], help= "Ids leased per INCRBY")
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url, max_connections= config.REDIS_POOL['max_connections'])
+    store = ResultStore(redis_client= client, key_prefix= PREFIX + "result:")
+    message = os.urandom(int(args.payload_kb * 1024))
+
+    print(f"{'path':<20}{'enqueues/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'INCRs':>8}")
+    try:
+        atomic_allocator, pipelined_allocator = IdAllocator(client, COUNTER, args.block_size), IdAllocator(client, COUNTER, args.block_size)
+        paths = [("two-call", client, two_call, None),
+                 ("two-call pipelined", PipelinedWriter(client), two_call_pipelined, None),
+                 ("atomic", client, atomic(atomic_allocator), atomic_allocator),
+                 ("atomic pipelined", PipelinedWriter(client, transaction= True), atomic_pipelined(pipelined_allocator), pipelined_allocator)]
+        for name, target, enqueue, allocator in paths:
+            await delete_prefix(client, PREFIX)
+            result = await measure(target, enqueue, store, message, args.concurrency, args.duration)
+            if isinstance(target, PipelinedWriter):
+                await target.close()
+
+            # Two-call paths make one INCR per image, the atomic paths one INCRBY per leased block
+            incrs = allocator.leases if allocator else "1/img"
+            print(f"{name:<20}{result['enqueues_per_s']:>12.0f}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}{incrs:>8}", flush= True)
+    finally:
+        await delete_prefix(client, PREFIX)
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+
+# Mime type of every supported synthetic image format
+CONTENT_TYPES = {"jpeg": "image/jpeg", "png": "image/png"}
+
+
+def synthetic_image(width: int, height: int, image_format: str = "jpeg", seed: int = 0) -> bytes:
+    """
+    Generate an encoded synthetic image
+
+    Smooth gradients with a little noise compress like a photo, pure noise would make the files unrealistically large.
+
+    :param width: Image width in pixels
+    :param height: Image height in pixels
+    :param image_format: "jpeg" or "png"
+    :param seed: Seed of the noise, different seeds give different bytes (and content hashes)
+    :return: Encoded image bytes
+    """
+    if image_format not in CONTENT_TYPES:
+        raise ValueError(f"Unsupported image format: {image_format}")
+
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype= np.float32)
+    y = np.linspace(0, 255, height, dtype= np.float32)[:, None]
+    image = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)), (x + y) / 2], axis= 2)
+    image = np.clip(image + rng.normal(0, 12, image.shape), 0, 255).astype(np.uint8)
+
+    ok, encoded = cv2.imencode(".jpg" if image_format == "jpeg" else ".png", image)
+    if not ok:
+        raise ValueError(f"Could not encode synthetic {image_format} image")
+    return encoded.tobytes()
+
+
+def image_pool(count: int, width: int, height: int, image_format: str = "jpeg") -> list:
+    """
+    Generate distinct synthetic images, so the result cache does not short-circuit the benchmark
+    """
+    return [synthetic_image(width, height, image_format, seed= seed) for seed in range(count)]
@@ -0,0 +1,177 @@
+"""
+End-to-end load generator for the app -> redis -> backend pipeline
+
+Starts a local stack (unless --app-url is given), drives POST /image_prediction with synthetic images,
+polls every image until its prediction is done and reports latency percentiles and throughput.
+
+Usage:
+    # Transport and serialization overhead alone, closed loop with 16 clients
+    python -m benchmarks.load_generator --stub-model --concurrency 16 --duration 30
+
+    # Fixed arrival rate against the real model
+    python -m benchmarks.load_generator --rate 20 --duration 60 --image-size 1280x960
+
+    # Existing deployment
+    python -m benchmarks.load_generator --app-url http://localhost:8080 --concurrency 8
+"""
+import argparse
+import asyncio
+import time
+import itertools
+import numpy as np
+import httpx
+from benchmarks.images import image_pool, CONTENT_TYPES
+from benchmarks.stack import Stack
+
+# Statuses after which an image is not polled anymore: Dropped is written by the app when admission control sheds
+# a queued image, Error by the backend when an image cannot be decoded or its batch fails
+FINAL_STATUSES = {"Done", "Dropped", "Error"}
+
+
+class LoadGenerator:
+    """
+    Submit images and poll their results, collecting per-image timings
+
+    Parameters:
+        client: HTTP client bound to the app url
+        images: Encoded images, used round robin
+        content_type: Mime type of the images
+        poll_interval_s: Delay between two polls of the same image
+        timeout_s: Give up on an image after this long
+        params: Query parameters of the submissions, e.g. {"priority": "bulk", "tenant": "acme"}
+    """
+    def __init__(self, client: httpx.AsyncClient, images: list, content_type: str, poll_interval_s: float, timeout_s: float,
+                 params: dict = None):
+        self.client = client
+        self.params = params or {}
+        self.images = itertools.cycle(images)
+        self.content_type = content_type
+        self.poll_interval_s = poll_interval_s
+        self.timeout_s = timeout_s
+
+        self.submit_latencies = []
+        self.end_to_end_latencies = []
+        self.rejected = 0
+        self.failed = 0
+
+    async def run_one(self):
+        """
+        Submit one image and poll it until its prediction is final
+        """
+        start = time.perf_counter()
+        response = await self.client.post("/image_prediction", files= {"file": ("image", next(self.images), self.content_type)},
+                                          params= self.params)
+        self.submit_latencies.append(time.perf_counter() - start)
+
+        if response.status_code == 429:
+            self.rejected += 1
+            return
+        if response.status_code != 200:
+            self.failed += 1
+            return
+
+        result = response.json()
+        while result.get("status") not in FINAL_STATUSES:
+            if time.perf_counter() - start > self.timeout_s:
+                self.failed += 1
+                return
+            await asyncio.sleep(self.poll_interval_s)
+
+            # Results are unknown (404) until the backend or the app wrote a first status
+            response = await self.client.get(f"/image_prediction/{result['image_prediction_id']}")
+            if response.status_code == 200:
+                result = response.json()
+
+        # Only predictions count towards the end-to-end latency
+        if result["status"] == "Error":
+            self.failed += 1
+            return
+        if result["status"] == "Dropped":
+            self.rejected += 1
+            return
+        self.end_to_end_latencies.append(time.perf_counter() - start)
+
+    async def closed_loop(self, concurrency: int, duration_s: float):
+        """
+        Every client submits its next image as soon as the previous one is done
+        """
+        deadline = time.perf_counter() + duration_s
+
+        async def client_loop():
+            while time.perf_counter() < deadline:
+                await self.run_one()
+
+        await asyncio.gather(*[client_loop() for _ in range(concurrency)])
+
+    async def open_loop(self, rate: float, duration_s: float):
+        """
+        Images arrive at a fixed rate, whatever the latency of the previous ones
+        """
+        tasks = []
+        start = time.perf_counter()
+        for index in range(int(rate * duration_s)):
+            await asyncio.sleep(max(start + index / rate - time.perf_counter(), 0))
+            tasks.append(asyncio.create_task(self.run_one()))
+        await asyncio.gather(*tasks)
+
+    def report(self, elapsed_s: float) -> dict:
+        def percentiles(latencies: list) -> dict:
+            if not latencies:
+                return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+            p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+            return {"p50_ms": round(p50, 1), "p95_ms": round(p95, 1), "p99_ms": round(p99, 1)}
+
+        return {"completed": len(self.end_to_end_latencies), "rejected": self.rejected, "failed": self.failed,
+                "images_per_s": round(len(self.end_to_end_latencies) / elapsed_s, 2),
+                "end_to_end": percentiles(self.end_to_end_latencies), "submit": percentiles(self.submit_latencies)}
+
+
+async def run(args, app_url: str) -> dict:
+    width, height = (int(value) for value in args.image_size.lower().split("x"))
+    images = image_pool(args.distinct_images, width, height, args.format)
+
+    async with httpx.AsyncClient(base_url= app_url, timeout= args.timeout) as client:
+        generator = LoadGenerator(client, images, CONTENT_TYPES[args.format], poll_interval_s= args.poll_interval_ms / 1000,
+                                  timeout_s= args.timeout, params= {key: value for key, value in (("priority", args.priority), ("tenant", args.tenant)) if value})
+        start = time.perf_counter()
+        if args.rate:
+            await generator.open_loop(args.rate, args.duration)
+        else:
+            await generator.closed_loop(args.concurrency, args.duration)
+        return generator.report(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-url", help= "Benchmark an existing deployment instead of starting a local stack")
+    parser.add_argument("--stub-model", action= "store_true", help= "Replace the YOLO model by a stub in the local backend")
+    parser.add_argument("--stub-latency-ms", type= float, default= 0, help= "Simulated inference time per batch of the stub model")
+    parser.add_argument("--env", nargs= "*", default= [], help= "Extra KEY=VALUE settings of the local services")
+    parser.add_argument("--rate", type= float, help= "Open loop: images per second, default is closed loop")
+    parser.add_argument("--concurrency", type= int, default= 8, help= "Closed loop: number of clients")
+    parser.add_argument("--duration", type= float, default= 30, help= "Seconds to generate load for")
+    parser.add_argument("--image-size", default= "640x480", help= "WIDTHxHEIGHT of the synthetic images")
+    parser.add_argument("--format", choices= sorted(CONTENT_TYPES), default= "jpeg")
+    parser.add_argument("--distinct-images", type= int, default= 64, help= "Distinct images to cycle through")
+    parser.add_argument("--poll-interval-ms", type= float, default= 20)
+    parser.add_argument("--timeout", type= float, default= 120, help= "Seconds before an image counts as failed")
+    parser.add_argument("--priority", help= "Priority class of the submitted images, e.g. bulk")
+    parser.add_argument("--tenant", help= "Tenant the images are submitted for, subject to its in-flight limit")
+    args = parser.parse_args()
+
+    if args.app_url:
+        result = asyncio.run(run(args, args.app_url))
+    else:
+        env = dict(item.split("=", 1) for item in args.env)
+        with Stack(stub_model= args.stub_model, stub_latency_ms= args.stub_latency_ms, env= env) as stack:
+            result = asyncio.run(run(args, stack.app_url))
+
+    print(f"completed {result['completed']} images in {args.duration:.0f}s: {result['images_per_s']} images/s "
+          f"({result['rejected']} rejected, {result['failed']} failed)")
+    for name in ("end_to_end", "submit"):
+        latencies = result[name]
+        print(f"{name:<12} p50 {latencies['p50_ms']} ms   p95 {latencies['p95_ms']} ms   p99 {latencies['p99_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
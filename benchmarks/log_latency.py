@@ -0,0 +1,105 @@
+"""
+Event loop latency caused by logging on the request path, for every logging mode
+
+Simulated requests log like the app does (a few per-image messages each) while a probe task measures how late the
+event loop wakes it up. The console goes to a pipe drained by a thread at a limited rate, standing in for a log
+collector that is slower than the services, and the log file goes to a temporary directory.
+
+Usage:
+    python -m benchmarks.log_latency --duration 5 --rate 2000 --concurrency 64
+    python -m benchmarks.log_latency --console-mbps 0 --messages-per-request 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from benchmarks.service_path import use_service
+
+use_service("app")
+
+import logging
+from config import config
+from utils import logging_config
+
+logger = logging.getLogger("benchmark")
+
+
+def slow_console(bytes_per_s: float):
+    """
+    Replace stderr by a pipe drained at bytes_per_s, 0 for unlimited
+    """
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        while chunk := os.read(read_fd, 64 * 1024):
+            if bytes_per_s:
+                time.sleep(len(chunk) / bytes_per_s)
+
+    threading.Thread(target= drain, daemon= True).start()
+    sys.stderr = os.fdopen(write_fd, "w", buffering= 1)
+
+
+async def measure(rate: float, concurrency: int, messages_per_request: int, sample_rate: float, duration_s: float,
+                  probe_interval_s: float = 0.005) -> dict:
+    """
+    Run simulated requests at up to rate per second for duration_s and sample the lateness of the event loop
+    """
+    deadline = time.perf_counter() + duration_s
+    requests = 0
+    lags = []
+
+    async def client_loop():
+        nonlocal requests
+        image_id = 0
+        while time.perf_counter() < deadline:
+            image_id += 1
+            for _ in range(messages_per_request):
+                logging_config.log_sampled(logger, "Sending image with id: %s for prediction...", image_id, sample_rate= sample_rate)
+            requests += 1
+
+            # Every client waits on i/o between its requests
+            await asyncio.sleep(concurrency / rate)
+
+    async def probe():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(probe_interval_s)
+            lags.append(time.perf_counter() - start - probe_interval_s)
+
+    await asyncio.gather(probe(), *[client_loop() for _ in range(concurrency)])
+    p50, p99 = np.percentile(np.array(lags) * 1000, [50, 99])
+    return {"requests_per_s": requests / duration_s, "lag_p50_ms": p50, "lag_p99_ms": p99, "lag_max_ms": max(lags) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type= float, default= 5, help= "Seconds per logging mode")
+    parser.add_argument("--rate", type= float, default= 2000, help= "Target simulated requests per second")
+    parser.add_argument("--concurrency", type= int, default= 64, help= "Simulated concurrent requests")
+    parser.add_argument("--messages-per-request", type= int, default= 3)
+    parser.add_argument("--console-mbps", type= float, default= 1, help= "Drain rate of the console, 0 for unlimited")
+    parser.add_argument("--sample-rate", type= float, default= config.LOGGING['sample_rate'], help= "Sample rate of the sampled modes")
+    args = parser.parse_args()
+
+    slow_console(args.console_mbps * 1024 * 1024 / 8)
+    log_dir = tempfile.mkdtemp(prefix= "bench_log_")
+
+    modes = [("sync", 1.0), ("queue", 1.0), ("sync", args.sample_rate), ("queue", args.sample_rate)]
+    print(f"{'mode':<8}{'sample':>8}{'requests/s':>12}{'lag p50 ms':>12}{'lag p99 ms':>12}{'lag max ms':>12}{'dropped':>10}")
+    for mode, sample_rate in modes:
+        logging_config.setup({**config.LOGGING, "mode": mode, "level": "INFO", "file_path": os.path.join(log_dir, f"{mode}.log")})
+        result = asyncio.run(measure(args.rate, args.concurrency, args.messages_per_request, sample_rate, args.duration))
+
+        # Let the listener catch up, so the next mode does not pay for this one's backlog
+        dropped = getattr(logging.getLogger().handlers[0], "dropped", 0)
+        logging_config.stop()
+        print(f"{mode:<8}{sample_rate:>8}{result['requests_per_s']:>12.0f}{result['lag_p50_ms']:>12.2f}"
+              f"{result['lag_p99_ms']:>12.2f}{result['lag_max_ms']:>12.2f}{dropped:>10}", file= sys.stdout, flush= True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Cold start of the model download against a local HTTP stand-in of the release server
+
+The stand-in serves a random file with range request support, limits the bandwidth of every connection the way
+CDNs do, and can drop connections after some bytes to exercise resuming. The download is run once per segment count,
+and the assembled file is checked against the SHA-256 of the served one.
+
+Usage:
+    python -m benchmarks.model_download --size-mb 110 --per-connection-mbps 40 --segments 1 8
+    python -m benchmarks.model_download --size-mb 20 --drop-after-mb 3
+"""
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.service_path import use_service
+
+use_service("backend")
+
+from utils.auto_model_download import Model
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serve server.payload, honouring single byte ranges
+    """
+    def do_GET(self):
+        payload = self.server.payload
+        start, end = 0, len(payload) - 1
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        # Throttle every connection, optionally dropping it part way through
+        sent, chunk_size = 0, 64 * 1024
+        drop_after = self.server.drop_after if self.server.next_request() == 2 else None
+        for offset in range(start, end + 1, chunk_size):
+            chunk = payload[offset:min(offset + chunk_size, end + 1)]
+            if drop_after is not None and sent + len(chunk) > drop_after:
+                self.wfile.write(chunk[:drop_after - sent])
+                self.close_connection = True
+                return
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if self.server.bytes_per_s:
+                time.sleep(len(chunk) / self.server.bytes_per_s)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, payload: bytes, bytes_per_s: float, drop_after: int = None):
+        super().__init__(("127.0.0.1", 0), RangeRequestHandler)
+        self.payload = payload
+        self.bytes_per_s = bytes_per_s
+        self.drop_after = drop_after
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def next_request(self) -> int:
+        # Number of the request being served, the first one is the downloader's probe
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/yolo11x-cls.pt"
+
+
+def main():
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type= float, default= 110)
+    parser.add_argument("--per-connection-mbps", type= float, default= 40, help= "Bandwidth limit of every connection, 0 for unlimited")
+    parser.add_argument("--segments", type= int, nargs= "+", default= [1, 4, 8])
+    parser.add_argument("--drop-after-mb", type= float, default= None, help= "Drop the first segment request after this many MB, to exercise resuming")
+    args = parser.parse_args()
+
+    payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    expected = hashlib.sha256(payload).hexdigest()
+
+    print(f"{'segments':<10}{'seconds':>10}{'MB/s':>10}  verified")
+    for num_segments in args.segments:
+        drop_after = int(args.drop_after_mb * 1024 * 1024) if args.drop_after_mb else None
+        server = StandInServer(payload, bytes_per_s= args.per_connection_mbps * 1024 * 1024 / 8, drop_after= drop_after)
+        threading.Thread(target= server.serve_forever, daemon= True).start()
+
+        model_dir = tempfile.mkdtemp(prefix= "bench_model_")
+        model_path = os.path.join(model_dir, "yolo11x-cls.pt")
+        try:
+            start = time.perf_counter()
+            Model.download_model(model_path= model_path, model_url= server.url, sha256= expected, num_segments= num_segments)
+            elapsed = time.perf_counter() - start
+            verified = Model.file_sha256(model_path) == expected
+            print(f"{num_segments:<10}{elapsed:>10.2f}{args.size_mb / elapsed:>10.1f}  {verified}  ({server.requests} requests)")
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(model_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Redis bytes per image and backend decode time with and without app-side normalization
+
+For every upload size the message is built as the app would send it, as uploaded and normalized to every output format,
+and decoded the way the backend decodes it (full decode and resize, or a reshape for raw pixels).
+
+Usage:
+    python -m benchmarks.normalize --sizes 4000x3000 1920x1080 1280x960 640x480 --repeat 10
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from benchmarks.service_path import use_service
+from benchmarks.images import synthetic_image, CONTENT_TYPES
+
+use_service("app")
+
+from config import config
+from utils.ingest import Upload
+from utils.normalize import ImageNormalizer
+from utils.wire_format import HEADROOM, RAW_CONTENT_TYPE, WireFormat
+
+
+def backend_decode(image_bytes, content_type: str, meta: dict, img_size: int) -> np.ndarray:
+    """
+    Same steps as ProcessImage.deserialize_image in the backend
+    """
+    if content_type == RAW_CONTENT_TYPE:
+        return np.frombuffer(image_bytes, np.uint8).reshape(meta["shape"])
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    height, width = image.shape[:2]
+    scale = img_size / min(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (max(img_size, round(width * scale)), max(img_size, round(height * scale))), interpolation= cv2.INTER_AREA)
+    return image
+
+
+def timed(function, repeat: int) -> tuple:
+    """
+    Median time of repeated calls in milliseconds, and the result of the last call
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs= "+", default= ["4000x3000", "1920x1080", "1280x960", "640x480"], help= "WIDTHxHEIGHT of the uploads")
+    parser.add_argument("--format", choices= sorted(CONTENT_TYPES), default= "jpeg", help= "Format of the uploads")
+    parser.add_argument("--short-edge", type= int, default= config.NORMALIZE['short_edge'])
+    parser.add_argument("--repeat", type= int, default= 10)
+    args = parser.parse_args()
+
+    print(f"{'upload':<12}{'sent as':<12}{'redis bytes':>12}{'app ms':>10}{'backend ms':>12}")
+    for size in args.sizes:
+        width, height = (int(value) for value in size.lower().split("x"))
+        image_bytes = synthetic_image(width, height, args.format)
+        buffer = bytearray(HEADROOM + len(image_bytes))
+        buffer[HEADROOM:] = image_bytes
+        upload = Upload(buffer= buffer, offset= HEADROOM, length= len(image_bytes), content_type= CONTENT_TYPES[args.format], digest= None)
+
+        # As uploaded, then normalized to every output format
+        variants = [("uploaded", 0.0, upload, {})]
+        for output_format in ("jpeg", "png", "raw"):
+            app_ms, (normalized, shape) = timed(lambda: ImageNormalizer.normalize(upload, short_edge= args.short_edge, output_format= output_format), args.repeat)
+            variants.append((output_format, app_ms, normalized, {"shape": list(shape)} if normalized.content_type == RAW_CONTENT_TYPE else {}))
+
+        for name, app_ms, variant, meta in variants:
+            message = WireFormat.encode(image_id= 1, image_bytes= variant.image_bytes, content_type= variant.content_type, meta= meta)
+            decoded = WireFormat.decode(message)
+            backend_ms, _ = timed(lambda: backend_decode(decoded.image_bytes, decoded.content_type, decoded.meta, args.short_edge), args.repeat)
+            print(f"{size:<12}{name:<12}{len(message):>12}{app_ms:>10.2f}{backend_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
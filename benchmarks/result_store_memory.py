@@ -0,0 +1,83 @@
+"""
+Measure Redis memory per stored prediction result for the legacy layout and both result store encodings
+
+Only keys under a bench_ prefix are written and they are deleted afterwards, nothing else in the database is touched.
+
+Usage:
+    python -m benchmarks.result_store_memory --redis-url redis://localhost:6379/0 --results 100000
+"""
+import argparse
+import asyncio
+from benchmarks.service_path import use_service
+
+use_service("backend")
+
+import redis.asyncio as redis
+from utils.result_store import ResultStore
+
+# Results are written in pipelines of this many commands
+CHUNK_SIZE = 1000
+
+
+async def used_memory(client) -> int:
+    return (await client.info("memory"))["used_memory"]
+
+
+async def delete_prefix(client, prefix: str):
+    async for key in client.scan_iter(match= prefix + "*", count= 1000):
+        await client.unlink(key)
+
+
+async def write_legacy(client, prefix: str, count: int):
+    """
+    Layout before the result store: bare integer keys without TTL, the id repeated inside the hash
+    """
+    for start in range(1, count + 1, CHUNK_SIZE):
+        pipe = client.pipeline(transaction= False)
+        for image_id in range(start, min(start + CHUNK_SIZE, count + 1)):
+            pipe.hset(f"{prefix}{image_id}", mapping={"image_prediction_id": image_id, "status": "Done", "has_dog": "true"})
+        await pipe.execute()
+
+
+async def write_store(store: ResultStore, count: int):
+    for start in range(1, count + 1, CHUNK_SIZE):
+        pipe = store.redis_client.pipeline(transaction= False)
+        for image_id in range(start, min(start + CHUNK_SIZE, count + 1)):
+            store.write(pipe, image_id, status= "Done", has_dog= "true")
+        await pipe.execute()
+
+
+async def measure(client, name: str, prefix: str, write, count: int) -> float:
+    await delete_prefix(client, prefix)
+    before = await used_memory(client)
+    await write()
+    after = await used_memory(client)
+    await delete_prefix(client, prefix)
+
+    bytes_per_result = (after - before) / count
+    print(f"{name:<12}{bytes_per_result:>18.1f}")
+    return bytes_per_result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default= "redis://localhost:6379/0")
+    parser.add_argument("--results", type= int, default= 100000)
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url)
+    hash_store = ResultStore(redis_client= client, key_prefix= "bench_hash:", encoding= "hash")
+    bucketed_store = ResultStore(redis_client= client, key_prefix= "bench_bucketed:", encoding= "bucketed")
+
+    print(f"{'layout':<12}{'bytes per result':>18}")
+    try:
+        legacy = await measure(client, "legacy", "bench_legacy:", lambda: write_legacy(client, "bench_legacy:", args.results), args.results)
+        await measure(client, "hash", "bench_hash:", lambda: write_store(hash_store, args.results), args.results)
+        bucketed = await measure(client, "bucketed", "bench_bucketed:", lambda: write_store(bucketed_store, args.results), args.results)
+        print(f"bucketed encoding uses {bucketed / legacy:.1%} of the legacy memory per result")
+    finally:
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Compare latency, throughput and top-5 agreement of the PyTorch, ONNX Runtime and OpenVINO model runtimes
+
+Usage:
+    python -m benchmarks.runtime_benchmark --runtimes torch onnx openvino --batch-sizes 1 8 --iterations 20 [--int8]
+"""
+import argparse
+import time
+import numpy as np
+from benchmarks.service_path import use_service
+
+use_service("backend")
+
+from config import config
+from main import AiModel
+from utils.auto_model_download import Model
+
+
+def load_model(runtime: str, int8: bool):
+    """
+    Load the model for a runtime, exporting it on first use
+    """
+    config.MODEL['runtime'] = runtime
+    config.MODEL['int8'] = int8
+    return AiModel(model_path= config.MODEL['model_path']).get_model()
+
+
+def benchmark(model, images: list, batch_size: int, iterations: int) -> dict:
+    """
+    Time batched predict calls on the same images
+    """
+    batch = images[:batch_size]
+    predict_args = {"imgsz": config.MODEL_PARAMETERS['img_size'], "verbose": False}
+
+    # Warmup, the first calls pay lazy initialization
+    for _ in range(3):
+        model.predict(batch, **predict_args)
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        model.predict(batch, **predict_args)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies = np.array(latencies)
+    return {"p50_ms": np.percentile(latencies, 50), "p95_ms": np.percentile(latencies, 95),
+            "images_per_s": batch_size * 1000 / latencies.mean()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runtimes", nargs= "+", default= ["torch", "onnx", "openvino"])
+    parser.add_argument("--batch-sizes", nargs= "+", type= int, default= [1, 8])
+    parser.add_argument("--iterations", type= int, default= 20)
+    parser.add_argument("--int8", action= "store_true", help= "Benchmark INT8 quantized exports")
+    parser.add_argument("--seed", type= int, default= 0)
+    args = parser.parse_args()
+
+    Model.download_model(model_path= config.MODEL["model_path"], model_url= config.MODEL["model_url"], sha256= config.MODEL["sha256"])
+
+    # Random camera-sized images, every runtime sees the same ones
+    rng = np.random.default_rng(args.seed)
+    images = [rng.integers(0, 256, size= (480, 640, 3), dtype= np.uint8) for _ in range(max(args.batch_sizes))]
+
+    reference = load_model("torch", int8= False)
+    reference_predictions = reference.predict(images, imgsz= config.MODEL_PARAMETERS['img_size'], verbose= False)
+    tolerance = config.MODEL['top5_tolerance_int8'] if args.int8 else config.MODEL['top5_tolerance']
+
+    print(f"{'runtime':<16}{'batch':>6}{'p50 ms':>10}{'p95 ms':>10}{'img/s':>10}{'top-5 match':>14}")
+    for runtime in args.runtimes:
+        int8 = args.int8 and runtime != "torch"
+        model = reference if runtime == "torch" else load_model(runtime, int8= int8)
+
+        # Agreement with the PyTorch model on the benchmark images
+        predictions = model.predict(images, imgsz= config.MODEL_PARAMETERS['img_size'], verbose= False)
+        matches = sum(AiModel.top5_matches(ref, cand, tolerance) for ref, cand in zip(reference_predictions, predictions))
+
+        label = runtime + (" int8" if int8 else "")
+        for batch_size in args.batch_sizes:
+            result = benchmark(model, images, batch_size= batch_size, iterations= args.iterations)
+            print(f"{label:<16}{batch_size:>6}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['images_per_s']:>10.1f}"
+                  f"{f'{matches}/{len(images)}':>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import os
+import sys
+
+# Repository root, the services live in sibling directories
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_service(service: str) -> str:
+    """
+    Make the modules of a service importable the way the service imports them ("from config import config")
+
+    The services share module names, so a benchmark process can only use one of them.
+
+    :param service: "app" or "backend"
+    :return: Directory of the service
+    """
+    service_dir = os.path.join(ROOT_DIR, service)
+    sys.path.insert(0, service_dir)
+
+    # Relative paths in the service config (model and log files) resolve against the service directory
+    os.chdir(service_dir)
+    return service_dir
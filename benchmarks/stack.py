@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import shutil
+import socket
+import threading
+import subprocess
+import urllib.request
+from benchmarks.service_path import ROOT_DIR
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float, process: subprocess.Popen = None):
+    """
+    Poll an url until it answers, failing early if the process serving it died
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process serving {url} exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout= 1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+
+class Stack:
+    """
+    Local app -> redis -> backend stack for benchmarks
+
+    Redis is a local redis-server when one is installed, else an in-process fakeredis TCP server.
+    Both services run as uvicorn subprocesses from their own directories, as they do in their containers.
+
+    Parameters:
+        stub_model: Replace the YOLO model by a stub, to measure transport and serialization overhead alone
+        stub_latency_ms: Simulated inference time per batch of the stub model
+        env: Extra environment variables for both services, e.g. {"QUEUE_TRANSPORT": "stream"}
+    """
+    def __init__(self, stub_model: bool = True, stub_latency_ms: float = 0, env: dict = None):
+        self.stub_model = stub_model
+        self.stub_latency_ms = stub_latency_ms
+        self.env = env or {}
+        self.processes = []
+        self.fake_server = None
+
+        self.redis_port = free_port()
+        self.app_port = free_port()
+        self.backend_port = free_port()
+        self.app_url = f"http://127.0.0.1:{self.app_port}"
+        self.backend_url = f"http://127.0.0.1:{self.backend_port}"
+
+    def _start_redis(self):
+        redis_server = shutil.which("redis-server")
+        if redis_server:
+            process = subprocess.Popen([redis_server, "--port", str(self.redis_port), "--save", "", "--appendonly", "no"],
+                                       stdout= subprocess.DEVNULL)
+            self.processes.append(process)
+        else:
+            from fakeredis import TcpFakeServer
+            self.fake_server = TcpFakeServer(("127.0.0.1", self.redis_port), server_type= "redis")
+            # Connection threads must not keep the benchmark alive once it is done
+            self.fake_server.daemon_threads = True
+            threading.Thread(target= self.fake_server.serve_forever, daemon= True).start()
+
+        # Wait for redis to accept connections
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", self.redis_port), timeout= 1).close()
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def _start_service(self, service: str, module: str, port: int, extra_env: dict) -> subprocess.Popen:
+        env = {**os.environ, "REDIS_HOST": "127.0.0.1", "REDIS_PORT": str(self.redis_port), **self.env, **extra_env}
+        process = subprocess.Popen([sys.executable, "-m", "uvicorn", f"{module}:app", "--host", "127.0.0.1", "--port", str(port),
+                                    "--log-level", "warning"], cwd= os.path.join(ROOT_DIR, service), env= env)
+        self.processes.append(process)
+        return process
+
+    def start(self, timeout: float = 300):
+        """
+        Start redis, the backend and the app, and wait until they answer
+        """
+        self._start_redis()
+
+        backend_env = {"MODEL_RUNTIME": "stub", "STUB_MODEL_LATENCY_MS": str(self.stub_latency_ms)} if self.stub_model else {}
+        backend = self._start_service("backend", "main", self.backend_port, backend_env)
+        app = self._start_service("app", "app", self.app_port, {})
+
+        wait_until_up(self.backend_url + "/ready", timeout, backend)
+        wait_until_up(self.app_url + "/", timeout, app)
+        return self
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout= 10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.fake_server:
+            self.fake_server.shutdown()
+            self.fake_server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()